@@ -1,7 +1,9 @@
 # Importiamo 'db' per interrogare la collection delle posizioni
 from services.data_manager import db, get_session_data, save_stage_output
 from .cv_analyzer import analyze_cv
+from interviewer.llm_service import is_llm_failure, track_llm_session
 
+@track_llm_session
 def run_cv_analysis_pipeline(session_id: str) -> bool:
     """
     Esegue l'analisi del CV leggendo tutti i dati necessari (CV e JD) da MongoDB.
@@ -51,7 +53,7 @@ def run_cv_analysis_pipeline(session_id: str) -> bool:
     analysis_report = analyze_cv(cv_text=cv_text, job_description_text=jd_text, hr_special_needs="")
     
     # 4. Salva il risultato nel documento di sessione
-    if analysis_report and "Errore" not in analysis_report:
+    if analysis_report and not is_llm_failure(analysis_report):
         save_stage_output(session_id, "cv_analysis_report", analysis_report)
         save_stage_output(session_id, "cv_analysis_status", "Completed")
         print(f"  - Analisi CV completata e salvata per la sessione {session_id}.")
@@ -1,3 +1,4 @@
+import json
 from interviewer.llm_service import get_llm_response
 from . import prompts_final_eval
 
@@ -17,18 +18,27 @@ def evaluate_candidate_performance(
     all_cases_text: str, 
     evaluation_criteria_text: str, 
     seniority_level: str,
-    case_map_text: str
+    case_map_text: str,
+    step_evaluations: list | None = None
 ) -> str:
     """
     Genera un report di valutazione completo sulla performance del candidato.
+    Se sono disponibili le valutazioni dei singoli step (calcolate durante il colloquio),
+    il modello le aggrega invece di rileggere l'intera conversazione e tutti i casi.
     """
-    # Ora formattiamo i dati passati direttamente
-    conversation_text = _format_conversation(conversation_json_data)
+    if step_evaluations:
+        print(f"1. Creazione del prompt di sintesi da {len(step_evaluations)} valutazioni di step...")
+        prompt = prompts_final_eval.create_synthesis_prompt(
+            icp_text, json.dumps(step_evaluations, ensure_ascii=False), evaluation_criteria_text, seniority_level, case_map_text
+        )
+    else:
+        # Ora formattiamo i dati passati direttamente
+        conversation_text = _format_conversation(conversation_json_data)
 
-    print("1. Creazione del prompt per la valutazione finale...")
-    prompt = prompts_final_eval.create_final_evaluation_prompt(
-        icp_text, conversation_text, all_cases_text, evaluation_criteria_text, seniority_level, case_map_text
-    )
+        print("1. Creazione del prompt per la valutazione finale...")
+        prompt = prompts_final_eval.create_final_evaluation_prompt(
+            icp_text, conversation_text, all_cases_text, evaluation_criteria_text, seniority_level, case_map_text
+        )
     
     print(f"2. Invio della richiesta al modello '{EVALUATION_MODEL}' per la valutazione...")
     
@@ -37,7 +47,8 @@ def evaluate_candidate_performance(
         model=EVALUATION_MODEL,
         system_prompt=prompts_final_eval.SYSTEM_PROMPT,
         max_tokens=1500,
-        temperature=0.8
+        temperature=0.8,
+        call_site="corrector.final_evaluation"
     )
     
     print("3. Report di valutazione generato.")
@@ -50,4 +50,42 @@ o	Valutazione dei requisiti: inserisci in questa sezione come hai valutato (e su
 
 [LIVELLO DI SENIORITY]
 {seniority_level}
-"""
\ No newline at end of file
+"""
+
+def create_synthesis_prompt(icp_text: str, step_evaluations_text: str, evaluation_criteria_text: str, seniority_level: str, case_map_text: str) -> str:
+    """
+    Assembla il prompt per il report finale a partire dalle valutazioni già calcolate per ogni step.
+    """
+    return f"""
+Sei il presidente di una commissione deputata alla valutazione di candidati per un lavoro. I requisiti della posizione sono contenuti nell'ICP. Durante il colloquio, ogni reasoning step del Case è già stato valutato singolarmente dalla commissione: il tuo compito è sintetizzare queste valutazioni in un giudizio complessivo, senza rifare l'analisi dall'inizio.
+---
+**Istruzioni**
+o	Produci un report di valutazione seguendo la struttura riportata nella sezione **Struttura dell'output**.
+o	Mantieni un tono professionale, semplice. Non essere sempre accondiscendente, bensì critico quando necessario.
+o	Ricorda che non stiamo cercando il candidato "perfetto" ma il candidato giusto. Molte cose si possono apprendere.
+o	Usa la MAPPA DI VALUTAZIONE DEL CASO per collegare ogni competenza agli step progettati per testarla.
+o	Individua e valuta tutti i requisiti elencati negli schemi di valutazione, aggregando le evidenze dei diversi step. Non tralasciare nulla.
+o	Pondera la valutazione sul livello di seniority della posizione.
+o	Effettua una valutazione olistica: cogli l'andamento complessivo attraverso gli step (miglioramenti, cali, coerenza).
+---
+**Struttura dell'output**
+o	Sommario: una sintesi della valutazione, che imprima subito in mente i punti essenziali e l'andamento del test. Usa al massimo 250 token per il sommario.
+o	Valutazione dei requisiti: come hai valutato (e sulla base di quali evidenze) i requisiti indicati negli schemi di valutazione. Usa al massimo 1000 token. Questa sezione deve essere facile da leggere, rapida e schematica, sempre contenendo la valutazione di tutti i requisiti.
+---
+**Input per la Valutazione**
+
+[PROFILO CANDIDATO IDEALE (ICP)]
+{icp_text}
+
+[MAPPA DI VALUTAZIONE DEL CASO SVOLTO]
+{case_map_text}
+
+[VALUTAZIONI DEI SINGOLI STEP]
+{step_evaluations_text}
+
+[SCHEMA DEI CRITERI DI VALUTAZIONE GENERALI]
+{evaluation_criteria_text}
+
+[LIVELLO DI SENIORITY]
+{seniority_level}
+"""
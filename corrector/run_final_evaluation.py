@@ -2,7 +2,9 @@ import json
 from .final_evaluator.evaluator import evaluate_candidate_performance
 # Importiamo 'db' per interrogare la collection delle posizioni
 from services.data_manager import db, get_session_data, save_stage_output
+from interviewer.llm_service import is_llm_failure, track_llm_session
 
+@track_llm_session
 def execute_case_evaluation(session_id: str) -> bool:
     """
     Esegue la valutazione completa leggendo i dati dal documento di sessione MongoDB,
@@ -76,7 +78,18 @@ def execute_case_evaluation(session_id: str) -> bool:
         map_lines.append(f"- Step {step.get('id', 'N/A')} ({step.get('title', 'N/A')}): Progettato per testare '{skills}'.")
     case_map_text = "\n".join(map_lines)
 
-    # 4. Esegui la valutazione (logica invariata)
+    # 4. Usa le valutazioni per step calcolate durante il colloquio, solo se coprono tutti gli step svolti
+    step_evaluations = None
+    step_status = stages.get("step_evaluation_status") or {}
+    evaluated_steps = stages.get("step_evaluations") or {}
+    submitted = step_status.get("submitted", [])
+    if submitted and not step_status.get("failed") and all(str(step_id) in evaluated_steps for step_id in submitted):
+        step_evaluations = [evaluated_steps[str(step_id)] for step_id in submitted]
+        print(f"  - Trovate {len(step_evaluations)} valutazioni incrementali: il report ne farà la sintesi.")
+    elif submitted:
+        print("  - Valutazioni incrementali incomplete: eseguo la valutazione sull'intera conversazione.")
+
+    # 5. Esegui la valutazione
     print("  - Avvio della valutazione con l'LLM...")
     final_report = evaluate_candidate_performance(
         icp_text=icp_text,
@@ -84,11 +97,12 @@ def execute_case_evaluation(session_id: str) -> bool:
         all_cases_text=all_cases_text,
         evaluation_criteria_text=evaluation_criteria_text,
         seniority_level=seniority_level,
-        case_map_text=case_map_text
+        case_map_text=case_map_text,
+        step_evaluations=step_evaluations
     )
     
-    # 5. Salva l'output nel DB (logica invariata)
-    if final_report and "Errore" not in final_report:
+    # 6. Salva l'output nel DB (logica invariata)
+    if final_report and not is_llm_failure(final_report):
         save_stage_output(session_id, "case_evaluation_report", final_report)
         print(f"  - Valutazione del caso completata e salvata nel DB per la sessione {session_id}.")
         return True
@@ -0,0 +1,133 @@
+import json
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Literal
+from pydantic import BaseModel, Field
+from interviewer.llm_service import get_structured_llm_response
+from services.data_manager import save_stage_output
+from . import prompts_step_eval
+
+# --- 1. Definizione dello Schema Dati con Pydantic ---
+
+class SkillVerdict(BaseModel):
+    skill_name: str = Field(description="Nome della skill che lo step era progettato per testare.")
+    score: int = Field(description="Punteggio da 1 (assente) a 5 (eccellente).", ge=1, le=5)
+    evidence: str = Field(description="Evidenza concreta tratta dalle risposte del candidato.")
+
+class RequirementEvidence(BaseModel):
+    requirement: str = Field(description="Requisito degli schemi di valutazione.")
+    evidence: str = Field(description="Cosa emerge da questo step riguardo al requisito (anche se scarso o assente).")
+
+class StepEvaluation(BaseModel):
+    """Valutazione di un singolo reasoning step, calcolata appena il candidato lo conclude."""
+    outcome: Literal["soddisfatto", "parzialmente_soddisfatto", "non_soddisfatto"] = Field(description="Esito rispetto al criterio di completamento dello step.")
+    skill_verdicts: List[SkillVerdict] = Field(description="Un giudizio per ogni skill da testare nello step.")
+    requirements_evidence: List[RequirementEvidence] = Field(description="Evidenze per i requisiti rilevanti.")
+    summary: str = Field(description="Sintesi di 2-3 frasi della performance nello step.")
+
+# --- 2. Logica di Valutazione ---
+
+STEP_EVALUATION_MODEL = "gpt-4.1-2025-04-14"
+STEP_EVALUATIONS_STAGE = "step_evaluations"
+STEP_EVALUATION_STATUS_STAGE = "step_evaluation_status"
+
+# Le valutazioni girano in background mentre il colloquio prosegue
+_STEP_EVAL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="step-eval")
+
+
+def _relevant_requirements(step: dict, evaluation_criteria: dict) -> list[dict]:
+    """Requisiti che condividono almeno una parola significativa con le skill dello step (tutti, se nessuno)."""
+    requirements = evaluation_criteria.get("evaluation_schema", [])
+    skill_words = {
+        word for skill in step.get("skills_to_test", [])
+        for word in skill.get("skill_name", "").lower().replace("/", " ").split() if len(word) > 3
+    }
+    relevant = [r for r in requirements if any(word in r.get("requirement", "").lower() for word in skill_words)]
+    return relevant or requirements
+
+
+def _format_transcript(transcript: list[dict]) -> str:
+    return "\n\n".join(
+        f"[{'Candidato' if msg['role'] == 'user' else 'Intervistatore (Vertigo)'}]: {msg['content']}"
+        for msg in transcript
+    )
+
+
+def evaluate_step(step: dict, transcript: list[dict], evaluation_criteria: dict, seniority_level: str) -> StepEvaluation | None:
+    """Valuta un singolo step rispetto alle sue skill_to_test e ai requisiti pertinenti."""
+    skills = ", ".join(s.get("skill_name", "N/A") for s in step.get("skills_to_test", []))
+    step_text = (
+        f"Step {step.get('id')}: {step.get('title', 'N/D')}\n"
+        f"Descrizione: {step.get('description', 'N/D')}\n"
+        f"Criterio di completamento: {step.get('criteria', 'Nessun criterio specifico.')}\n"
+        f"Skill da testare: {skills}"
+    )
+    prompt = prompts_step_eval.create_step_evaluation_prompt(
+        step_text,
+        _format_transcript(transcript),
+        json.dumps(_relevant_requirements(step, evaluation_criteria), ensure_ascii=False),
+        seniority_level
+    )
+    structured_response_str = get_structured_llm_response(
+        prompt=prompt,
+        model=STEP_EVALUATION_MODEL,
+        system_prompt=prompts_step_eval.SYSTEM_PROMPT,
+        tool_name="save_step_evaluation",
+        tool_schema=StepEvaluation.model_json_schema(),
+        temperature=0.3,
+        call_site="corrector.step_evaluation"
+    )
+    if not structured_response_str:
+        print(f"Errore: valutazione dello step {step.get('id')} non disponibile.")
+        return None
+    try:
+        return StepEvaluation.model_validate_json(structured_response_str)
+    except Exception as e:
+        print(f"Errore durante la validazione della valutazione dello step {step.get('id')}: {e}")
+        return None
+
+
+class IncrementalStepEvaluator:
+    """
+    Valuta in background ogni step appena concluso e salva i risultati parziali nella sessione
+    (stages.step_evaluations), insieme allo stato delle valutazioni inviate.
+    """
+    def __init__(self, session_id: str, evaluation_criteria: dict | None, seniority_level: str):
+        self.session_id = session_id
+        self.evaluation_criteria = evaluation_criteria or {}
+        self.seniority_level = seniority_level
+        self._status = {"submitted": [], "completed": [], "failed": []}
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def submit(self, step: dict, transcript: list[dict]):
+        step_id = step.get("id")
+        with self._lock:
+            self._status["submitted"].append(step_id)
+        self._save_status()
+        # Il thread eredita la sessione corrente per la telemetria LLM
+        context = contextvars.copy_context()
+        self._futures.append(_STEP_EVAL_EXECUTOR.submit(context.run, self._run, step, transcript))
+
+    def _run(self, step: dict, transcript: list[dict]):
+        step_id = step.get("id")
+        evaluation = evaluate_step(step, transcript, self.evaluation_criteria, self.seniority_level)
+        if evaluation is not None:
+            result = {"step_id": step_id, "step_title": step.get("title"), **evaluation.model_dump()}
+            save_stage_output(self.session_id, f"{STEP_EVALUATIONS_STAGE}.{step_id}", result)
+        with self._lock:
+            self._status["completed" if evaluation is not None else "failed"].append(step_id)
+        self._save_status()
+
+    def _save_status(self):
+        # Salvataggio sotto lock: uno stato più vecchio non può sovrascriverne uno più recente
+        with self._lock:
+            status = {key: list(value) for key, value in self._status.items()}
+            save_stage_output(self.session_id, STEP_EVALUATION_STATUS_STAGE, status)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Attende le valutazioni ancora in corso. True se tutti gli step inviati sono stati valutati."""
+        wait(list(self._futures), timeout=timeout)
+        with self._lock:
+            return not self._status["failed"] and len(self._status["completed"]) == len(self._status["submitted"])
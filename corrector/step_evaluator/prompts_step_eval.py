@@ -0,0 +1,33 @@
+# corrector/step_evaluator/prompts_step_eval.py
+
+# System prompt per la valutazione del singolo step (stesso ruolo della valutazione finale)
+SYSTEM_PROMPT = """Sei un valutatore di talenti estremamente esperto e analitico, membro di una commissione d'esame. Il tuo giudizio è critico, equilibrato e sempre supportato da evidenze concrete tratte dalla conversazione."""
+
+def create_step_evaluation_prompt(step_text: str, transcript_text: str, requirements_text: str, seniority_level: str) -> str:
+    """
+    Assembla il prompt per valutare un singolo reasoning step appena concluso dal candidato.
+    """
+    return f"""
+Il candidato ha appena concluso uno dei reasoning step del Case erogato dal nostro Agente AI. Valuta SOLO questo step, basandoti esclusivamente sulla parte di conversazione riportata.
+---
+**Istruzioni**
+o	Per ciascuna skill che lo step era progettato per testare, assegna un punteggio da 1 (assente) a 5 (eccellente) e cita l'evidenza concreta tratta dalle risposte del candidato.
+o	Per ciascun requisito rilevante degli schemi di valutazione, indica cosa emerge da questo step (anche se l'evidenza è scarsa o assente).
+o	Indica se il criterio di completamento dello step è stato soddisfatto, parzialmente soddisfatto o non soddisfatto.
+o	Pondera il giudizio sul livello di seniority: non pretendere da una posizione junior / mid la profondità di un senior.
+o	Considera anche la forma: se il candidato è prolisso, poco dettagliato o confusionario.
+---
+**Input**
+
+[STEP DA VALUTARE]
+{step_text}
+
+[CONVERSAZIONE DELLO STEP]
+{transcript_text}
+
+[REQUISITI RILEVANTI E CRITERI DI VALUTAZIONE]
+{requirements_text}
+
+[LIVELLO DI SENIORITY]
+{seniority_level}
+"""
@@ -1,7 +1,7 @@
 # analyzer/case_guide_generator/guide_creator.py
 
 # Import del servizio LLM con percorso relativo robusto
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, is_llm_failure
 from . import prompts_guide
 
 # Definiamo il modello da usare per questo specifico task
@@ -23,10 +23,11 @@ def generate_case_guide(icp_text: str, seniority_level: str) -> str | None:
         model=GUIDE_MODEL,  
         system_prompt=prompts_guide.SYSTEM_PROMPT,
         temperature=0.2,
-        max_tokens=2000
+        max_tokens=2000,
+        call_site="preparation.case_guide"
     )
     
-    if "Errore" in case_guide:
+    if is_llm_failure(case_guide):
         print(f"  - [Agente Guida] Errore ricevuto dall'LLM: {case_guide}")
         return None
 
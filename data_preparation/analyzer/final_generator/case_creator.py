@@ -25,6 +25,7 @@ class ReasoningStep(BaseModel):
     description: str = Field(description="Descrizione dettagliata dello step o domanda da porre al candidato.")
     # vvv NUOVO CAMPO vvv
     skills_to_test: List[SkillToTest] = Field(description="Una lista di 1-3 skill che possono essere verificate in questo step.", max_items=3)
+    depends_on: List[int] = Field(default_factory=list, description="ID degli step che devono essere affrontati prima di questo (vuoto se lo step è indipendente). Lo step 0 non dipende da nessuno.")
 
 class CaseStructure(BaseModel):
     question_id: str = Field(description="ID univoco per il caso, es. 'case-pm-01'.")
@@ -49,7 +50,8 @@ def generate_final_cases(icp_text: str, guide_text: str, kb_summary: str, senior
     example_skill = SkillToTest(skill_name="Esempio Skill", testing_method="Esempio metodo di test")
     example_step = {
         "id": 0, "title": "Titolo Esempio Step", "description": "Descrizione Esempio Step",
-        "skills_to_test": [example_skill.model_dump()]
+        "skills_to_test": [example_skill.model_dump()],
+        "depends_on": []
     }
     example_case = {
         "question_id": "case-example-01", "question_title": "Titolo Esempio Caso",
@@ -72,7 +74,8 @@ def generate_final_cases(icp_text: str, guide_text: str, kb_summary: str, senior
         model=FINAL_MODEL,
         system_prompt=prompts_final.SYSTEM_PROMPT,
         tool_name="save_generated_cases",
-        tool_schema=CaseCollection.model_json_schema()
+        tool_schema=CaseCollection.model_json_schema(),
+        call_site="preparation.cases"
     )
 
     if not tool_call_args:
@@ -38,7 +38,8 @@ def generate_final_criteria(icp_text: str, cases_json_str: str, seniority_level:
         model=FINAL_MODEL,
         system_prompt=prompts_criteria.SYSTEM_PROMPT,
         tool_name="save_generated_criteria",
-        tool_schema=CriteriaCollection.model_json_schema()
+        tool_schema=CriteriaCollection.model_json_schema(),
+        call_site="preparation.accomplishment_criteria"
     )
 
     if not tool_call_args:
@@ -0,0 +1,78 @@
+from interviewer.llm_service import get_llm_responses_batch
+from interviewer.chatbot import SmartCaseStudyChatbot
+from interviewer import prompts
+
+# --- 1. Configurazione ---
+
+# Varianti generate per ogni messaggio: il chatbot ne sceglie una a caso per non ripetersi tra candidati
+PRECOMPUTED_VARIANTS = 2
+
+# --- 2. Logica di Generazione ---
+
+def _build_requests(case: dict, variants: int) -> tuple[list[dict], list[tuple[str, str | None]]]:
+    """Prepara le richieste per il messaggio di apertura e per ogni coppia (step attuale, step successivo)."""
+    steps = {step['id']: step for step in case['reasoning_steps']}
+    first_step = steps.get(0) or case['reasoning_steps'][0]
+    requests, slots = [], []
+
+    for variant in range(variants):
+        # Il seed rende distinte le richieste (altrimenti verrebbero accorpate in una sola chiamata)
+        requests.append({
+            "prompt": prompts.create_start_prompt(case['question_title'], case['question_text'], first_step['description']),
+            "model": SmartCaseStudyChatbot.INTERVIEWER_MODEL,
+            "system_prompt": prompts.SYSTEM_PROMPT,
+            "temperature": 0.7,
+            "seed": variant,
+            "call_site": "preparation.precomputed_opening",
+        })
+        slots.append(("opening", None))
+
+    for current_id, current_step in steps.items():
+        for next_id, next_step in steps.items():
+            # Lo step di apertura non è mai una destinazione
+            if next_id == current_id or next_id == first_step['id']:
+                continue
+            key = SmartCaseStudyChatbot.transition_key(current_id, next_id)
+            for variant in range(variants):
+                requests.append({
+                    "prompt": prompts.create_successful_transition_prompt(current_step['title'], next_step['title'], next_step['description']),
+                    "model": SmartCaseStudyChatbot.INTERVIEWER_MODEL,
+                    "system_prompt": prompts.SYSTEM_PROMPT,
+                    "seed": variant,
+                    "call_site": "preparation.precomputed_transition",
+                })
+                slots.append(("transitions", key))
+    return requests, slots
+
+
+def generate_case_messages(cases: list[dict], variants: int = PRECOMPUTED_VARIANTS) -> dict:
+    """
+    Genera in parallelo, per ogni caso, le varianti del messaggio di apertura e dei messaggi di
+    transizione dopo uno step completato con successo. Restituisce un dizionario indicizzato per
+    question_id: {"opening": [...], "transitions": {"<da>-><a>": [...]}}.
+    """
+    all_requests, all_slots = [], []
+    for case in cases:
+        requests, slots = _build_requests(case, variants)
+        all_requests.extend(requests)
+        all_slots.extend((case['question_id'], kind, key) for kind, key in slots)
+
+    print(f"1. Generazione di {len(all_requests)} messaggi precalcolati per {len(cases)} casi...")
+    responses = get_llm_responses_batch(all_requests)
+
+    messages = {case['question_id']: {"opening": [], "transitions": {}} for case in cases}
+    failures = 0
+    for (question_id, kind, key), response in zip(all_slots, responses):
+        if not response:
+            failures += 1
+            continue
+        if kind == "opening":
+            messages[question_id]["opening"].append(response)
+        else:
+            messages[question_id]["transitions"].setdefault(key, []).append(response)
+
+    # Le chiamate fallite non bloccano la pipeline: il chatbot genererà quei messaggi al volo
+    if failures:
+        print(f"Avviso: {failures} messaggi precalcolati non generati, verranno creati durante il colloquio.")
+    print("2. Messaggi precalcolati generati.")
+    return messages
@@ -1,7 +1,7 @@
 # analyzer/icp_generator/icp_creator.py
 
 # Import del servizio LLM, ora con un percorso relativo robusto
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, is_llm_failure
 from . import prompts_icp
 
 # Il modello da usare può essere definito qui o passato come argomento per maggiore flessibilità
@@ -39,10 +39,12 @@ def generate_and_extract_icp(job_description_text: str) -> str | None:
         model=ICP_MODEL,
         system_prompt=prompts_icp.SYSTEM_PROMPT,
         max_tokens=2500,
-        temperature=0.4 
+        temperature=0.4,
+        use_cache=True,
+        call_site="preparation.icp"
     )
     
-    if "Errore" in full_llm_output:
+    if is_llm_failure(full_llm_output):
         print(f"  - [Agente ICP] Errore ricevuto dall'LLM: {full_llm_output}")
         return None
 
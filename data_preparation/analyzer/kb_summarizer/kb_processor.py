@@ -2,7 +2,7 @@
 
 import os
 # Assicuriamoci che l'import del servizio LLM sia corretto per la nuova struttura
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, is_llm_failure
 from . import prompts_kb
 
 KB_MODEL = "gpt-4.1-2025-04-14" 
@@ -73,10 +73,11 @@ def summarize_knowledge_base(icp_text: str, kb_documents: list) -> str | None:
         model=KB_MODEL,
         system_prompt=prompts_kb.SYSTEM_PROMPT,
         temperature=0.2,
-        max_tokens=2000
+        max_tokens=2000,
+        call_site="preparation.kb_summary"
     )
     
-    if "Errore" in full_llm_output:
+    if is_llm_failure(full_llm_output):
         print(f"  - [Agente KB] Errore ricevuto dall'LLM: {full_llm_output}")
         return None
 
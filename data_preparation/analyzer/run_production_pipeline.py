@@ -13,6 +13,8 @@ from .case_guide_generator.guide_creator import generate_case_guide
 from .kb_summarizer.kb_processor import summarize_knowledge_base
 from .final_generator.case_creator import generate_final_cases
 from .final_generator.criteria_creator import generate_final_criteria
+from .final_generator.message_precomputer import generate_case_messages
+from feedback_generator.market_integration import build_market_snapshot
 from ..corrector.evaluation_criteria_generator.criteria_generator import generate_evaluation_criteria # Anche questo diventa relativo
 
 # Per accedere a 'services', dobbiamo risalire di due livelli
@@ -25,7 +27,7 @@ def run_full_generation_pipeline(position_id: str) -> bool:
     print(f"--- [PIPELINE 'PRODUCTION'] Avvio per la posizione: {position_id} ---")
 
     # --- STEP 0: RECUPERO DELLA JOB DESCRIPTION ---
-    print(f"\n[STEP 0/6] Recupero dati iniziali da MongoDB...")
+    print(f"\n[STEP 0/8] Recupero dati iniziali da MongoDB...")
     try:
         if db is None: raise ConnectionError("Connessione a MongoDB non disponibile.")
         positions_collection = db["positions_data"]
@@ -47,7 +49,7 @@ def run_full_generation_pipeline(position_id: str) -> bool:
         return False
 
     # --- STEP 1: GENERAZIONE ICP ---
-    print(f"\n[STEP 1/6] Generazione dell'Ideal Candidate Profile (ICP)...")
+    print(f"\n[STEP 1/8] Generazione dell'Ideal Candidate Profile (ICP)...")
     icp_text = generate_and_extract_icp(job_description_text=jd_text)
     if not icp_text:
         print("  - Fallimento nella generazione dell'ICP. Pipeline interrotta.")
@@ -56,7 +58,7 @@ def run_full_generation_pipeline(position_id: str) -> bool:
     print(f"  - ICP salvato con successo per '{position_id}'.")
 
     # --- STEP 2: GENERAZIONE GUIDA AL CASO ---
-    print(f"\n[STEP 2/6] Generazione della Guida alla Creazione dei Casi...")
+    print(f"\n[STEP 2/8] Generazione della Guida alla Creazione dei Casi...")
     seniority_level = "Mid-Level"
     case_guide_text = generate_case_guide(icp_text=icp_text, seniority_level=seniority_level)
     if not case_guide_text:
@@ -66,7 +68,7 @@ def run_full_generation_pipeline(position_id: str) -> bool:
     print(f"  - Guida salvata con successo per '{position_id}'.")
 
     # --- STEP 3: SINTESI KNOWLEDGE BASE ---
-    print(f"\n[STEP 3/6] Sintesi della Knowledge Base...")
+    print(f"\n[STEP 3/8] Sintesi della Knowledge Base...")
     kb_summary = summarize_knowledge_base(icp_text=icp_text, kb_documents=kb_docs)
     if not kb_summary:
         print("  - Fallimento nella sintesi della KB. Pipeline interrotta.")
@@ -75,7 +77,7 @@ def run_full_generation_pipeline(position_id: str) -> bool:
     print(f"  - Sintesi KB salvata con successo per '{position_id}'.")
     
     # --- STEP 4: GENERAZIONE DEI CASI ---
-    print(f"\n[STEP 4/6] Generazione finale dei casi strutturati...")
+    print(f"\n[STEP 4/8] Generazione finale dei casi strutturati...")
     case_collection = generate_final_cases(icp_text, case_guide_text, kb_summary, seniority_level)
     if not case_collection:
         print("  - Fallimento nella generazione dei Casi. Pipeline interrotta.")
@@ -84,7 +86,7 @@ def run_full_generation_pipeline(position_id: str) -> bool:
     print(f"  - Casi salvati con successo per '{position_id}'.")
 
     # --- STEP 5: GENERAZIONE DEI CRITERI PER IL CHATBOT ---
-    print(f"\n[STEP 5/6] Generazione dei criteri per il chatbot...")
+    print(f"\n[STEP 5/8] Generazione dei criteri per il chatbot...")
     cases_json_str = case_collection.model_dump_json()
     criteria_collection = generate_final_criteria(icp_text, cases_json_str, seniority_level)
     if not criteria_collection:
@@ -94,21 +96,59 @@ def run_full_generation_pipeline(position_id: str) -> bool:
     print(f"  - Criteri per il chatbot salvati con successo per '{position_id}'.")
 
     # --- STEP 6: GENERAZIONE DEI CRITERI DI VALUTAZIONE FINALE ---
-    print(f"\n[STEP 6/6] Generazione dei Criteri di ValUTazione Finale...")
+    print(f"\n[STEP 6/8] Generazione dei Criteri di ValUTazione Finale...")
     eval_criteria_collection = generate_evaluation_criteria(icp_text, cases_json_str, seniority_level)
     if not eval_criteria_collection:
         print("  - Fallimento nella generazione dei Criteri di Valutazione. Pipeline interrotta.")
         return False
     positions_collection.update_one({"_id": position_id}, {"$set": {"evaluation_criteria": eval_criteria_collection.model_dump()}})
     print(f"  - Criteri di valutazione finale salvati con successo per '{position_id}'.")
+
+    # --- STEP 7: MESSAGGI PRECALCOLATI PER IL CHATBOT ---
+    # Salvati in un campo separato: 'all_cases' finisce integralmente nel prompt di valutazione finale
+    print(f"\n[STEP 7/8] Generazione dei messaggi precalcolati del chatbot...")
+    case_messages = generate_case_messages(case_collection.model_dump()["cases"])
+    positions_collection.update_one({"_id": position_id}, {"$set": {"precomputed_case_messages": case_messages}})
+    print(f"  - Messaggi precalcolati salvati con successo per '{position_id}'.")
+
+    # --- STEP 8: SNAPSHOT DI MERCATO ---
+    # Lo screening del pool di benchmark dipende solo da JD e pool: si calcola una volta per posizione
+    print(f"\n[STEP 8/8] Calcolo dello snapshot di mercato...")
+    if not build_market_snapshot(position_id):
+        # Non blocca la pipeline: verrà ricalcolato al primo report di feedback
+        print("  - Avviso: snapshot di mercato non generato.")
     
     print("\n--- [PIPELINE 'PRODUCTION'] Tutti i dati per la posizione sono stati generati e salvati su MongoDB. ---")
     return True
 
+def run_message_precomputation(position_id: str) -> bool:
+    """
+    Genera solo i messaggi precalcolati del chatbot per una posizione già preparata
+    (utile per le posizioni create prima dell'introduzione dello STEP 7).
+    """
+    if db is None:
+        print("  - ERRORE: Connessione a MongoDB non disponibile.")
+        return False
+    positions_collection = db["positions_data"]
+    position_document = positions_collection.find_one({"_id": position_id}, {"all_cases": 1})
+    cases = (position_document or {}).get("all_cases", {}).get("cases", [])
+    if not cases:
+        print(f"  - ERRORE: Nessun caso trovato per '{position_id}'.")
+        return False
+    case_messages = generate_case_messages(cases)
+    positions_collection.update_one({"_id": position_id}, {"$set": {"precomputed_case_messages": case_messages}})
+    print(f"  - Messaggi precalcolati salvati con successo per '{position_id}'.")
+    return True
+
 # Questa parte serve per testare lo script da solo
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 2 and sys.argv[2] == "--solo-messaggi":
+        run_message_precomputation(sys.argv[1])
+    elif len(sys.argv) > 2 and sys.argv[2] == "--solo-mercato":
+        # Da rilanciare quando cambia la JD o il pool di benchmark
+        build_market_snapshot(sys.argv[1])
+    elif len(sys.argv) > 1:
         test_position_id = sys.argv[1]
         run_full_generation_pipeline(test_position_id)
     else:
-        print("Uso: python -m data_preparation.analyzer.run_production_pipeline \"<position_id_da_mongodb>\"")
\ No newline at end of file
+        print("Uso: python -m data_preparation.analyzer.run_production_pipeline \"<position_id_da_mongodb>\" [--solo-messaggi | --solo-mercato]")
\ No newline at end of file
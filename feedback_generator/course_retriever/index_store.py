@@ -0,0 +1,253 @@
+# feedback_generator/course_retriever/index_store.py
+# Scopo: Indice FAISS dei corsi persistito su disco e aggiornato in modo incrementale.
+#        Ogni corso ha un ID FAISS stabile (IndexIDMap) e un hash del contenuto: all'avvio
+#        vengono ricalcolati solo gli embedding dei corsi nuovi o modificati, quelli rimossi
+#        escono dall'indice con remove_ids. Se il catalogo non è cambiato l'avvio è un semplice
+#        caricamento da disco (embedding in memory-map).
+#        Ogni salvataggio scrive una nuova versione in una sottocartella e poi sostituisce in modo
+#        atomico il puntatore CURRENT: chi carica vede sempre manifest, embedding e indice coerenti.
+
+import os
+import json
+import math
+import shutil
+import hashlib
+import tempfile
+
+import faiss
+import numpy as np
+
+# --- CONFIGURAZIONE ---
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join("data", "rag_index"))
+# File con il nome della sottocartella della versione corrente
+CURRENT_POINTER_FILE = "CURRENT"
+VERSION_DIR_PREFIX = "v-"
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "course_embeddings.npy"
+INDEX_FILE = "course_index.faiss"
+# Tipo di indice FAISS: "flat" (ricerca esatta), "ivf", "hnsw" o "auto" (flat fino a AUTO_ANN_THRESHOLD corsi, poi hnsw)
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto")
+AUTO_ANN_THRESHOLD = 20000
+HNSW_M = 32
+HNSW_EF_SEARCH = 128
+IVF_NPROBE = 16
+# Sotto questa soglia di corsi l'IVF non si addestra (minimo consigliato da FAISS per lista): si usa flat
+IVF_MIN_TRAINING_VECTORS = 39
+# Oltre questa quota di righe orfane (corsi rimossi o modificati) la matrice degli embedding viene compattata
+MAX_ORPHAN_RATIO = 0.5
+
+
+def course_key(course: dict) -> str:
+    return str(course.get("_id"))
+
+
+def course_text(course: dict) -> str:
+    """Testo su cui si calcola l'embedding del corso."""
+    return f"{course.get('Course Name', '')}. {course.get('Description', '')}"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def catalogue_fingerprint(model_name: str, hashes: dict) -> str:
+    """Impronta del catalogo: modello di embedding + coppie (corso, hash del contenuto) ordinate."""
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    for key in sorted(hashes):
+        digest.update(f"\n{key}:{hashes[key]}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PersistentCourseIndex:
+    """
+    Mantiene su disco (RAG_INDEX_DIR) il manifest {corso: id FAISS, hash}, la matrice degli
+    embedding (riga = id FAISS) e l'indice FAISS. sync() lo allinea al catalogo corrente.
+    """
+    def __init__(self, model, model_name: str, index_dir: str = RAG_INDEX_DIR, index_type: str = RAG_INDEX_TYPE):
+        self.model = model
+        self.model_name = model_name
+        self.index_dir = index_dir
+        self.requested_index_type = index_type
+        self.index_type = None
+        self.index = None
+        self.embeddings = None
+        # course_key -> {"id": id FAISS, "hash": hash del contenuto}
+        self.documents = {}
+        # Impronta del catalogo indicizzato (valorizzata da sync)
+        self.fingerprint = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _current_version_dir(self) -> str | None:
+        try:
+            with open(self._path(CURRENT_POINTER_FILE), "r", encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return self._path(version) if version else None
+
+    def _resolve_index_type(self, n_courses: int) -> str:
+        if self.requested_index_type == "ivf":
+            return "ivf" if n_courses >= IVF_MIN_TRAINING_VECTORS else "flat"
+        if self.requested_index_type in ("flat", "hnsw"):
+            return self.requested_index_type
+        return "hnsw" if n_courses > AUTO_ANN_THRESHOLD else "flat"
+
+    def _new_index(self, index_type: str, vectors: np.ndarray):
+        """Crea l'indice (vuoto) del tipo richiesto; l'IVF viene addestrato sui vettori del catalogo."""
+        dim = vectors.shape[1]
+        if index_type == "hnsw":
+            base = faiss.IndexHNSWFlat(dim, HNSW_M)
+            base.hnsw.efSearch = HNSW_EF_SEARCH
+        elif index_type == "ivf":
+            # Circa 4*sqrt(N) liste, con almeno IVF_MIN_TRAINING_VECTORS vettori per lista in addestramento
+            nlist = max(1, min(int(4 * math.sqrt(len(vectors))), len(vectors) // IVF_MIN_TRAINING_VECTORS))
+            base = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+            base.train(np.ascontiguousarray(vectors, dtype=np.float32))
+            base.nprobe = min(IVF_NPROBE, nlist)
+        else:
+            if self.requested_index_type == "ivf":
+                print("  - Troppi pochi corsi per un indice IVF: uso la ricerca esatta.")
+            base = faiss.IndexFlatL2(dim)
+        self.index_type = index_type
+        return faiss.IndexIDMap(base)
+
+    def search_parameters(self, selector=None):
+        """Parametri di ricerca coerenti col tipo di indice (necessari per filtrare con un IDSelector)."""
+        if self.index_type == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=HNSW_EF_SEARCH)
+        if self.index_type == "ivf":
+            return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(self.index).nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+    def _load(self) -> dict | None:
+        # Un secondo tentativo se la versione letta viene sostituita ed eliminata da un altro processo durante la lettura
+        for _ in range(2):
+            version_dir = self._current_version_dir()
+            if version_dir is None:
+                return None
+            manifest = self._load_version(version_dir)
+            if manifest is not None or self._current_version_dir() == version_dir:
+                return manifest
+        return None
+
+    def _load_version(self, version_dir: str) -> dict | None:
+        try:
+            with open(os.path.join(version_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("model") != self.model_name:
+                print("  - Indice su disco creato con un altro modello di embedding: verrà ricostruito.")
+                return None
+            # Memory-map: le righe vengono lette dal disco solo quando servono
+            embeddings = np.load(os.path.join(version_dir, EMBEDDINGS_FILE), mmap_mode="r")
+            index = faiss.read_index(os.path.join(version_dir, INDEX_FILE))
+            documents = manifest["documents"]
+            # Controllo di coerenza: l'indice contiene esattamente i corsi del manifest
+            max_id = max((d["id"] for d in documents.values()), default=-1)
+            if index.ntotal != len(documents) or max_id >= len(embeddings):
+                raise ValueError(f"indice ({index.ntotal} vettori) incoerente con il manifest ({len(documents)} corsi)")
+            self.embeddings, self.index, self.documents = embeddings, index, documents
+            self.index_type = manifest.get("index_type", "flat")
+            return manifest
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"  - Avviso: indice su disco non leggibile ({e}): verrà ricostruito.")
+            return None
+
+    def _save(self, fingerprint: str):
+        os.makedirs(self.index_dir, exist_ok=True)
+        # La matrice in memory-map va copiata in RAM: la versione da cui è mappata verrà eliminata
+        if isinstance(self.embeddings, np.memmap):
+            self.embeddings = np.array(self.embeddings)
+        # Nuova versione in una cartella dal nome univoco: worker concorrenti non si sovrascrivono i file
+        version_dir = tempfile.mkdtemp(prefix=VERSION_DIR_PREFIX, dir=self.index_dir)
+        np.save(os.path.join(version_dir, EMBEDDINGS_FILE), np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        faiss.write_index(self.index, os.path.join(version_dir, INDEX_FILE))
+        with open(os.path.join(version_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "index_type": self.index_type, "fingerprint": fingerprint, "documents": self.documents}, f)
+
+        # Un'unica sostituzione atomica del puntatore pubblica la versione completa
+        fd, tmp_pointer = tempfile.mkstemp(dir=self.index_dir, prefix=CURRENT_POINTER_FILE + ".")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(version_dir))
+        previous_dir = self._current_version_dir()
+        os.replace(tmp_pointer, self._path(CURRENT_POINTER_FILE))
+        # Le versioni superate si eliminano (su Linux chi le ha già in memory-map continua a leggerle)
+        if previous_dir and os.path.abspath(previous_dir) != os.path.abspath(version_dir):
+            shutil.rmtree(previous_dir, ignore_errors=True)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, convert_to_tensor=False), dtype=np.float32)
+
+    def _rebuild(self, courses_by_key: dict, hashes: dict, reusable: dict):
+        """Ricostruisce matrice e indice con ID compatti, riusando gli embedding ancora validi."""
+        keys = list(courses_by_key)
+        to_encode = [k for k in keys if k not in reusable]
+        print(f"  - Ricostruzione dell'indice: {len(keys) - len(to_encode)} embedding riusati, {len(to_encode)} da calcolare...")
+        new_vectors = dict(zip(to_encode, self._encode([course_text(courses_by_key[k]) for k in to_encode]))) if to_encode else {}
+        rows = [reusable[k] if k in reusable else new_vectors[k] for k in keys]
+        dim = self.model.get_sentence_embedding_dimension() if not rows else len(rows[0])
+        self.embeddings = np.vstack(rows).astype(np.float32) if rows else np.zeros((0, dim), dtype=np.float32)
+        self.documents = {k: {"id": i, "hash": hashes[k]} for i, k in enumerate(keys)}
+        self.index = self._new_index(self._resolve_index_type(len(keys)), self.embeddings)
+        if keys:
+            self.index.add_with_ids(self.embeddings, np.arange(len(keys), dtype=np.int64))
+
+    def sync(self, courses: list[dict]) -> dict:
+        """
+        Allinea l'indice al catalogo e restituisce la mappa id FAISS -> corso.
+        Ricalcola solo gli embedding dei corsi nuovi o modificati.
+        """
+        courses_by_key = {course_key(c): c for c in courses}
+        hashes = {k: content_hash(course_text(c)) for k, c in courses_by_key.items()}
+        fingerprint = catalogue_fingerprint(self.model_name, hashes)
+
+        manifest = self._load()
+        if (manifest and manifest.get("fingerprint") == fingerprint
+                and self.index_type == self._resolve_index_type(len(courses_by_key))):
+            print(f"  - Indice FAISS caricato da disco ({self.index.ntotal} corsi, catalogo invariato).")
+        elif manifest is None:
+            self._rebuild(courses_by_key, hashes, reusable={})
+            self._save(fingerprint)
+        else:
+            added = [k for k in courses_by_key if k not in self.documents]
+            changed = [k for k in courses_by_key if k in self.documents and self.documents[k]["hash"] != hashes[k]]
+            removed = [k for k in self.documents if k not in courses_by_key]
+            print(f"  - Catalogo cambiato: {len(added)} corsi nuovi, {len(changed)} modificati, {len(removed)} rimossi.")
+
+            orphans = len(self.embeddings) - len(self.documents) + len(changed) + len(removed)
+            # HNSW non supporta remove_ids e su IndexIDMap(IVF) remove_ids disallinea la mappa degli ID dalle liste
+            # invertite (la ricerca restituirebbe corsi sbagliati): con corsi modificati o rimossi si ricostruisce.
+            # Anche un cambio di tipo (es. catalogo cresciuto oltre la soglia) richiede un nuovo indice
+            needs_rebuild = (
+                (len(self.embeddings) and orphans / len(self.embeddings) > MAX_ORPHAN_RATIO)
+                or (self.index_type in ("hnsw", "ivf") and (changed or removed))
+                or self.index_type != self._resolve_index_type(len(courses_by_key))
+            )
+            if needs_rebuild:
+                reusable = {k: np.array(self.embeddings[d["id"]]) for k, d in self.documents.items()
+                            if k in courses_by_key and k not in changed}
+                self._rebuild(courses_by_key, hashes, reusable)
+            else:
+                stale_ids = [self.documents[k]["id"] for k in changed + removed]
+                if stale_ids:
+                    self.index.remove_ids(np.array(stale_ids, dtype=np.int64))
+                for k in removed:
+                    del self.documents[k]
+                to_encode = changed + added
+                if to_encode:
+                    vectors = self._encode([course_text(courses_by_key[k]) for k in to_encode])
+                    # I corsi modificati ricevono un nuovo ID: la loro vecchia riga resta orfana fino alla compattazione
+                    first_id = len(self.embeddings)
+                    new_ids = np.arange(first_id, first_id + len(to_encode), dtype=np.int64)
+                    self.embeddings = np.vstack([np.asarray(self.embeddings), vectors]).astype(np.float32)
+                    self.index.add_with_ids(vectors, new_ids)
+                    for k, new_id in zip(to_encode, new_ids):
+                        self.documents[k] = {"id": int(new_id), "hash": hashes[k]}
+            self._save(fingerprint)
+            print(f"  - Indice FAISS aggiornato e salvato ({self.index.ntotal} corsi).")
+
+        self.fingerprint = fingerprint
+        return {d["id"]: courses_by_key[k] for k, d in self.documents.items()}
@@ -0,0 +1,65 @@
+# feedback_generator/course_retriever/lexical_index.py
+# Scopo: Indice lessicale BM25 su nome e descrizione dei corsi, da fondere con la ricerca densa.
+#        I pesi BM25 di ogni coppia (termine, corso) sono precalcolati: una query costa solo la somma
+#        delle posting list dei suoi termini, anche su cataloghi da centinaia di migliaia di corsi.
+
+import re
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# --- CONFIGURAZIONE ---
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Parole troppo frequenti per distinguere un corso dall'altro (italiano e inglese)
+STOPWORDS = {
+    "di", "a", "da", "in", "con", "su", "per", "tra", "fra", "il", "lo", "la", "i", "gli", "le", "un", "una", "uno",
+    "e", "ed", "o", "del", "della", "dei", "delle", "al", "alla", "ai", "alle", "nel", "nella", "che", "come",
+    "the", "of", "and", "to", "for", "in", "on", "with", "an", "a", "or", "by", "from", "is", "are", "this", "you", "your",
+}
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_PATTERN.findall((text or "").lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    """Indice BM25 con ID esterni arbitrari (gli stessi ID FAISS dei corsi)."""
+    def __init__(self, documents: dict[int, str], k1: float = BM25_K1, b: float = BM25_B):
+        self.doc_ids = np.array(list(documents), dtype=np.int64)
+        tokenized = [tokenize(text) for text in documents.values()]
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+
+        postings = defaultdict(lambda: ([], []))
+        for position, tokens in enumerate(tokenized):
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(position)
+                postings[term][1].append(tf)
+
+        n_docs = len(tokenized)
+        # term -> (posizioni dei documenti, peso BM25 già comprensivo di idf e normalizzazione per lunghezza)
+        self.postings = {}
+        for term, (positions, tfs) in postings.items():
+            positions = np.array(positions, dtype=np.int64)
+            tfs = np.array(tfs, dtype=np.float32)
+            idf = math.log(1 + (n_docs - len(positions) + 0.5) / (len(positions) + 0.5))
+            norm = k1 * (1 - b + b * lengths[positions] / avg_length)
+            self.postings[term] = (positions, (idf * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32))
+
+    def search(self, query: str, k: int, allowed_ids: set | None = None) -> list[int]:
+        """ID dei k documenti con punteggio BM25 più alto (solo quelli con almeno un termine in comune)."""
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                positions, weights = self.postings[term]
+                scores[positions] += weights
+        candidates = np.flatnonzero(scores > 0)
+        if allowed_ids is not None:
+            candidates = candidates[np.isin(self.doc_ids[candidates], list(allowed_ids))]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return self.doc_ids[ranked].tolist()
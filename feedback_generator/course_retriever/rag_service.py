@@ -1,29 +1,90 @@
-import faiss
+import os
+import re
 import numpy as np
+import faiss
 import streamlit as st 
-from sentence_transformers import SentenceTransformer
 # Importiamo l'oggetto 'db' dal nostro servizio dati centralizzato
 from services.data_manager import db
+from services.model_registry import get_sentence_transformer
+from .index_store import PersistentCourseIndex, course_key, course_text
+from .lexical_index import BM25Index
+from .semantic_cache import CourseSemanticCache, make_cache_scope
 
 # --- Configurazione ---
 # Il modello di embedding rimane lo stesso, locale e performante
 EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
 # Il nome della collection da cui leggere i corsi su MongoDB
 COURSES_COLLECTION_NAME = "courses"
+# Campi del catalogo usati per il pre-filtro (livello e durata in ore)
+COURSE_LEVEL_FIELD = os.getenv("COURSE_LEVEL_FIELD", "Level")
+COURSE_HOURS_FIELD = os.getenv("COURSE_HOURS_FIELD", "Duration")
+COURSE_URL_FIELD = os.getenv("COURSE_URL_FIELD", "URL")
+# Ricerca ibrida: candidati per ciascuna lista (densa e BM25) = k * HYBRID_CANDIDATES_FACTOR, fusi con Reciprocal Rank Fusion
+HYBRID_CANDIDATES_FACTOR = 4
+RRF_K = 60
+_HOURS_PATTERN = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def _parse_hours(value) -> float | None:
+    """Durata in ore da valori come 12, "12.5", "12 ore" o "10-12 hours" (si prende il primo numero)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _HOURS_PATTERN.search(str(value or ""))
+    return float(match.group().replace(",", ".")) if match else None
+
+
+def _matches_filters(course: dict, filters: dict) -> bool:
+    """I corsi senza il campo richiesto non vengono esclusi: il catalogo non è sempre completo."""
+    levels = filters.get("levels")
+    if levels:
+        level = str(course.get(COURSE_LEVEL_FIELD) or "").strip().lower()
+        if level and level not in {l.lower() for l in levels}:
+            return False
+    max_hours = filters.get("max_hours")
+    if max_hours:
+        hours = _parse_hours(course.get(COURSE_HOURS_FIELD))
+        if hours is not None and hours > max_hours:
+            return False
+    return True
+
+
+def course_details(course: dict) -> dict:
+    """Dettagli del corso mostrati nel report, letti dal catalogo (non generati dal modello)."""
+    hours = _parse_hours(course.get(COURSE_HOURS_FIELD))
+    return {
+        "course_name": str(course.get("Course Name") or ""),
+        "description": str(course.get("Description") or ""),
+        "level": str(course.get(COURSE_LEVEL_FIELD) or "n/d"),
+        "duration_hours": round(hours) if hours is not None else 0,
+        "url": str(course.get(COURSE_URL_FIELD) or ""),
+    }
+
+
+def _reciprocal_rank_fusion(rankings: list[list[int]], k: int) -> list[int]:
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
 
 class RAGService:
     """
     Un servizio per la ricerca semantica (RAG) che carica i dati dei corsi da MongoDB,
-    crea un indice vettoriale in memoria con FAISS e permette di cercare corsi simili.
+    mantiene un indice vettoriale FAISS persistito su disco e un indice BM25 su nome e descrizione,
+    e restituisce i corsi più pertinenti fondendo le due classifiche.
     """
-    # La logica interna della classe rimane la stessa, cambiamo solo da dove carica i dati.
     def __init__(self):
         print("Inizializzazione del RAG Service...")
-        self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        self.model = get_sentence_transformer(EMBEDDING_MODEL_NAME)
         # --- MODIFICA CHIAVE: Carichiamo i dati da MongoDB ---
         self.courses_data = self._load_courses_from_mongo()
-        # Il resto del processo di indicizzazione rimane invariato
+        # L'indice è su disco: si ricalcolano solo gli embedding dei corsi nuovi o modificati
+        self.index_store = PersistentCourseIndex(self.model, EMBEDDING_MODEL_NAME)
         self.index, self.course_map = self._build_index()
+        self.lexical_index = BM25Index({i: course_text(c) for i, c in self.course_map.items()}) if self.course_map else None
+        self.courses_by_key = {course_key(c): c for c in (self.course_map or {}).values()}
+        # Famiglie di gap già viste -> query raffinata e corsi, valide finché il catalogo indicizzato non cambia
+        self.semantic_cache = CourseSemanticCache(self.model)
         print("RAG Service inizializzato con successo.")
 
     def _load_courses_from_mongo(self) -> list:
@@ -52,27 +113,71 @@ class RAGService:
             return []
 
     def _build_index(self):
-        """Costruisce l'indice FAISS in memoria. Questa funzione non cambia."""
+        """Allinea l'indice FAISS persistito al catalogo corrente (id FAISS -> corso)."""
         if not self.courses_data:
             return None, None
-        descriptions = [f"{course.get('Course Name', '')}. {course.get('Description', '')}" for course in self.courses_data]
-        print(f"  - Creazione embeddings per {len(descriptions)} corsi...")
-        embeddings = self.model.encode(descriptions, convert_to_tensor=False)
-        d = embeddings.shape[1]
-        index = faiss.IndexFlatL2(d)
-        index.add(np.array(embeddings, dtype=np.float32))
-        course_map = {i: course for i, course in enumerate(self.courses_data)}
-        print("  - Indice FAISS costruito in memoria.")
-        return index, course_map
-
-    def search(self, query: str, k: int = 8) -> list:
-        """Esegue una ricerca di similarità sull'indice FAISS. Questa funzione non cambia."""
+        course_map = self.index_store.sync(self.courses_data)
+        return self.index_store.index, course_map
+
+    def cache_scope(self, **search_params) -> str:
+        """Scope della cache semantica per il catalogo corrente e i parametri di ricerca indicati."""
+        return make_cache_scope(self.index_store.fingerprint, **search_params)
+
+    def courses_for_keys(self, keys: list[str]) -> list:
+        """Corsi del catalogo corrente per chiave (quelle non più presenti vengono ignorate)."""
+        return [self.courses_by_key[k] for k in keys if k in self.courses_by_key]
+
+    def _allowed_ids(self, filters: dict | None) -> set | None:
+        if not filters or not (filters.get("levels") or filters.get("max_hours")):
+            return None
+        return {i for i, course in self.course_map.items() if _matches_filters(course, filters)}
+
+    def _dense_search(self, query_embeddings: np.ndarray, n: int, allowed_ids: set | None) -> np.ndarray:
+        if allowed_ids is None:
+            return self.index.search(query_embeddings, n)[1]
+        try:
+            # Il filtro viene applicato dentro FAISS durante la ricerca (flat, IVF e HNSW)
+            selector = faiss.IDSelectorBatch(np.fromiter(allowed_ids, dtype=np.int64))
+            return self.index.search(query_embeddings, n, params=self.index_store.search_parameters(selector))[1]
+        except Exception as e:
+            print(f"  - Avviso: filtro FAISS non disponibile ({e}), filtro i risultati a valle.")
+            indices = self.index.search(query_embeddings, min(n * HYBRID_CANDIDATES_FACTOR, self.index.ntotal))[1]
+            rows = []
+            for row in indices:
+                kept = [i for i in row if i in allowed_ids][:n]
+                rows.append(kept + [-1] * (n - len(kept)))
+            return np.array(rows, dtype=np.int64)
+
+    def search(self, query: str, k: int = 8, filters: dict | None = None) -> list:
+        """Ricerca ibrida (densa + BM25) di un'unica query; vedi search_many."""
+        return self.search_many([query], k=k, filters=filters)[0]
+
+    def search_many(self, queries: list[str], k: int = 8, filters: dict | None = None) -> list[list]:
+        """
+        Ricerca ibrida per più query insieme: un solo encode in batch e una sola index.search
+        sulla matrice delle query, più la ricerca BM25 di ciascuna query; le due classifiche
+        sono fuse con Reciprocal Rank Fusion. filters ({"levels": [...], "max_hours": float})
+        restringe i candidati prima della ricerca; se nessun corso li soddisfa si cerca senza filtri.
+        """
         if not self.index:
             print("Ricerca saltata: l'indice FAISS non è stato inizializzato.")
+            return [[] for _ in queries]
+        if not queries:
             return []
-        query_embedding = self.model.encode([query])
-        distances, indices = self.index.search(np.array(query_embedding, dtype=np.float32), k)
-        results = [self.course_map[i] for i in indices[0]]
+        allowed_ids = self._allowed_ids(filters)
+        if allowed_ids is not None and not allowed_ids:
+            print("  - Nessun corso soddisfa i filtri di catalogo: ricerca senza filtri.")
+            allowed_ids = None
+        n_candidates = k * HYBRID_CANDIDATES_FACTOR
+        query_embeddings = np.array(self.model.encode(queries, convert_to_tensor=False), dtype=np.float32)
+        dense_rankings = self._dense_search(query_embeddings, n_candidates, allowed_ids)
+
+        results = []
+        for query, dense_row in zip(queries, dense_rankings):
+            # FAISS restituisce -1 quando i corsi candidati sono meno di n_candidates
+            dense_ids = [int(i) for i in dense_row if i != -1]
+            lexical_ids = self.lexical_index.search(query, n_candidates, allowed_ids)
+            results.append([self.course_map[i] for i in _reciprocal_rank_fusion([dense_ids, lexical_ids], k)])
         return results
 
 @st.cache_resource
@@ -0,0 +1,128 @@
+# feedback_generator/course_retriever/semantic_cache.py
+# Scopo: Cache semantica famiglia di gap -> (query raffinata, corsi recuperati). Le stesse famiglie
+#        di gap ricorrono tra i candidati di una posizione: se una famiglia è quasi identica
+#        (similarità del coseno sopra soglia) a una già vista, si riusano query e corsi senza
+#        chiamare l'LLM di raffinamento né rifare la ricerca. Le voci valgono solo per lo "scope"
+#        con cui sono state salvate (impronta del catalogo + parametri di ricerca): se il catalogo
+#        cambia, le voci precedenti vengono ignorate ed eliminate.
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+# --- CONFIGURAZIONE ---
+COURSE_CACHE_PATH = os.getenv("COURSE_CACHE_PATH", os.path.join("data", "cache", "course_semantic_cache.sqlite3"))
+COURSE_CACHE_SIMILARITY = float(os.getenv("COURSE_CACHE_SIMILARITY", "0.92"))
+COURSE_CACHE_MAX_ENTRIES = int(os.getenv("COURSE_CACHE_MAX_ENTRIES", "5000"))
+
+
+def gap_family_text(skill_family_gap: str, skill_gaps: list[str]) -> str:
+    """Testo della famiglia di gap su cui si calcola l'embedding della chiave di cache."""
+    return f"{skill_family_gap}: {'; '.join(skill_gaps)}"
+
+
+def make_cache_scope(index_fingerprint: str, **search_params) -> str:
+    """Scope delle voci: impronta dell'indice dei corsi + parametri che cambiano i risultati (k, filtri, modello)."""
+    payload = json.dumps({"index": index_fingerprint, "params": search_params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CourseSemanticCache:
+    """
+    Cache su file SQLite (condivisa tra i processi worker, come la cache delle risposte LLM).
+    Gli embedding sono salvati come float32 normalizzati: la similarità è un prodotto scalare.
+    """
+    def __init__(self, model, path: str = COURSE_CACHE_PATH, threshold: float = COURSE_CACHE_SIMILARITY, max_entries: int = COURSE_CACHE_MAX_ENTRIES):
+        self.model = model
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS course_cache ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT NOT NULL, family_text TEXT NOT NULL, "
+                "embedding BLOB NOT NULL, query TEXT NOT NULL, course_keys TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_course_cache_scope ON course_cache(scope)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def embed(self, family_texts: list[str]) -> np.ndarray:
+        embeddings = np.asarray(self.model.encode(family_texts, convert_to_tensor=False), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def lookup_many(self, scope: str, embeddings: np.ndarray) -> list[dict | None]:
+        """Per ogni embedding, la voce più simile dello scope ({"query", "course_keys", "similarity"}) o None."""
+        results = [None] * len(embeddings)
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                rows = conn.execute("SELECT id, embedding, query, course_keys FROM course_cache WHERE scope = ?", (scope,)).fetchall()
+                if rows and len(embeddings):
+                    matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                    similarities = embeddings @ matrix.T
+                    best = similarities.argmax(axis=1)
+                    now = time.time()
+                    for position, row_index in enumerate(best):
+                        similarity = float(similarities[position, row_index])
+                        if similarity >= self.threshold:
+                            row = rows[row_index]
+                            results[position] = {"query": row[2], "course_keys": json.loads(row[3]), "similarity": round(similarity, 4)}
+                            conn.execute("UPDATE course_cache SET last_access = ? WHERE id = ?", (now, row[0]))
+                    conn.commit()
+        except sqlite3.Error as e:
+            print(f"Avviso: lettura dalla cache semantica dei corsi fallita: {e}")
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def store_many(self, scope: str, family_texts: list[str], embeddings: np.ndarray, queries: list[str], course_keys: list[list[str]]):
+        """Salva le nuove voci, elimina quelle di scope superati e applica l'eviction LRU."""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                conn.execute("DELETE FROM course_cache WHERE scope != ?", (scope,))
+                conn.executemany(
+                    "INSERT INTO course_cache (scope, family_text, embedding, query, course_keys, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (scope, text, np.ascontiguousarray(embedding, dtype=np.float32).tobytes(), query, json.dumps(keys), now)
+                        for text, embedding, query, keys in zip(family_texts, embeddings, queries, course_keys)
+                    ]
+                )
+                conn.execute(
+                    "DELETE FROM course_cache WHERE id IN ("
+                    "SELECT id FROM course_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Avviso: scrittura nella cache semantica dei corsi fallita: {e}")
+
+    def stats(self) -> dict:
+        """Contatori di hit/miss del processo corrente."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -37,7 +37,8 @@ def identify_skill_gaps(report_text: str) -> GapAnalysisReport | None:
         model=GAP_ANALYZER_MODEL,
         system_prompt=prompts_gap.SYSTEM_PROMPT,
         tool_name="save_skill_gaps",
-        tool_schema=GapAnalysisReport.model_json_schema()
+        tool_schema=GapAnalysisReport.model_json_schema(),
+        call_site="feedback.gap_analysis"
     )
 
     if not structured_response_str:
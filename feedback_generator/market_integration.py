@@ -1,6 +1,8 @@
 # File: feedback_generator/market_integration.py
 import os
 import sys
+import hashlib
+from datetime import datetime, timezone
 
 # Aggiunge la root del progetto al PYTHONPATH (cartella padre di 'feedback_generator')
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -13,18 +15,41 @@ from recruitment_suite.app.core.normalizer import CVNormalizer
 from recruitment_suite.app.reporting.analysis import visualize_results, create_dossiers_for_promoted
 from recruitment_suite.app.utils.esco_fetcher import EscoSkillFetcher
 from recruitment_suite.app.reporting.qualitative import generate_qualitative_llm_report
-from services.data_manager import db
+from services.data_manager import db, get_session_data, save_stage_output
 
-def run_market_benchmark_from_text(
-    job_description_text: str,
-    cv_text: str,
-    offer_title: str
-) -> tuple[str | None, str | None, list[str] | None]:
+# Campo del documento della posizione che contiene lo snapshot di mercato precalcolato
+MARKET_SNAPSHOT_FIELD = "market_snapshot"
+# Categorie di mercato passate al report qualitativo
+MARKET_TOP_CATEGORIES = 10
+
+
+def compute_jd_hash(job_description_text: str, offer_title: str) -> str:
+    return hashlib.sha256(f"{offer_title}\n{job_description_text}".encode("utf-8")).hexdigest()
+
+
+def get_benchmark_version() -> str:
+    """Versione del pool di benchmark: versione dichiarata nei settings + numero di candidati."""
+    try:
+        count = db[settings.MONGO_COLLECTION_BENCHMARK_CANDIDATES].estimated_document_count()
+    except Exception as e:
+        print(f"Avviso: impossibile contare i candidati benchmark: {e}")
+        count = "n/d"
+    return f"{settings.MARKET_BENCHMARK_VERSION}:{count}"
+
+
+def _market_snapshot_key(position_id: str, job_description_text: str, offer_title: str) -> dict:
+    return {
+        "position_id": position_id,
+        "jd_hash": compute_jd_hash(job_description_text, offer_title),
+        "benchmark_version": get_benchmark_version(),
+    }
+
+
+def compute_market_data(job_description_text: str, offer_title: str) -> dict:
     """
-    Esegue la recruitment suite usando JD e testo del CV.
-    Ritorna: (testo_qualitativo, grafico_categorie_base64, lista_delle_skill_piu_comuni)
+    Screening del pool di benchmark contro la JD: dipende solo da posizione e pool, non dal candidato.
+    Ritorna le categorie di mercato principali, il grafico delle categorie e le skill più comuni.
     """
-    
     # --- 1. Screening massivo per generare i dati di mercato e i grafici ---
     try:
         collection_name = settings.MONGO_COLLECTION_BENCHMARK_CANDIDATES
@@ -36,7 +61,7 @@ def run_market_benchmark_from_text(
 
     candidates_data_filtered = [p for p in candidates_data_full if p.get('normalized_experiences')]
     pipeline = RecruitmentPipeline()
-    
+
     llm_analysis, _ = pipeline.run_full_pipeline(
         offer_title,
         job_description_text,
@@ -56,8 +81,82 @@ def run_market_benchmark_from_text(
             if final_dossiers:
                 # --- MODIFICA CHIAVE: Cattura i 3 valori restituiti ---
                 market_df, chart_cat_base64, market_skills_list  = visualize_results(final_dossiers)
-    
-    # La logica che usa chart_path è stata rimossa, non serve più.
+
+    # Le categorie sono salvate come lista: i loro nomi possono contenere caratteri non ammessi nelle chiavi MongoDB
+    market_categories = []
+    if market_df is not None and not market_df.empty:
+        market_categories = [
+            {"category": category, "duration_months": int(duration)}
+            for category, duration in market_df.head(MARKET_TOP_CATEGORIES).round(0).astype(int).items()
+        ]
+
+    return {
+        "market_categories": market_categories,
+        "chart_categories_base64": chart_cat_base64,
+        "market_skills_list": market_skills_list,
+    }
+
+
+def build_market_snapshot(position_id: str) -> dict | None:
+    """
+    Job offline: calcola i dati di mercato per la posizione e li salva sul suo documento,
+    con la chiave (position_id, hash della JD, versione del pool di benchmark).
+    """
+    if db is None:
+        print("  - ERRORE: Connessione a MongoDB non disponibile.")
+        return None
+    positions_collection = db["positions_data"]
+    pos_doc = positions_collection.find_one({"_id": position_id}, {"job_description": 1, "position_name": 1})
+    jd_text = (pos_doc or {}).get("job_description", "") or ""
+    if not jd_text:
+        print(f"  - ERRORE: Job description non trovata per '{position_id}'.")
+        return None
+    offer_title = pos_doc.get("position_name", position_id) or position_id
+
+    print(f"Calcolo dello snapshot di mercato per la posizione '{position_id}'...")
+    snapshot = {
+        "key": _market_snapshot_key(position_id, jd_text, offer_title),
+        **compute_market_data(jd_text, offer_title),
+        "created_at": datetime.now(timezone.utc),
+    }
+    positions_collection.update_one({"_id": position_id}, {"$set": {MARKET_SNAPSHOT_FIELD: snapshot}})
+    print(f"  - Snapshot di mercato salvato per '{position_id}' (pool {snapshot['key']['benchmark_version']}).")
+    return snapshot
+
+
+def get_market_snapshot(position_id: str, pos_doc: dict | None = None) -> dict | None:
+    """
+    Snapshot di mercato della posizione, se ancora valido per la JD e il pool attuali.
+    Se manca o è superato viene ricalcolato (e salvato, a beneficio dei candidati successivi).
+    """
+    if db is None:
+        return None
+    if pos_doc is None:
+        pos_doc = db["positions_data"].find_one({"_id": position_id}, {"job_description": 1, "position_name": 1, MARKET_SNAPSHOT_FIELD: 1}) or {}
+    jd_text = pos_doc.get("job_description", "") or ""
+    offer_title = pos_doc.get("position_name", position_id) or position_id
+    snapshot = pos_doc.get(MARKET_SNAPSHOT_FIELD)
+    if snapshot and snapshot.get("key") == _market_snapshot_key(position_id, jd_text, offer_title):
+        print(f"Snapshot di mercato valido trovato per '{position_id}'.")
+        return snapshot
+    print(f"Snapshot di mercato assente o superato per '{position_id}': lo ricalcolo.")
+    return build_market_snapshot(position_id)
+
+
+def run_market_benchmark_from_text(
+    job_description_text: str,
+    cv_text: str,
+    offer_title: str,
+    market_snapshot: dict | None = None
+) -> tuple[str | None, str | None, list[str] | None]:
+    """
+    Esegue la recruitment suite usando JD e testo del CV.
+    Con market_snapshot (precalcolato per la posizione) salta lo screening del pool di benchmark:
+    restano solo la normalizzazione del CV e il report qualitativo.
+    Ritorna: (testo_qualitativo, grafico_categorie_base64, lista_delle_skill_piu_comuni)
+    """
+    if market_snapshot is None:
+        market_snapshot = compute_market_data(job_description_text, offer_title)
 
     # --- 2. Normalizzazione del CV della sessione (invariata) ---
     candidate_json = {}
@@ -77,10 +176,8 @@ def run_market_benchmark_from_text(
     except Exception as e:
         print(f"ERRORE durante la normalizzazione del CV (da testo): {e}")
 
-    # --- 3. JSON di mercato per il report qualitativo (invariata) ---
-    market_json = {}
-    if market_df is not None and not market_df.empty:
-        market_json = market_df.head(10).round(0).astype(int).to_dict()
+    # --- 3. JSON di mercato per il report qualitativo ---
+    market_json = {c["category"]: c["duration_months"] for c in market_snapshot.get("market_categories", [])}
 
     # --- 4. Generazione testo qualitativo (invariata) ---
     qualitative_text = generate_qualitative_llm_report(
@@ -90,4 +187,52 @@ def run_market_benchmark_from_text(
 )
 
     # --- 5. Restituzione dei risultati pronti per MongoDB ---
-    return qualitative_text, chart_cat_base64, market_skills_list 
\ No newline at end of file
+    return qualitative_text, market_snapshot.get("chart_categories_base64"), market_snapshot.get("market_skills_list")
+
+
+def run_market_benchmark_for_session(session_id: str, session_data: dict | None = None) -> tuple[str | None, str | None, list[str] | None]:
+    """
+    Esegue il benchmark per una sessione (JD della posizione + CV caricato) e ne salva i risultati
+    negli stages. Può girare in anticipo, durante il colloquio, come job in background:
+    il report di feedback riusa i risultati se market_benchmark_status è "Completed".
+    """
+    session_data = session_data or get_session_data(session_id) or {}
+    stages_data = session_data.get("stages", {})
+    cv_text = stages_data.get("uploaded_cv_text")
+    position_id = session_data.get("position_id", "Ruolo non specificato")
+    role_title = position_id
+    jd_text = ""
+    pos_doc = None
+
+    try:
+        if db is None:
+            raise ConnectionError("Connessione a MongoDB non disponibile.")
+        positions_collection = db["positions_data"]
+        pos_doc = positions_collection.find_one({"_id": position_id}, {"job_description": 1, "position_name": 1, MARKET_SNAPSHOT_FIELD: 1})
+        if pos_doc:
+            jd_text = pos_doc.get("job_description", "") or ""
+            role_title = pos_doc.get("position_name", role_title) or role_title
+    except Exception as e:
+        print(f"Avviso: impossibile recuperare la JD o il titolo dal DB per il benchmark: {e}")
+
+    # Esegui il benchmark solo se hai i dati necessari
+    if not (jd_text and cv_text):
+        print("Avviso: JD o testo CV non disponibili; benchmark di mercato saltato.")
+        save_stage_output(session_id, "market_benchmark_status", "Skipped")
+        return None, None, None
+
+    qualitative_text, chart_cat_b64, market_skills_list = run_market_benchmark_from_text(
+        job_description_text=jd_text,
+        cv_text=cv_text,
+        offer_title=role_title,
+        market_snapshot=get_market_snapshot(position_id, pos_doc)
+    )
+    # Salva i risultati nella sessione per persistenza e debug
+    if qualitative_text:
+        save_stage_output(session_id, "market_benchmark_text", qualitative_text)
+    if chart_cat_b64:
+        save_stage_output(session_id, "market_chart_categories_base64", chart_cat_b64)
+    if market_skills_list:
+        save_stage_output(session_id, "market_chart_skills_base64", market_skills_list)
+    save_stage_output(session_id, "market_benchmark_status", "Completed" if qualitative_text else "Failed")
+    return qualitative_text, chart_cat_b64, market_skills_list
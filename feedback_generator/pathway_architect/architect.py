@@ -34,21 +34,61 @@ class FinalReportContent(BaseModel):
     # Il percorso formativo rimane una parte cruciale.
     suggested_pathway: List[SuggestedCourse] = Field(description="Lista ordinata di corsi che costituiscono il percorso formativo suggerito.")
 
+# Il modello sceglie i corsi solo tramite ID compatto e giustificazione: nome, livello, durata e URL
+# vengono uniti in Python dai corsi recuperati (meno token in output e nessun URL inventato).
+class SelectedCourse(BaseModel):
+    course_id: str = Field(description="L'ID del corso selezionato, esattamente come compare nel JSON dei corsi suggeriti (es. C3).")
+    justification: str = Field(description="Breve spiegazione del perché questo corso è utile per il candidato.")
+
+class FinalReportDraft(BaseModel):
+    candidate_name: str = Field(description="Nome e Cognome del candidato.")
+    target_role: str = Field(description="Il ruolo per cui il candidato è stato valutato.")
+    profile_summary: str = Field(description="Profilo sintetico di 3-4 righe sul candidato (Talent Passport).", alias="Profilo sintetico")
+    cv_analysis_outcome: str = Field(description="Paragrafo che riassume gli esiti (punti di forza e carenze) emersi dall'analisi del solo Curriculum Vitae.")
+    interview_outcome: str = Field(description="Paragrafo che riassume gli esiti (punti di forza e carenze) emersi dalla performance del candidato durante il colloquio/caso di studio.")
+    market_benchmark: str = Field(description="Paragrafo placeholder per il benchmark di mercato. Deve contenere un testo provvisorio.")
+    suggested_pathway: List[SelectedCourse] = Field(description="Lista ordinata dei corsi (per ID) che costituiscono il percorso formativo suggerito.")
+
 # --- 2. Logica di Generazione ---
 
 ARCHITECT_MODEL = "gpt-4.1-2025-04-14"
 
+def _join_course_details(selected_courses: List[SelectedCourse], course_catalog: dict[str, dict]) -> List[dict]:
+    """Sostituisce gli ID scelti dal modello con i dettagli dei corsi recuperati (ID sconosciuti o ripetuti vengono scartati)."""
+    pathway = []
+    seen_ids = set()
+    for selected in selected_courses:
+        course_id = selected.course_id.strip().upper()
+        details = course_catalog.get(course_id)
+        if details is None:
+            print(f"  - Avviso: corso '{selected.course_id}' non presente tra i corsi recuperati, scartato.")
+            continue
+        if course_id in seen_ids:
+            continue
+        seen_ids.add(course_id)
+        pathway.append({
+            "course_name": details["course_name"],
+            "justification": selected.justification,
+            "level": details["level"],
+            "duration_hours": details["duration_hours"],
+            "url": details["url"],
+        })
+    return pathway
+
 # La firma della funzione è cambiata: ora accetta due report separati invece di uno solo consolidato.
 def create_final_feedback_content(
     cv_analysis_report: str, 
     case_evaluation_report: str, 
     enriched_gaps_json_str: str, 
     candidate_name: str, 
-    target_role: str
+    target_role: str,
+    course_catalog: dict[str, dict]
 ) -> FinalReportContent | None:
     """
     Genera il contenuto testuale e strutturato per il report finale in PDF.
     Utilizza i report separati per creare sezioni distinte nel feedback.
+    course_catalog mappa l'ID compatto di ogni corso recuperato ai suoi dettagli
+    (course_name, level, duration_hours, url), uniti ai corsi scelti dal modello.
     """
     print("1. Creazione del prompt per il report di feedback finale (versione aggiornata)...")
     
@@ -68,7 +108,8 @@ def create_final_feedback_content(
         model=ARCHITECT_MODEL,
         system_prompt=prompts_pathway.SYSTEM_PROMPT,
         tool_name="save_final_feedback_report",
-        tool_schema=FinalReportContent.model_json_schema()
+        tool_schema=FinalReportDraft.model_json_schema(),
+        call_site="feedback.pathway_architect"
     )
 
     if not structured_response_str:
@@ -77,7 +118,11 @@ def create_final_feedback_content(
     try:
         print("3. Output strutturato ricevuto, validazione in corso...")
         parsed_json = json.loads(structured_response_str)
-        validated_data = FinalReportContent.model_validate(parsed_json)
+        draft = FinalReportDraft.model_validate(parsed_json)
+        validated_data = FinalReportContent.model_validate({
+            **draft.model_dump(by_alias=True),
+            "suggested_pathway": _join_course_details(draft.suggested_pathway, course_catalog),
+        })
         print("4. Contenuto del report finale generato e validato.")
         return validated_data
     except Exception as e:
@@ -64,7 +64,13 @@ def create_feedback_pdf(report_content: FinalReportContent, output_path: str, **
         for i, course in enumerate(report_content.suggested_pathway):
             story.append(Paragraph(f"<b>{i+1}. {course.course_name}</b>", course_title_style))
             story.append(Paragraph(f"<b>Obiettivo:</b> {course.justification}", body_style))
-            story.append(Paragraph(f"<i>Livello: {course.level} | Durata: ~{course.duration_hours} ore | <a href='{course.url}' color='blue'><u>Vai al corso</u></a></i>", body_style))
+            # Durata e URL vengono dal catalogo dei corsi e possono mancare
+            details = [f"Livello: {course.level}"]
+            if course.duration_hours:
+                details.append(f"Durata: ~{course.duration_hours} ore")
+            if course.url:
+                details.append(f"<a href='{course.url}' color='blue'><u>Vai al corso</u></a>")
+            story.append(Paragraph(f"<i>{' | '.join(details)}</i>", body_style))
 
     # --- Sezione 5: Benchmark di Mercato ---
     story.append(Paragraph("Benchmark di Mercato", h1_style))
@@ -28,7 +28,7 @@ Analizza i dati forniti per creare un report di feedback completo e personalizza
 - `profile_summary`: Profilo sintetico di 3-4 righe che fonde le impressioni da CV e colloquio.
 - `cv_analysis_outcome`: Paragrafo che sintetizza l'esito dell'analisi del solo CV.
 - `interview_outcome`: Paragrafo che sintetizza l'esito della performance nel solo colloquio, evidenziando cosa è stato confermato o smentito rispetto al CV.
-- `suggested_pathway`: Lista ordinata e logica di corsi selezionati. Se nessun corso risulta pertinente, la lista deve essere vuota.
+- `suggested_pathway`: Lista ordinata e logica di corsi selezionati, ciascuno indicato con `course_id` e `justification`. Se nessun corso risulta pertinente, la lista deve essere vuota.
 - `market_benchmark`: Inserisci qui ESATTAMENTE questo testo: "Questa sezione è in fase di sviluppo e sarà presto disponibile. Fornirà un'analisi comparativa delle tue competenze rispetto alle attuali richieste del mercato del lavoro per ruoli simili."
 
 **Istruzioni per la Generazione:**
@@ -43,7 +43,7 @@ Analizza i dati forniti per creare un report di feedback completo e personalizza
     *   Analizza la lista di "corsi suggeriti" nel JSON per ciascuna skill family.
     *   Seleziona fino a 2 corsi per famiglia di gap presenti nel JSON ANALISI DEI GAP E CORSI SUGGERITI che creino il percorso più logico ed efficiente.
     *   Ordina i corsi in modo sequenziale (es. Beginner prima di Advanced).
-    *   Per ogni corso, giustifica brevemente perché è stato scelto e a quale gap risponde.
+    *   Per ogni corso indica solo il suo `course_id` (es. "C3", esattamente come nel JSON) e giustifica brevemente perché è stato scelto e a quale gap risponde. Non riportare nome, livello, durata o URL: vengono aggiunti automaticamente.
     *   Metti nel report ALMENO 3 corsi
 5.  **Per la sezione "market_benchmark":**
     *   Usa il testo placeholder fornito sopra, senza alcuna modifica.
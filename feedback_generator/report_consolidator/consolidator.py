@@ -1,4 +1,4 @@
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, is_llm_failure
 from . import prompts_consolidator
 
 CONSOLIDATOR_MODEL = "gpt-4.1-2025-04-14"
@@ -19,10 +19,11 @@ def create_consolidated_report(cv_analysis_report: str, case_evaluation_report:
         model=CONSOLIDATOR_MODEL,
         system_prompt=prompts_consolidator.SYSTEM_PROMPT,
         temperature=0.2,
-        max_tokens=2000
+        max_tokens=2000,
+        call_site="feedback.consolidation"
     )
     
-    if "Errore" in consolidated_report:
+    if is_llm_failure(consolidated_report):
         print(f"Errore ricevuto dall'LLM: {consolidated_report}")
         return "" # Restituisce una stringa vuota in caso di errore
 
@@ -1,22 +1,31 @@
 import os
 import sys
 import json
+from typing import Callable
 from bson import ObjectId 
 
 # Logica per aggiungere la root al path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import dei moduli necessari (tutti DOPO l'append)
-from services.data_manager import get_session_data, save_stage_output, save_pdf_report, db
+from services.data_manager import get_session_data, save_stage_output, save_pdf_report
 from .report_consolidator.consolidator import create_consolidated_report
 from .gap_analyzer.gap_identifier import identify_skill_gaps
 from .course_retriever.prompts_retriever import create_query_refinement_prompt
 from .pathway_architect.architect import create_final_feedback_content
 from .pathway_architect.pdf_service import create_feedback_pdf
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_responses_batch, track_llm_session
 
 # IMPORTA QUI (DOPO il sys.path.append)
-from .market_integration import run_market_benchmark_from_text
+from .market_integration import run_market_benchmark_for_session
+
+# --- CONFIGURAZIONE ---
+# Corsi candidati per famiglia di gap passati all'architetto (meno corsi = prompt più corto e più veloce)
+RAG_RESULTS_PER_FAMILY = int(os.getenv("RAG_RESULTS_PER_FAMILY", "5"))
+QUERY_REFINEMENT_MODEL = "gpt-4o-mini"
+# Pre-filtro sul catalogo: livelli ammessi (separati da virgola) e durata massima in ore; vuoti = nessun filtro
+RAG_COURSE_LEVELS = [l.strip() for l in os.getenv("RAG_COURSE_LEVELS", "").split(",") if l.strip()]
+RAG_MAX_COURSE_HOURS = float(os.getenv("RAG_MAX_COURSE_HOURS", "0")) or None
 
 class MongoJSONEncoder(json.JSONEncoder):
     def default(self, o):
@@ -24,8 +33,14 @@ class MongoJSONEncoder(json.JSONEncoder):
             return str(o)
         return super().default(o)
 
-def run_feedback_pipeline(session_id: str) -> str | None:
+@track_llm_session
+def run_feedback_pipeline(session_id: str, progress_callback: Callable[[str], None] | None = None) -> str | None:
+    """
+    Genera il report di feedback in PDF. progress_callback, se presente, viene chiamata con
+    il nome di ogni fase all'avvio (usata dalla coda dei job per l'avanzamento nella sessione).
+    """
     print(f"--- [PIPELINE] Avvio Generazione Feedback per sessione: {session_id} ---")
+    report_stage = progress_callback or (lambda stage: None)
     
     session_data = get_session_data(session_id)
     if not session_data:
@@ -41,6 +56,7 @@ def run_feedback_pipeline(session_id: str) -> str | None:
     original_cv_report = stages_data.get("cv_analysis_report")
     case_eval_report = stages_data.get("case_evaluation_report")
     
+    report_stage("consolidamento")
     if not consolidated_report:
         print("\n[STEP 1/5] Generazione report consolidato...")
         if not original_cv_report or not case_eval_report:
@@ -53,25 +69,88 @@ def run_feedback_pipeline(session_id: str) -> str | None:
         print("\n[STEP 1/5] Report consolidato già presente.")
 
     # STEP 2: Identificazione Gap. Usa il report consolidato.
+    report_stage("gap")
     print("\n[STEP 2/5] Identificazione gap...")
     gap_analysis = identify_skill_gaps(consolidated_report)
     if not gap_analysis: return None
     save_stage_output(session_id, "gap_analysis", gap_analysis.model_dump())
 
-    # STEP 3: Recupero Corsi. Invariato.
+    # STEP 3: Recupero Corsi. Cache semantica per famiglia di gap, raffinamento delle query in parallelo,
+    # ricerca ibrida in batch (search_many) e ID compatti C1..Cn per i corsi passati all'architetto.
+    report_stage("corsi")
     print("\n[STEP 3/5] Recupero corsi...")
-    from .course_retriever.rag_service import get_rag_service
+    from .course_retriever.rag_service import get_rag_service, course_details
+    from .course_retriever.index_store import course_key
+    from .course_retriever.semantic_cache import gap_family_text
     rag_service = get_rag_service()
     
+    # Famiglie di gap quasi identiche a quelle di candidati precedenti riusano query e corsi dalla cache semantica;
+    # le altre vengono raffinate in parallelo e cercate con un'unica ricerca in batch
+    families = gap_analysis.skill_families
+    course_filters = {"levels": RAG_COURSE_LEVELS, "max_hours": RAG_MAX_COURSE_HOURS}
+    semantic_cache = rag_service.semantic_cache
+    cache_scope = rag_service.cache_scope(k=RAG_RESULTS_PER_FAMILY, filters=course_filters, refinement_model=QUERY_REFINEMENT_MODEL)
+    family_texts = [gap_family_text(f.skill_family_gap, [g.skill_gap for g in f.skill_gaps]) for f in families]
+    family_embeddings = semantic_cache.embed(family_texts) if families else []
+    cached_entries = semantic_cache.lookup_many(cache_scope, family_embeddings)
+
+    queries = [entry["query"] if entry else None for entry in cached_entries]
+    retrieved_per_family = [rag_service.courses_for_keys(entry["course_keys"]) if entry else None for entry in cached_entries]
+    missing = [i for i, entry in enumerate(cached_entries) if entry is None]
+    if missing:
+        refinement_requests = [
+            {
+                "prompt": create_query_refinement_prompt(families[i].skill_family_gap, [g.skill_gap for g in families[i].skill_gaps]),
+                "model": QUERY_REFINEMENT_MODEL,
+                "system_prompt": "Sei un esperto di formazione.",
+                "temperature": 0.1,
+                "call_site": "feedback.query_refinement",
+            }
+            for i in missing
+        ]
+        # Se il raffinamento fallisce si cerca direttamente con il nome della famiglia di gap
+        for i, query in zip(missing, get_llm_responses_batch(refinement_requests)):
+            queries[i] = query if query else families[i].skill_family_gap
+        searched = rag_service.search_many([queries[i] for i in missing], k=RAG_RESULTS_PER_FAMILY, filters=course_filters)
+        for i, courses in zip(missing, searched):
+            retrieved_per_family[i] = courses
+        # Le query di ripiego (raffinamento fallito) non vengono salvate in cache
+        cacheable = [i for i in missing if queries[i] != families[i].skill_family_gap and retrieved_per_family[i]]
+        if cacheable:
+            semantic_cache.store_many(
+                cache_scope,
+                [family_texts[i] for i in cacheable],
+                family_embeddings[cacheable],
+                [queries[i] for i in cacheable],
+                [[course_key(c) for c in retrieved_per_family[i]] for i in cacheable],
+            )
+    course_cache_stats = {"families": len(families), "hits": len(families) - len(missing), "misses": len(missing)}
+    course_cache_stats["hit_rate"] = round(course_cache_stats["hits"] / len(families), 4) if families else 0.0
+    print(f"[INFO] Cache semantica dei corsi: {course_cache_stats['hits']}/{len(families)} famiglie di gap riusate.")
+    save_stage_output(session_id, "course_cache_stats", course_cache_stats)
+
+    # Ogni corso recuperato riceve un ID compatto (C1, C2, ...): l'architetto sceglie i corsi per ID
+    # e nome, livello, durata e URL vengono poi presi dal catalogo
+    course_catalog = {}
+    compact_ids = {}
     enriched_skill_families = []
-    for family in gap_analysis.skill_families:
-        family_name, gap_names = family.skill_family_gap, [g.skill_gap for g in family.skill_gaps]
-        query = get_llm_response(create_query_refinement_prompt(family_name, gap_names), "gpt-4o-mini", "Sei un esperto di formazione.", temperature=0.1)
-        
-        retrieved_courses = rag_service.search(query, k=8)
-
+    for family, retrieved_courses in zip(families, retrieved_per_family):
         family_dict = family.model_dump()
-        family_dict["suggested_courses"] = retrieved_courses 
+        family_dict["suggested_courses"] = []
+        for course in retrieved_courses:
+            key = course_key(course)
+            if key not in compact_ids:
+                compact_ids[key] = f"C{len(compact_ids) + 1}"
+                course_catalog[compact_ids[key]] = course_details(course)
+            details = course_catalog[compact_ids[key]]
+            # L'URL non serve al modello per scegliere
+            family_dict["suggested_courses"].append({
+                "course_id": compact_ids[key],
+                "course_name": details["course_name"],
+                "description": details["description"],
+                "level": details["level"],
+                "duration_hours": details["duration_hours"],
+            })
         enriched_skill_families.append(family_dict)
     
     enriched_gaps_content_str = json.dumps(
@@ -79,49 +158,20 @@ def run_feedback_pipeline(session_id: str) -> str | None:
         ensure_ascii=False,
         cls=MongoJSONEncoder
     )
-    save_stage_output(session_id, "gaps_with_courses", json.loads(enriched_gaps_content_str))
+    save_stage_output(session_id, "gaps_with_courses", {**json.loads(enriched_gaps_content_str), "course_catalog": course_catalog})
 
     # --- STEP 4A: Benchmark di mercato (recruitment suite, no-file) ---
+    report_stage("benchmark")
     print("\n[STEP 4A] Benchmark di mercato (recruitment suite, no-file)...")
 
-    # Inizializza le variabili a None per gestire i casi in cui il benchmark non viene eseguito
-    qualitative_text = None
-    chart_cat_b64 = None
-    market_skills_list = None
-
-    # La logica per ottenere i dati dal DB rimane la stessa
-    jd_text = ""
-    role_title = target_role
-    cv_text_for_market = stages_data.get("uploaded_cv_text")
-
-    try:
-        if db is None:
-            raise ConnectionError("Connessione a MongoDB non disponibile.")
-        positions_collection = db["positions_data"]
-        pos_doc = positions_collection.find_one({"_id": target_role}, {"job_description": 1, "position_name": 1})
-        if pos_doc:
-            jd_text = pos_doc.get("job_description", "") or ""
-            role_title = pos_doc.get("position_name", role_title) or role_title
-    except Exception as e:
-        print(f"Avviso: impossibile recuperare la JD o il titolo dal DB per il benchmark: {e}")
-
-    # Esegui il benchmark solo se hai i dati necessari
-    if jd_text and cv_text_for_market:
-        # Cattura i 3 valori restituiti dalla funzione
-        qualitative_text, chart_cat_b64, market_skills_list = run_market_benchmark_from_text(
-            job_description_text=jd_text,
-            cv_text=cv_text_for_market,
-            offer_title=role_title
-        )
-        # Salva i risultati nella sessione per persistenza e debug
-        if qualitative_text:
-            save_stage_output(session_id, "market_benchmark_text", qualitative_text)
-        if chart_cat_b64:
-            save_stage_output(session_id, "market_chart_categories_base64", chart_cat_b64)
-        if market_skills_list:
-            save_stage_output(session_id, "market_chart_skills_base64", market_skills_list)
+    # Di norma il benchmark è già stato calcolato in background durante il colloquio
+    if stages_data.get("market_benchmark_status") == "Completed":
+        print("Benchmark di mercato già calcolato in background: riuso i risultati della sessione.")
+        qualitative_text = stages_data.get("market_benchmark_text")
+        chart_cat_b64 = stages_data.get("market_chart_categories_base64")
+        market_skills_list = stages_data.get("market_chart_skills_base64")
     else:
-        print("Avviso: JD o testo CV non disponibili; benchmark di mercato saltato.")
+        qualitative_text, chart_cat_b64, market_skills_list = run_market_benchmark_for_session(session_id, session_data)
 
 # Ora le variabili qualitative_text, chart_cat_b64, e chart_skills_b64
 # sono pronte per essere usate più avanti, nella chiamata a create_feedback_pdf
@@ -130,13 +180,15 @@ def run_feedback_pipeline(session_id: str) -> str | None:
     # --- INIZIO MODIFICHE ---
     # STEP 4: Creazione Contenuto Report. Ora passiamo i report originali e separati.
     # STEP 4: Creazione contenuto report PDF (già presente nel file)
+    report_stage("contenuto")
     print("\n[STEP 4/5] Creazione contenuto report PDF (nuova struttura)...")
     final_report_content = create_final_feedback_content(
         cv_analysis_report=original_cv_report,
         case_evaluation_report=case_eval_report,
         enriched_gaps_json_str=enriched_gaps_content_str,
         candidate_name=candidate_name,
-        target_role=target_role
+        target_role=target_role,
+        course_catalog=course_catalog
     )
     if not final_report_content: return None
 
@@ -148,6 +200,7 @@ def run_feedback_pipeline(session_id: str) -> str | None:
             pass
     
     # STEP 5: Generazione PDF. La chiamata è la stessa, ma il contenuto è diverso.
+    report_stage("pdf")
     print("\n[STEP 5/5] Generazione del file PDF...")
     temp_dir = "temp_pdf"
     os.makedirs(temp_dir, exist_ok=True)
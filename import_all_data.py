@@ -4,6 +4,7 @@ import json
 import pandas as pd
 import numpy as np
 from pymongo import MongoClient
+from bson.binary import Binary
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,6 +23,8 @@ STANDARD_FILES = {
 EMBEDDINGS_NPZ_FILE = "embeddings_base_filtered.npz"
 EMBEDDINGS_COLLECTION_NAME = "suite_embeddings"
 EMBEDDING_CHUNK_SIZE = 1000  # Quanti vettori per documento. Puoi aggiustare questo valore.
+# Formato binario dei chunk: float32 little-endian, righe contigue (1000 x 768 float32 ~ 3 MB per documento)
+EMBEDDING_STORAGE_DTYPE = "<f4"
 # ----------------------
 
 def convert_numpy_to_list(doc):
@@ -88,14 +91,17 @@ def import_embeddings_npz_chunked(file_name, collection_name, client):
                 print(f"Suddivisione in chunk di dimensione {EMBEDDING_CHUNK_SIZE}...")
                 for i in range(0, num_vectors, EMBEDDING_CHUNK_SIZE):
                     chunk_end = min(i + EMBEDDING_CHUNK_SIZE, num_vectors)
-                    chunk_array = embeddings_array[i:chunk_end]
+                    chunk_array = np.ascontiguousarray(embeddings_array[i:chunk_end], dtype=EMBEDDING_STORAGE_DTYPE)
                     
                     document = {
                         "embedding_id": key,  # ID comune per tutti i chunk dello stesso array
                         "chunk_index": i // EMBEDDING_CHUNK_SIZE,  # Indice del chunk (0, 1, 2, ...)
                         "start_index": i,  # Indice del primo vettore nel chunk
                         "end_index": chunk_end - 1, # Indice dell'ultimo vettore
-                        "embeddings": chunk_array.tolist() # Il pezzo di dati
+                        # Il pezzo di dati come bytes grezzi (non liste di float Python): il loader lo legge con np.frombuffer
+                        "embeddings": Binary(chunk_array.tobytes()),
+                        "dtype": EMBEDDING_STORAGE_DTYPE,
+                        "shape": list(chunk_array.shape)
                     }
                     collection.insert_one(document)
                 print(f"✅ Array '{key}' importato con successo in {collection.count_documents({'embedding_id': key})} chunk.")
@@ -1,8 +1,71 @@
-from .llm_service import get_llm_response
+from .llm_service import get_llm_response, get_structured_llm_response, stream_llm_response, llm_call_context, is_llm_failure, llm_backend_is_offline
 from . import prompts
+from .conversation_context import ConversationContextManager
+from .question_classifier import question_classifier, build_llm_classification_request, parse_llm_classification
 import json
 import os
+import time
+import random
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Callable, Iterator, Literal, Optional
+from pydantic import BaseModel, Field, ValidationError
+
+# Indica ai metodi di transizione che il prossimo step va ancora selezionato
+_SELECT_NEXT_STEP = object()
+
+class TurnDecision(BaseModel):
+    """Esito di un turno del colloquio gestito con una sola chiamata strutturata."""
+    input_type: Literal["ALTRO", "DOMANDA_SUL_CASO"] = Field(description="Classificazione dell'ultimo messaggio del candidato.")
+    step_accomplished: bool = Field(description="True se il criterio dello step attuale è soddisfatto (solo per input_type 'ALTRO').")
+    next_step_id: Optional[int] = Field(default=None, description="ID del prossimo step se lo step attuale si chiude, altrimenti null.")
+    reply: str = Field(description="Il messaggio da inviare al candidato.")
+
+class _TurnSpeculation:
+    """
+    Avvia in parallelo i sotto-passi di un turno (classificazione, valutazione, selezione)
+    e misura quanto tempo si risparmia rispetto all'esecuzione in sequenza.
+    """
+    def __init__(self, branches: dict[str, Callable]):
+        self.started_at = time.perf_counter()
+        self.decided_at = self.started_at
+        self.durations = {}
+        self.used = []
+        # Un pool per turno, con un thread per ramo: i turni di sessioni diverse non si accodano a vicenda
+        executor = ThreadPoolExecutor(max_workers=max(1, len(branches)), thread_name_prefix="chatbot-turn")
+        # Ogni ramo eredita sessione e call site correnti (telemetria)
+        self.futures = {
+            name: executor.submit(contextvars.copy_context().run, self._timed, name, fn)
+            for name, fn in branches.items()
+        }
+        # I rami già inviati completano comunque; il pool si chiude da solo alla fine
+        executor.shutdown(wait=False)
+
+    def _timed(self, name: str, fn: Callable):
+        started_at = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.durations[name] = time.perf_counter() - started_at
+
+    def result(self, name: str):
+        """Attende il ramo richiesto; i rami mai richiesti vengono semplicemente scartati."""
+        value = self.futures[name].result()
+        self.used.append(name)
+        self.decided_at = time.perf_counter()
+        return value
+
+    def log_timings(self):
+        wall = self.decided_at - self.started_at
+        sequential = sum(self.durations.get(name, 0.0) for name in self.used)
+        details = ", ".join(f"{name} {self.durations.get(name, 0.0):.2f}s" for name in self.used)
+        discarded = [name for name in self.futures if name not in self.used]
+        message = f"[TIMING] Turno: {details} | decisione in {wall:.2f}s, risparmiati ~{max(0.0, sequential - wall):.2f}s"
+        if discarded:
+            message += f" | rami scartati: {', '.join(discarded)}"
+        print(message)
+
 
 class SmartCaseStudyChatbot:
     MAX_ATTEMPTS = 1
@@ -12,20 +75,93 @@ class SmartCaseStudyChatbot:
     INTERVIEWER_MODEL = "gpt-4.1-2025-04-14"
     CLASSIFICATION_MODEL = "gpt-4o-mini" 
 
-    def __init__(self, steps: dict, case_title: str, case_text: str, case_id: str):
+    # Modalità opzionale: turno in un'unica chiamata strutturata (classificazione, valutazione,
+    # prossimo step e risposta). La risposta non è in streaming; se la chiamata fallisce si torna
+    # al percorso a più chiamate, che resta quello predefinito (streaming e classificatore locale).
+    SINGLE_PASS_TURN = os.getenv("CHATBOT_SINGLE_PASS_TURN", "0") == "1"
+    # Nel percorso a più chiamate, classificazione, valutazione e selezione partono in parallelo
+    SPECULATIVE_TURN = os.getenv("CHATBOT_SPECULATIVE_TURN", "1") != "0"
+    # Messaggi precalcolati in preparazione della posizione: "random" sceglie una variante a caso,
+    # "first" usa sempre la prima (output stabile, utile nei test)
+    PRECOMPUTED_VARIANT_CHOICE = "random"
+    # Scelta del prossimo step: "sequential" (ordine degli ID), "graph" (rispetta i 'depends_on'
+    # dei reasoning_steps, altrimenti ordine degli ID) o "llm" (scelta del modello sulla conversazione).
+    # I casi preparati senza 'depends_on' con "graph" usano "llm", come prima dell'introduzione del grafo.
+    STEP_ORDER_POLICIES = ("sequential", "graph", "llm")
+    STEP_ORDER_POLICY = os.getenv("CHATBOT_STEP_ORDER_POLICY", "graph")
+
+    def __init__(
+        self,
+        steps: dict,
+        case_title: str,
+        case_text: str,
+        case_id: str,
+        session_id: str | None = None,
+        precomputed_messages: dict | None = None,
+        step_order_policy: str | None = None
+    ):
         self.steps = steps
         self.case_title = case_title
         self.case_text = case_text
         self.case_id = case_id
+        # Usato per attribuire le chiamate LLM alla sessione nella telemetria
+        self.session_id = session_id
+        # Apertura e transizioni generate in preparazione (vedi message_precomputer)
+        self.precomputed_messages = precomputed_messages or {}
+        self.step_order_policy = step_order_policy or self.STEP_ORDER_POLICY
+        if self.step_order_policy not in self.STEP_ORDER_POLICIES:
+            print(f"[ERRORE] Politica di ordinamento degli step '{self.step_order_policy}' non valida, uso 'graph'.")
+            self.step_order_policy = "graph"
+        if self.step_order_policy == "graph" and not any(step.get('depends_on') for step in steps.values()):
+            # Senza dipendenze il grafo degenera nell'ordine degli ID: si mantiene la scelta contestuale del modello
+            print(f"[INFO] Il caso '{case_id}' non dichiara dipendenze tra gli step: uso la politica 'llm'.")
+            self.step_order_policy = "llm"
         self.questions_asked_count = 0
         self.current_step_id = None
         self.completed_step_ids = set()
         self.attempts_on_current_step = 0
         self.conversation_history = []
         self.is_finished = False
+        # Testo della conversazione per i prompt, entro un budget di token
+        self.context = ConversationContextManager(steps)
+        # Valutatore incrementale degli step (corrector.step_evaluator), impostato dalla webapp
+        self.step_evaluator = None
+        # Il classificatore locale serve solo al percorso a più chiamate (in single-pass si carica al primo fallback)
+        if not self.SINGLE_PASS_TURN:
+            question_classifier.warm_up()
+
+    @staticmethod
+    def transition_key(from_step_id: int, to_step_id: int) -> str:
+        return f"{from_step_id}->{to_step_id}"
+
+    def _precomputed_message(self, variants: list[str] | None) -> str | None:
+        if not variants:
+            return None
+        if self.PRECOMPUTED_VARIANT_CHOICE == "first":
+            return variants[0]
+        return random.choice(variants)
+
+    def _precomputed_transition(self, from_step_id: int, to_step_id: int) -> str | None:
+        return self._precomputed_message(
+            self.precomputed_messages.get("transitions", {}).get(self.transition_key(from_step_id, to_step_id))
+        )
+
+    def _enter_step(self, step_id: int):
+        self.current_step_id = step_id
+        self.attempts_on_current_step = 0
+        self.context.on_step_started(step_id, self.conversation_history)
+
+    def _complete_current_step(self):
+        self.completed_step_ids.add(self.current_step_id)
+        # Il riassunto dello step viene aggiornato solo qui, alla sua chiusura
+        transcript = self.context.on_step_completed(self.current_step_id, self.conversation_history)
+        if self.step_evaluator is not None and transcript:
+            self.step_evaluator.submit(self.steps[self.current_step_id], transcript)
 
     def _save_conversation_history(self):
-        output_dir = "output"
+        # Le conversazioni dei backend replay/fake non sono campioni reali: restano fuori da output/
+        # (e quindi dal repository e dall'addestramento del classificatore locale)
+        output_dir = os.path.join("output", "offline") if llm_backend_is_offline() else "output"
         os.makedirs(output_dir, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{self.case_id}_{timestamp}.json"
@@ -37,31 +173,95 @@ class SmartCaseStudyChatbot:
         except Exception as e:
             print(f"\n[ERRORE] Impossibile salvare la conversazione: {e}")
 
-    def start_interview(self) -> str:
-        self.current_step_id = 0
+    def _generate_reply(self, stream: bool, **llm_kwargs) -> str | Iterator[str]:
+        """Genera la risposta dell'intervistatore, in blocco o in streaming."""
+        if stream:
+            return stream_llm_response(**llm_kwargs)
+        return get_llm_response(**llm_kwargs)
+
+    def _turn_snapshot(self) -> dict:
+        """Stato del colloquio prima del turno, per ripristinarlo se la risposta non viene generata."""
+        return {
+            "history_length": len(self.conversation_history),
+            "step_id": self.current_step_id,
+            "attempts": self.attempts_on_current_step,
+            "questions_asked": self.questions_asked_count,
+        }
+
+    def _recover_failed_turn(self, failure: str, snapshot: dict | None) -> str:
+        """
+        Gestisce una risposta dell'intervistatore non generata (il testo di errore non arriva al
+        candidato né alla cronologia). Se il turno non ha cambiato step si ripristina lo stato
+        precedente e il candidato può ripetere la risposta. Se lo step è già stato chiuso (riassunto
+        e valutazione avviati) lo stato resta: il nuovo step viene presentato con un testo fisso,
+        registrato in cronologia come risposta dell'intervistatore.
+        """
+        print(f"[ERRORE] Risposta dell'intervistatore non disponibile: {failure}")
+        if snapshot is not None and snapshot["step_id"] == self.current_step_id:
+            del self.conversation_history[snapshot["history_length"]:]
+            self.attempts_on_current_step = snapshot["attempts"]
+            self.questions_asked_count = snapshot["questions_asked"]
+            return prompts.LLM_FAILURE_MESSAGE
+        step_info = self.steps[self.current_step_id]
+        message = prompts.LLM_FAILURE_STEP_INTRO_MESSAGE.format(
+            step_title=step_info.get('title', ''), step_description=step_info.get('description', '')
+        )
+        self.conversation_history.append({"role": "assistant", "content": message})
+        return message
+
+    def _record_assistant_turn(self, response: str, snapshot: dict | None = None) -> str:
+        """Registra la risposta in conversation_history e la restituisce (un LLMFailure passa da _recover_failed_turn)."""
+        if is_llm_failure(response):
+            return self._recover_failed_turn(response, snapshot)
+        self.conversation_history.append({"role": "assistant", "content": response})
+        return response
+
+    def _record_reply(self, reply: str | Iterator[str], snapshot: dict | None = None) -> Iterator[str]:
+        """
+        Inoltra la risposta al chiamante frammento per frammento e, a stream concluso,
+        registra il testo completo in conversation_history (se lo stream fallisce vedi _recover_failed_turn).
+        """
+        chunks = []
+        for chunk in ([reply] if isinstance(reply, str) else reply):
+            if is_llm_failure(chunk):
+                yield ("\n\n" if chunks else "") + self._recover_failed_turn(chunk, snapshot)
+                return
+            chunks.append(chunk)
+            yield chunk
+        self.conversation_history.append({"role": "assistant", "content": "".join(chunks).strip()})
+
+    def _start_interview_reply(self, stream: bool) -> str | Iterator[str]:
+        self._enter_step(0)
+        precomputed = self._precomputed_message(self.precomputed_messages.get("opening"))
+        if precomputed:
+            return precomputed
         step_zero_info = self.steps[self.current_step_id]
         prompt = prompts.create_start_prompt(self.case_title, self.case_text, step_zero_info['description'])
-        initial_message = get_llm_response(
+        return self._generate_reply(
+            stream,
             prompt=prompt, 
             model=self.INTERVIEWER_MODEL, 
             system_prompt=prompts.SYSTEM_PROMPT,
-            temperature=0.7
+            temperature=0.7,
+            call_site="chatbot.start_interview"
         )
-        self.conversation_history.append({"role": "assistant", "content": initial_message})
-        return initial_message
 
-    def _is_user_input_a_question(self, user_input: str) -> bool:
-        prompt = prompts.create_input_classification_prompt(user_input)
-        response = get_llm_response(
-            prompt=prompt,
-            model=self.CLASSIFICATION_MODEL, 
-            system_prompt="Sei un classificatore di testo estremamente preciso e letterale. Il tuo unico scopo è restituire una delle due opzioni fornite.",
-            temperature=0.0,
-            max_tokens=10
-        )
-        return "DOMANDA_SUL_CASO" in response.upper()
+    def start_interview(self) -> str:
+        with llm_call_context(session_id=self.session_id):
+            initial_message = self._start_interview_reply(stream=False)
+        return self._record_assistant_turn(initial_message)
 
-    def _answer_candidate_question(self, user_question: str) -> str:
+    def start_interview_stream(self) -> Iterator[str]:
+        """Come start_interview, ma restituisce un generatore di frammenti (per st.write_stream)."""
+        with llm_call_context(session_id=self.session_id):
+            yield from self._record_reply(self._start_interview_reply(stream=True))
+
+    def _classify_with_llm(self, user_input: str) -> bool:
+        # Usato solo se il classificatore locale manca o il caso è ambiguo
+        response = get_llm_response(**build_llm_classification_request(user_input, self.CLASSIFICATION_MODEL))
+        return parse_llm_classification(response)
+
+    def _answer_candidate_question(self, user_question: str, stream: bool = False) -> str | Iterator[str]:
         self.questions_asked_count += 1
         remaining_q = self.MAX_QUESTIONS - self.questions_asked_count
         current_step_info = self.steps[self.current_step_id]
@@ -70,41 +270,187 @@ class SmartCaseStudyChatbot:
             current_step_description=current_step_info['description'],
             user_question=user_question
         )
-        answer = get_llm_response(
+        answer = self._generate_reply(
+            stream,
             prompt=prompt,
             model=self.INTERVIEWER_MODEL,
-            system_prompt=prompts.SYSTEM_PROMPT
+            system_prompt=prompts.SYSTEM_PROMPT,
+            call_site="chatbot.answer_question"
         )
-        answer += f"\n\n*(Hai ancora {remaining_q} domande a disposizione.)*"
-        return answer
+        reminder = f"\n\n*(Hai ancora {remaining_q} domande a disposizione.)*"
+        if stream:
+            return self._append_to_stream(answer, reminder)
+        # Concatenando un LLMFailure si otterrebbe una str qualsiasi: il fallimento va restituito così com'è
+        return answer if is_llm_failure(answer) else answer + reminder
 
-    def process_user_response(self, user_input: str) -> str:
-        if self.is_finished:
-            return "Il colloquio è terminato. Grazie per la tua partecipazione! Riceverai l'esito appena avremo valutato il tuo esercizio"
+    @staticmethod
+    def _append_to_stream(chunks: Iterator[str], suffix: str) -> Iterator[str]:
+        yield from chunks
+        yield suffix
+
+    def _build_response(self, user_input: str, stream: bool) -> str | Iterator[str]:
+        """Logica di un turno: registra l'input e decide quale risposta generare."""
         self.conversation_history.append({"role": "user", "content": user_input})
-        if self._is_user_input_a_question(user_input):
+        if self.SINGLE_PASS_TURN:
+            # La risposta strutturata non è in streaming: in quel caso arriva in un unico frammento
+            response = self._single_pass_response(user_input)
+            if response is not None:
+                return response
+            print("[INFO] Turno in un'unica chiamata non riuscito, uso il percorso a più chiamate.")
+        return self._multi_call_response(user_input, stream)
+
+    def _single_pass_response(self, user_input: str) -> str | None:
+        """
+        Gestisce il turno con una sola chiamata strutturata. Restituisce None (senza toccare
+        lo stato del colloquio) se la risposta manca o non è utilizzabile.
+        """
+        current_step_info = self.steps[self.current_step_id]
+        available_steps = [
+            step for id, step in self.steps.items()
+            if id not in self.completed_step_ids and id != self.current_step_id
+        ]
+        precomputed_transition = None
+        if available_steps and self.step_order_policy != "llm":
+            # Il prossimo step è già deciso localmente: il modello deve solo introdurlo,
+            # e nemmeno quello se la transizione è stata precalcolata in preparazione
+            next_step_id = self._select_next_step(exclude_step_id=self.current_step_id)
+            available_steps = [self.steps[next_step_id]]
+            precomputed_transition = self._precomputed_transition(self.current_step_id, next_step_id)
+        history_text = self.context.render(self.conversation_history)
+        options_text = "\n".join([f"ID: {s['id']}, Titolo: {s['title']}" for s in available_steps])
+        skills_str = ", ".join([s.get('skill_name', '') for s in current_step_info.get('skills_to_test', [])])
+        is_last_attempt = self.attempts_on_current_step + 1 >= self.MAX_ATTEMPTS
+
+        prompt = prompts.create_single_pass_turn_prompt(
+            self.case_title, self.case_text, current_step_info, skills_str, history_text,
+            options_text, user_input, self.MAX_QUESTIONS - self.questions_asked_count, is_last_attempt,
+            transition_precomputed=precomputed_transition is not None
+        )
+        raw_decision = get_structured_llm_response(
+            prompt=prompt,
+            model=self.INTERVIEWER_MODEL,
+            system_prompt=prompts.SYSTEM_PROMPT,
+            tool_name="gestisci_turno_colloquio",
+            tool_schema=TurnDecision.model_json_schema(),
+            temperature=0.7,
+            call_site="chatbot.single_pass_turn"
+        )
+        if not raw_decision:
+            return None
+        try:
+            decision = TurnDecision.model_validate_json(raw_decision)
+        except ValidationError as e:
+            print(f"[ERRORE] Risposta del turno non valida: {e}")
+            return None
+
+        if decision.input_type == "DOMANDA_SUL_CASO":
+            if self.questions_asked_count >= self.MAX_QUESTIONS:
+                return prompts.QUESTIONS_EXHAUSTED_MESSAGE
+            if not decision.reply.strip():
+                return None
+            self.questions_asked_count += 1
+            remaining_q = self.MAX_QUESTIONS - self.questions_asked_count
+            return decision.reply.strip() + f"\n\n*(Hai ancora {remaining_q} domande a disposizione.)*"
+
+        closes_step = decision.step_accomplished or is_last_attempt
+        if closes_step and available_steps and self.step_order_policy != "llm":
+            decision.next_step_id = available_steps[0]['id']
+        if closes_step and available_steps:
+            # Il testo introduce lo step scelto dal modello: se l'ID non è valido si rifà il turno
+            if decision.next_step_id not in [s['id'] for s in available_steps]:
+                return None
+        reply = decision.reply.strip()
+        if closes_step and decision.step_accomplished and available_steps:
+            # Con la politica "llm" lo step viene scelto dal modello: la transizione precalcolata si cerca ora
+            precomputed_transition = precomputed_transition or self._precomputed_transition(self.current_step_id, decision.next_step_id)
+            reply = precomputed_transition or reply
+        if not reply and (available_steps or not closes_step):
+            return None
+
+        self.attempts_on_current_step += 1
+        if not closes_step:
+            return reply
+        self._complete_current_step()
+        if not available_steps:
+            self.is_finished = True
+            self._save_conversation_history()
+            return prompts.SUCCESSFUL_FINISH_MESSAGE if decision.step_accomplished else prompts.FORCED_FINISH_MESSAGE
+        self._enter_step(decision.next_step_id)
+        return reply
+
+    def _start_speculation(self, user_input: str, local_verdict: bool | None) -> _TurnSpeculation:
+        """
+        Classificazione LLM, valutazione e selezione dipendono solo dall'input e dalla cronologia:
+        partono insieme e il verdetto del classificatore decide quali risultati usare. Se il
+        classificatore locale ha già escluso una domanda, la classificazione LLM non parte.
+        I rami lavorano su copie dello stato: il thread principale intanto lo modifica.
+        """
+        current_step_id = self.current_step_id
+        completed_step_ids = frozenset(self.completed_step_ids)
+        history = list(self.conversation_history)
+        branches = {}
+        if local_verdict is None:
+            branches["classificazione"] = lambda: self._classify_with_llm(user_input)
+        branches["valutazione"] = lambda: self._evaluate_step_completion(current_step_id, history)
+        branches["selezione"] = lambda: self._select_next_step(current_step_id, completed_step_ids, history)
+        return _TurnSpeculation(branches)
+
+    def _multi_call_response(self, user_input: str, stream: bool) -> str | Iterator[str]:
+        """Percorso classico del turno: classificazione, valutazione e generazione in chiamate separate."""
+        local_verdict = question_classifier.classify(user_input)
+        # Con una domanda riconosciuta localmente valutazione e selezione non servono: niente speculazione
+        speculation = self._start_speculation(user_input, local_verdict) if self.SPECULATIVE_TURN and local_verdict is not True else None
+        if local_verdict is not None:
+            is_question = local_verdict
+        else:
+            is_question = speculation.result("classificazione") if speculation else self._classify_with_llm(user_input)
+        if is_question:
             if self.questions_asked_count < self.MAX_QUESTIONS:
-                response = self._answer_candidate_question(user_input)
+                response = self._answer_candidate_question(user_input, stream)
             else:
-                response = "Hai esaurito le domande a tua disposizione. Per favore, procedi ora con la tua analisi."
+                response = prompts.QUESTIONS_EXHAUSTED_MESSAGE
         else:
             self.attempts_on_current_step += 1
-            is_step_accomplished = self._evaluate_step_completion()
+            is_step_accomplished = speculation.result("valutazione") if speculation else self._evaluate_step_completion()
             if is_step_accomplished:
-                self.completed_step_ids.add(self.current_step_id)
-                response = self._transition_to_next_step()
+                self._complete_current_step()
+                next_step_id = speculation.result("selezione") if speculation else _SELECT_NEXT_STEP
+                response = self._transition_to_next_step(stream, next_step_id)
             else:
                 if self.attempts_on_current_step >= self.MAX_ATTEMPTS:
-                    self.completed_step_ids.add(self.current_step_id)
-                    response = self._conclude_step_and_transition()
+                    self._complete_current_step()
+                    next_step_id = speculation.result("selezione") if speculation else _SELECT_NEXT_STEP
+                    response = self._conclude_step_and_transition(stream, next_step_id)
                 else:
-                    response = self._provide_guidance()
-        self.conversation_history.append({"role": "assistant", "content": response})
+                    response = self._provide_guidance(stream)
+        if speculation:
+            speculation.log_timings()
         return response
 
-    def _evaluate_step_completion(self) -> bool:
-        current_step = self.steps[self.current_step_id]
-        history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history[-5:]])
+    def process_user_response(self, user_input: str) -> str:
+        if self.is_finished:
+            return "Il colloquio è terminato. Grazie per la tua partecipazione! Riceverai l'esito appena avremo valutato il tuo esercizio"
+        snapshot = self._turn_snapshot()
+        with llm_call_context(session_id=self.session_id):
+            response = self._build_response(user_input, stream=False)
+        return self._record_assistant_turn(response, snapshot)
+
+    def process_user_response_stream(self, user_input: str) -> Iterator[str]:
+        """
+        Come process_user_response, ma restituisce un generatore di frammenti di testo.
+        La risposta completa viene salvata in conversation_history quando lo stream termina.
+        """
+        if self.is_finished:
+            yield "Il colloquio è terminato. Grazie per la tua partecipazione! Riceverai l'esito appena avremo valutato il tuo esercizio"
+            return
+        snapshot = self._turn_snapshot()
+        with llm_call_context(session_id=self.session_id):
+            yield from self._record_reply(self._build_response(user_input, stream=True), snapshot)
+
+    def _evaluate_step_completion(self, step_id: int | None = None, history: list | None = None) -> bool:
+        current_step = self.steps[self.current_step_id if step_id is None else step_id]
+        history = self.conversation_history if history is None else history
+        history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history[-5:]])
         
         # --- INIZIO MODIFICA ---
         # Creiamo un contesto ricco combinando il titolo e la descrizione dello step.
@@ -123,43 +469,64 @@ class SmartCaseStudyChatbot:
             model=self.INTERVIEWER_MODEL,
             system_prompt=prompts.SYSTEM_PROMPT,
             temperature=0.2, 
-            max_tokens=10
+            max_tokens=10,
+            call_site="chatbot.evaluate_step"
         )
         return "True" in evaluation
     
-    def _select_next_step(self) -> int | None:
-        available_steps = [step for id, step in self.steps.items() if id not in self.completed_step_ids]
+    def _select_next_step(self, exclude_step_id: int | None = None, completed_step_ids: frozenset | None = None, history: list | None = None) -> int | None:
+        completed_step_ids = self.completed_step_ids if completed_step_ids is None else completed_step_ids
+        available_steps = [
+            step for id, step in self.steps.items()
+            if id not in completed_step_ids and id != exclude_step_id
+        ]
         if not available_steps: return None
-        history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history])
+        if self.step_order_policy == "sequential":
+            return min(step['id'] for step in available_steps)
+        if self.step_order_policy == "graph":
+            return self._next_step_from_graph(available_steps, exclude_step_id, completed_step_ids)
+        history_text = self.context.render(self.conversation_history if history is None else history)
         options_text = "\n".join([f"ID: {s['id']}, Titolo: {s['title']}" for s in available_steps])
         prompt = prompts.create_next_step_selection_prompt(options_text, history_text)
         try:
             next_id_str = get_llm_response(
                 prompt=prompt, model=self.INTERVIEWER_MODEL,
                 system_prompt="Sei un assistente logico.",
-                temperature=0.1, max_tokens=5
+                temperature=0.1, max_tokens=5,
+                call_site="chatbot.select_next_step"
             )
             next_id = int(''.join(filter(str.isdigit, next_id_str)))
             return next_id if next_id in [s['id'] for s in available_steps] else available_steps[0]['id']
         except (ValueError, IndexError): return available_steps[0]['id']
 
-    def _transition_to_next_step(self):
-        next_step_id = self._select_next_step()
+    def _next_step_from_graph(self, available_steps: list[dict], closing_step_id: int | None, completed_step_ids) -> int:
+        """Primo step (per ID) le cui dipendenze sono tutte concluse; se nessuno è pronto, il primo disponibile."""
+        done = set(completed_step_ids) | {closing_step_id}
+        ready = [step for step in available_steps if all(dep in done for dep in step.get('depends_on') or [])]
+        return min(step['id'] for step in (ready or available_steps))
+
+    def _transition_to_next_step(self, stream: bool = False, next_step_id=_SELECT_NEXT_STEP) -> str | Iterator[str]:
+        if next_step_id is _SELECT_NEXT_STEP:
+            next_step_id = self._select_next_step()
         if next_step_id is None:
             self.is_finished = True
             self._save_conversation_history()
             return prompts.SUCCESSFUL_FINISH_MESSAGE
+        precomputed = self._precomputed_transition(self.current_step_id, next_step_id)
+        if precomputed:
+            self._enter_step(next_step_id)
+            return precomputed
         current_step_info = self.steps[self.current_step_id]
         next_step_info = self.steps[next_step_id]
         prompt = prompts.create_successful_transition_prompt(
             current_step_info['title'], next_step_info['title'], next_step_info['description']
         )
-        self.current_step_id = next_step_id
-        self.attempts_on_current_step = 0
-        return get_llm_response(prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT)
+        self._enter_step(next_step_id)
+        return self._generate_reply(stream, prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT, call_site="chatbot.transition")
 
-    def _conclude_step_and_transition(self):
-        next_step_id = self._select_next_step()
+    def _conclude_step_and_transition(self, stream: bool = False, next_step_id=_SELECT_NEXT_STEP) -> str | Iterator[str]:
+        if next_step_id is _SELECT_NEXT_STEP:
+            next_step_id = self._select_next_step()
         if next_step_id is None:
             self.is_finished = True
             self._save_conversation_history()
@@ -177,13 +544,12 @@ class SmartCaseStudyChatbot:
             next_step_info['title'],
             next_step_info['description']
         )
-        self.current_step_id = next_step_id
-        self.attempts_on_current_step = 0
-        return get_llm_response(prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT)
+        self._enter_step(next_step_id)
+        return self._generate_reply(stream, prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT, call_site="chatbot.failed_transition")
         
-    def _provide_guidance(self):
+    def _provide_guidance(self, stream: bool = False) -> str | Iterator[str]:
         current_step_info = self.steps[self.current_step_id]
-        history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history])
+        history_text = self.context.render(self.conversation_history)
         
         skills_str = ", ".join([s.get('skill_name', '') for s in current_step_info.get('skills_to_test', [])])
 
@@ -193,4 +559,4 @@ class SmartCaseStudyChatbot:
             skills_str,
             history_text
         )
-        return get_llm_response(prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT, temperature=0.7)
\ No newline at end of file
+        return self._generate_reply(stream, prompt=prompt, model=self.INTERVIEWER_MODEL, system_prompt=prompts.SYSTEM_PROMPT, temperature=0.7, call_site="chatbot.guidance")
\ No newline at end of file
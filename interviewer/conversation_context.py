@@ -0,0 +1,121 @@
+# interviewer/conversation_context.py
+# Scopo: Contesto della conversazione a dimensione limitata per i prompt del chatbot:
+#        ultimi N turni alla lettera, riassunti per step dei turni più vecchi, budget di token.
+
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from .llm_service import get_llm_response
+from . import prompts
+
+# --- CONFIGURAZIONE ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CHATBOT_CONTEXT_TOKEN_BUDGET", "3000"))
+RECENT_TURNS_VERBATIM = int(os.getenv("CHATBOT_RECENT_TURNS_VERBATIM", "3"))
+# Un singolo messaggio (es. una risposta incollata da ChatGPT) non può occupare più di così
+MAX_MESSAGE_TOKENS = 400
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_MAX_TOKENS = 300
+
+# I riassunti sono generati in background, fuori dal percorso del turno
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chatbot-summary")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Stima grossolana (4 caratteri per token), coerente con lo scheduler LLM."""
+    return len(text) // 4
+
+
+def _format_message(msg: dict) -> str:
+    content = msg['content']
+    max_chars = MAX_MESSAGE_TOKENS * 4
+    if len(content) > max_chars:
+        content = content[:max_chars] + " [...]"
+    return f"{msg['role']}: {content}"
+
+
+class ConversationContextManager:
+    """
+    Costruisce il testo della conversazione da inserire nei prompt restando entro un budget
+    di token. Gli step conclusi vengono riassunti una sola volta, alla loro chiusura.
+    """
+    def __init__(self, steps: dict, token_budget: int = CONTEXT_TOKEN_BUDGET, recent_turns: int = RECENT_TURNS_VERBATIM):
+        self.steps = steps
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        # step_id -> [indice di inizio, indice di fine (escluso) o None se in corso]
+        self._step_ranges = {}
+        # step_id -> riassunto, nell'ordine di chiusura degli step
+        self._summaries = {}
+        self._lock = threading.Lock()
+
+    def on_step_started(self, step_id: int, history: list[dict]):
+        """Da chiamare quando il colloquio entra in uno step: i messaggi successivi gli appartengono."""
+        with self._lock:
+            self._step_ranges[step_id] = [len(history), None]
+
+    def on_step_completed(self, step_id: int, history: list[dict]) -> list[dict]:
+        """Chiude lo step, ne avvia il riassunto in background e restituisce i messaggi dello step."""
+        with self._lock:
+            step_range = self._step_ranges.setdefault(step_id, [0, None])
+            step_range[1] = len(history)
+            transcript = [dict(msg) for msg in history[step_range[0]:step_range[1]]]
+        if not transcript:
+            return transcript
+        context = contextvars.copy_context()
+        _SUMMARY_EXECUTOR.submit(context.run, self._summarize_step, step_id, transcript)
+        return transcript
+
+    def _summarize_step(self, step_id: int, transcript: list[dict]):
+        step_title = self.steps.get(step_id, {}).get('title', f"Step {step_id}")
+        transcript_text = "\n".join(_format_message(msg) for msg in transcript)
+        summary = get_llm_response(
+            prompt=prompts.create_step_summary_prompt(step_title, transcript_text),
+            model=SUMMARY_MODEL,
+            system_prompt="Sei un assistente che sintetizza colloqui di lavoro in modo fedele e conciso.",
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            call_site="chatbot.step_summary"
+        )
+        if not summary:
+            # Senza riassunto lo step resta rappresentato dai messaggi originali (entro il budget)
+            print(f"[ERRORE] Riassunto dello step {step_id} non disponibile: {summary}")
+            return
+        with self._lock:
+            self._summaries[step_id] = f"[{step_title}] {summary}"
+
+    def render(self, history: list[dict]) -> str:
+        """
+        Restituisce il testo della conversazione per i prompt: i riassunti degli step conclusi,
+        i messaggi più vecchi non riassunti (finché c'è budget) e gli ultimi N turni alla lettera.
+        """
+        with self._lock:
+            summaries = list(self._summaries.values())
+            summarized = set()
+            for step_id in self._summaries:
+                start, end = self._step_ranges[step_id]
+                summarized.update(range(start, end if end is not None else len(history)))
+
+        recent_start = max(0, len(history) - 2 * self.recent_turns)
+        recent_lines = [_format_message(msg) for msg in history[recent_start:]]
+        summary_block = "RIASSUNTO DEGLI STEP PRECEDENTI:\n" + "\n".join(summaries) if summaries else ""
+
+        used_tokens = estimate_text_tokens(summary_block) + sum(estimate_text_tokens(line) for line in recent_lines)
+        older_lines = []
+        # I messaggi più vecchi non coperti da un riassunto entrano dal più recente, finché c'è budget
+        for index in range(recent_start - 1, -1, -1):
+            if index in summarized:
+                continue
+            line = _format_message(history[index])
+            line_tokens = estimate_text_tokens(line)
+            if used_tokens + line_tokens > self.token_budget:
+                older_lines.append("[... messaggi precedenti omessi ...]")
+                break
+            older_lines.append(line)
+            used_tokens += line_tokens
+        older_lines.reverse()
+
+        if not summary_block:
+            return "\n".join(older_lines + recent_lines)
+        return summary_block + "\n\nCONVERSAZIONE RECENTE:\n" + "\n".join(older_lines + recent_lines)
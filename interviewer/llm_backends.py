@@ -0,0 +1,337 @@
+# interviewer/llm_backends.py
+# Scopo: Backend intercambiabili per le chiamate LLM, per benchmark e test di regressione offline.
+#        - live:   chiamate reali a OpenAI (default)
+#        - record: chiamate reali, salvando ogni risposta come fixture indicizzata per hash della richiesta
+#        - replay: nessuna chiamata di rete, le risposte arrivano dalle fixture con latenza sintetica
+#        - fake:   nessuna chiamata di rete, risposte generate (JSON valido rispetto allo schema del tool)
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import Callable, Iterator, Optional
+
+# --- CONFIGURAZIONE ---
+LLM_BACKEND_MODES = ("live", "record", "replay", "fake")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "live").lower()
+if LLM_BACKEND not in LLM_BACKEND_MODES:
+    print(f"Avviso: LLM_BACKEND='{LLM_BACKEND}' non valido, uso il backend 'live'.")
+    LLM_BACKEND = "live"
+LLM_FIXTURES_DIR = os.getenv("LLM_FIXTURES_DIR", os.path.join("data", "llm_fixtures"))
+# Latenza sintetica (secondi) per replay/fake. Se non impostata, il replay usa la latenza registrata.
+LLM_SYNTHETIC_LATENCY_SECONDS = os.getenv("LLM_SYNTHETIC_LATENCY_SECONDS")
+LLM_SYNTHETIC_LATENCY_SCALE = float(os.getenv("LLM_SYNTHETIC_LATENCY_SCALE", "1.0"))
+# Cosa fare in replay se manca la fixture: "error" (fallimento della chiamata) oppure "fake"
+LLM_REPLAY_ON_MISSING = os.getenv("LLM_REPLAY_ON_MISSING", "error").lower()
+
+# Parametri che non cambiano il contenuto della risposta e quindi non entrano nella chiave della fixture
+_NON_SEMANTIC_KWARGS = {"stream", "stream_options"}
+
+# Risposte testuali del modo fake per i call site che si aspettano un formato preciso
+FAKE_TEXT_RESPONSES = {
+    "chatbot.classify_input": "RISPOSTA",
+    "chatbot.evaluate_step": "True",
+    "chatbot.select_next_step": "1",
+    "market.cv_extraction": json.dumps({"experience": []}),
+}
+FAKE_DEFAULT_TEXT = "Risposta simulata dal backend LLM fake."
+FAKE_STREAM_CHUNK_WORDS = 3
+
+
+class FixtureNotFoundError(LookupError):
+    """Nessuna fixture registrata per la richiesta (modo replay)."""
+
+
+def fixture_key(api_kwargs: dict) -> str:
+    """Hash SHA-256 della richiesta, indipendente dal fatto che sia in streaming o meno."""
+    payload = {k: v for k, v in api_kwargs.items() if k not in _NON_SEMANTIC_KWARGS}
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+# --- GENERAZIONE DI DATI FITTIZI DA JSON SCHEMA ---
+
+def _resolve_ref(ref: str, root: dict) -> dict:
+    # Gli schemi pydantic usano riferimenti locali del tipo "#/$defs/NomeModello"
+    node = root
+    for part in ref.lstrip("#/").split("/"):
+        node = node.get(part, {})
+    return node
+
+
+def _fake_number(schema: dict, integer: bool):
+    low = schema.get("minimum", schema.get("exclusiveMinimum"))
+    high = schema.get("maximum", schema.get("exclusiveMaximum"))
+    if low is not None and high is not None:
+        value = (low + high) / 2
+    elif low is not None:
+        value = low + 1 if "exclusiveMinimum" in schema else low
+    elif high is not None:
+        value = min(high, 1)
+    else:
+        value = 1
+    return int(value) if integer else float(value)
+
+
+def fake_from_schema(schema: dict, root: Optional[dict] = None, name: Optional[str] = None):
+    """
+    Genera in modo deterministico un valore valido per un JSON Schema (come quelli prodotti
+    da Model.model_json_schema()): oggetti con tutte le proprietà, liste con almeno un
+    elemento, enum al primo valore, numeri entro i limiti dichiarati.
+    """
+    root = root if root is not None else schema
+    if "$ref" in schema:
+        return fake_from_schema(_resolve_ref(schema["$ref"], root), root, name)
+    if "const" in schema:
+        return schema["const"]
+    if "default" in schema and schema["default"] is not None:
+        return schema["default"]
+    if schema.get("enum"):
+        return schema["enum"][0]
+    for combinator in ("anyOf", "oneOf"):
+        if combinator in schema:
+            options = [o for o in schema[combinator] if o.get("type") != "null"] or schema[combinator]
+            return fake_from_schema(options[0], root, name)
+    if "allOf" in schema:
+        merged = {}
+        for part in schema["allOf"]:
+            merged.update(_resolve_ref(part["$ref"], root) if "$ref" in part else part)
+        return fake_from_schema(merged, root, name)
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "null")
+    if schema_type is None:
+        schema_type = "object" if "properties" in schema else "string"
+
+    if schema_type == "object":
+        return {
+            prop_name: fake_from_schema(prop_schema, root, prop_name)
+            for prop_name, prop_schema in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        count = max(schema.get("minItems", 1), 1)
+        return [fake_from_schema(schema.get("items", {}), root, name) for _ in range(count)]
+    if schema_type == "integer":
+        return _fake_number(schema, integer=True)
+    if schema_type == "number":
+        return _fake_number(schema, integer=False)
+    if schema_type == "boolean":
+        return True
+    if schema_type == "null":
+        return None
+    text = f"{name or 'valore'} di esempio"
+    if schema.get("minLength"):
+        text = text.ljust(schema["minLength"], ".")
+    if schema.get("maxLength"):
+        text = text[:schema["maxLength"]]
+    return text
+
+
+# --- RISPOSTE SINTETICHE (stessa forma degli oggetti del client OpenAI) ---
+
+def _make_usage(usage: Optional[dict]):
+    if not usage:
+        return None
+    return SimpleNamespace(
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        total_tokens=usage.get("total_tokens"),
+    )
+
+
+def _make_response(data: dict):
+    tool_calls = None
+    if data.get("tool_arguments") is not None:
+        function = SimpleNamespace(name=data.get("tool_name"), arguments=data["tool_arguments"])
+        tool_calls = [SimpleNamespace(type="function", function=function)]
+    message = SimpleNamespace(content=data.get("content"), tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_make_usage(data.get("usage")))
+
+
+def _split_for_stream(text: str) -> list[str]:
+    words = text.split(" ")
+    return [
+        " ".join(words[i:i + FAKE_STREAM_CHUNK_WORDS]) + (" " if i + FAKE_STREAM_CHUNK_WORDS < len(words) else "")
+        for i in range(0, len(words), FAKE_STREAM_CHUNK_WORDS)
+    ]
+
+
+def _make_stream_chunks(data: dict) -> list:
+    chunks = [
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        for piece in _split_for_stream(data.get("content") or "")
+    ]
+    # Come con include_usage: l'ultimo chunk non ha choices e riporta i token
+    chunks.append(SimpleNamespace(choices=[], usage=_make_usage(data.get("usage"))))
+    return chunks
+
+
+def _response_to_fixture_data(response) -> dict:
+    message = response.choices[0].message if response.choices else None
+    data = {"content": getattr(message, "content", None)}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        data["tool_name"] = tool_calls[0].function.name
+        data["tool_arguments"] = tool_calls[0].function.arguments
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        data["usage"] = {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
+        }
+    return data
+
+
+class LLMBackend:
+    """
+    Punto unico da cui passano tutte le richieste verso il provider. llm_service gli passa
+    la funzione che esegue la chiamata reale, usata solo nei modi live e record.
+    """
+    def __init__(
+        self,
+        mode: str = LLM_BACKEND,
+        fixtures_dir: str = LLM_FIXTURES_DIR,
+        latency_s: Optional[float] = None,
+        latency_scale: float = LLM_SYNTHETIC_LATENCY_SCALE,
+        on_missing: str = LLM_REPLAY_ON_MISSING
+    ):
+        if mode not in LLM_BACKEND_MODES:
+            raise ValueError(f"Backend LLM '{mode}' non valido. Valori ammessi: {', '.join(LLM_BACKEND_MODES)}")
+        self.mode = mode
+        self.fixtures_dir = fixtures_dir
+        if latency_s is None and LLM_SYNTHETIC_LATENCY_SECONDS is not None:
+            latency_s = float(LLM_SYNTHETIC_LATENCY_SECONDS)
+        self.latency_s = latency_s
+        self.latency_scale = latency_scale
+        self.on_missing = on_missing
+        self._write_lock = threading.Lock()
+
+    @property
+    def requires_client(self) -> bool:
+        """True se il backend ha bisogno del client OpenAI (e quindi della chiave API)."""
+        return self.mode in ("live", "record")
+
+    # --- Fixture ---
+
+    def _fixture_path(self, key: str) -> str:
+        return os.path.join(self.fixtures_dir, f"{key}.json")
+
+    def _save_fixture(self, api_kwargs: dict, data: dict, latency_s: float, call_site: Optional[str]):
+        key = fixture_key(api_kwargs)
+        fixture = {
+            "key": key,
+            "call_site": call_site,
+            "model": api_kwargs.get("model"),
+            "latency_s": round(latency_s, 4),
+            "request": {k: v for k, v in api_kwargs.items() if k not in _NON_SEMANTIC_KWARGS},
+            "response": data,
+        }
+        try:
+            with self._write_lock:
+                os.makedirs(self.fixtures_dir, exist_ok=True)
+                tmp_path = self._fixture_path(key) + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(fixture, f, ensure_ascii=False, indent=2, default=str)
+                os.replace(tmp_path, self._fixture_path(key))
+        except OSError as e:
+            print(f"Avviso: impossibile salvare la fixture LLM {key}: {e}")
+
+    def _load_fixture(self, api_kwargs: dict) -> dict:
+        key = fixture_key(api_kwargs)
+        try:
+            with open(self._fixture_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise FixtureNotFoundError(f"Nessuna fixture LLM per la richiesta {key} in '{self.fixtures_dir}'.")
+
+    # --- Risposte offline ---
+
+    def _fake_data(self, api_kwargs: dict, call_site: Optional[str]) -> dict:
+        tools = api_kwargs.get("tools")
+        if tools:
+            function = tools[0]["function"]
+            arguments = fake_from_schema(function.get("parameters", {}))
+            return {"content": None, "tool_name": function["name"], "tool_arguments": json.dumps(arguments, ensure_ascii=False)}
+        return {"content": FAKE_TEXT_RESPONSES.get(call_site, FAKE_DEFAULT_TEXT)}
+
+    def _offline_data(self, api_kwargs: dict, call_site: Optional[str]) -> tuple[dict, float]:
+        """Restituisce (dati della risposta, latenza sintetica da simulare)."""
+        if self.mode == "fake":
+            return self._fake_data(api_kwargs, call_site), self.latency_s or 0.0
+        try:
+            fixture = self._load_fixture(api_kwargs)
+        except FixtureNotFoundError:
+            if self.on_missing != "fake":
+                raise
+            return self._fake_data(api_kwargs, call_site), self.latency_s or 0.0
+        latency = self.latency_s if self.latency_s is not None else fixture.get("latency_s", 0.0)
+        return fixture["response"], latency * self.latency_scale
+
+    # --- Interfaccia usata da llm_service ---
+
+    def create(self, api_kwargs: dict, live_fn: Callable, call_site: Optional[str] = None):
+        """Esegue una richiesta non in streaming e restituisce un oggetto risposta."""
+        if self.mode == "live":
+            return live_fn()
+        if self.mode == "record":
+            started_at = time.perf_counter()
+            response = live_fn()
+            self._save_fixture(api_kwargs, _response_to_fixture_data(response), time.perf_counter() - started_at, call_site)
+            return response
+        data, latency = self._offline_data(api_kwargs, call_site)
+        time.sleep(latency)
+        return _make_response(data)
+
+    async def acreate(self, api_kwargs: dict, live_coro_fn: Callable, call_site: Optional[str] = None):
+        """Controparte asincrona di create: live_coro_fn() deve restituire una coroutine."""
+        if self.mode == "live":
+            return await live_coro_fn()
+        if self.mode == "record":
+            started_at = time.perf_counter()
+            response = await live_coro_fn()
+            self._save_fixture(api_kwargs, _response_to_fixture_data(response), time.perf_counter() - started_at, call_site)
+            return response
+        data, latency = self._offline_data(api_kwargs, call_site)
+        await asyncio.sleep(latency)
+        return _make_response(data)
+
+    def stream(self, api_kwargs: dict, live_fn: Callable, call_site: Optional[str] = None) -> Iterator:
+        """Apre una richiesta in streaming e restituisce l'iterabile dei chunk."""
+        if self.mode == "live":
+            return live_fn()
+        if self.mode == "record":
+            return self._record_stream(api_kwargs, live_fn(), call_site)
+        data, latency = self._offline_data(api_kwargs, call_site)
+        return self._replay_stream(data, latency)
+
+    def _record_stream(self, api_kwargs: dict, stream, call_site: Optional[str]) -> Iterator:
+        started_at = time.perf_counter()
+        pieces, usage = [], None
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                pieces.append(chunk.choices[0].delta.content)
+            yield chunk
+        # La fixture si salva solo se lo stream è arrivato fino in fondo
+        data = {"content": "".join(pieces)}
+        if usage is not None:
+            data["usage"] = {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+            }
+        self._save_fixture(api_kwargs, data, time.perf_counter() - started_at, call_site)
+
+    def _replay_stream(self, data: dict, latency: float) -> Iterator:
+        chunks = _make_stream_chunks(data)
+        # La latenza viene distribuita sui chunk, per simulare il tempo al primo token
+        delay = latency / len(chunks)
+        for chunk in chunks:
+            time.sleep(delay)
+            yield chunk
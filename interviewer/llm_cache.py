@@ -0,0 +1,140 @@
+# interviewer/llm_cache.py
+# Scopo: Cache persistente (SQLite) delle risposte LLM, indirizzata per contenuto della richiesta.
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Optional
+
+# --- CONFIGURAZIONE ---
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join("data", "cache", "llm_responses.sqlite3"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+
+def make_request_key(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    tool_schema: Optional[dict] = None,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    **extra
+) -> str:
+    """
+    Calcola l'hash SHA-256 che identifica univocamente una richiesta LLM.
+    Eventuali parametri aggiuntivi (es. tool_name, top_p) entrano anch'essi nella chiave.
+    """
+    payload = {
+        "model": model,
+        "system_prompt": system_prompt,
+        "prompt": prompt,
+        "tool_schema": tool_schema,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "extra": extra,
+    }
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Cache su file SQLite con scadenza (TTL) ed eviction LRU a numero massimo di voci.
+    È thread-safe e può essere condivisa da più processi sullo stesso file (WAL).
+    """
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # Apertura pigra: il file viene creato solo al primo utilizzo effettivo della cache
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Restituisce il valore in cache (aggiornandone l'ultimo accesso) o None."""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+                return row[0]
+        except sqlite3.Error as e:
+            print(f"Avviso: lettura dalla cache LLM fallita: {e}")
+            return None
+
+    def set(self, key: str, value: str):
+        """Salva una risposta e applica l'eviction LRU se si supera il numero massimo di voci."""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Avviso: scrittura nella cache LLM fallita: {e}")
+
+    def clear(self):
+        with self._lock:
+            conn = self._get_connection()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Contatori di hit/miss del processo corrente e numero di voci presenti su disco."""
+        entries = None
+        try:
+            with self._lock:
+                entries = self._get_connection().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        except sqlite3.Error:
+            pass
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": entries,
+        }
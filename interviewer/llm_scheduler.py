@@ -0,0 +1,252 @@
+# interviewer/llm_scheduler.py
+# Scopo: Scheduler centrale delle chiamate OpenAI: budget RPM/TPM per modello (token bucket),
+#        retry con backoff esponenziale e jitter sugli errori 429/5xx, fallimenti tipizzati.
+
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Callable, Optional
+
+import openai
+
+# --- CONFIGURAZIONE ---
+# Budget di default per modello (richieste e token al minuto). Si possono sovrascrivere con la
+# variabile d'ambiente LLM_RATE_LIMITS, es: '{"gpt-4.1-2025-04-14": {"rpm": 500, "tpm": 30000}}'
+DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+MODEL_RATE_LIMITS = {
+    "gpt-4.1-2025-04-14": {"rpm": DEFAULT_RPM, "tpm": DEFAULT_TPM},
+    "gpt-4o-mini": {"rpm": DEFAULT_RPM, "tpm": DEFAULT_TPM},
+}
+try:
+    MODEL_RATE_LIMITS.update(json.loads(os.getenv("LLM_RATE_LIMITS", "{}")))
+except ValueError:
+    print("Avviso: LLM_RATE_LIMITS non è un JSON valido, uso i limiti di default.")
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+# Token di output stimati quando il call site non specifica max_tokens
+DEFAULT_COMPLETION_TOKENS_ESTIMATE = 1024
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMFailure(str):
+    """
+    Esito fallito di una chiamata LLM.
+
+    Per compatibilità resta una stringa "Errore: ..." (i call site esistenti che cercano
+    "Errore" nel testo continuano a funzionare), ma è valutata come False e porta con sé
+    il motivo del fallimento. Usare is_llm_failure() per distinguerla da una risposta valida.
+    """
+    def __new__(cls, message: str, reason: str = "error", status_code: Optional[int] = None, retryable: bool = False):
+        failure = super().__new__(cls, f"Errore: {message}")
+        failure.reason = reason
+        failure.status_code = status_code
+        failure.retryable = retryable
+        return failure
+
+    def __bool__(self):
+        return False
+
+
+def is_llm_failure(value) -> bool:
+    """True se il valore restituito da llm_service rappresenta una chiamata fallita."""
+    return isinstance(value, LLMFailure)
+
+
+def estimate_tokens(messages: list[dict], max_tokens: Optional[int] = None) -> int:
+    """Stima grossolana (4 caratteri per token) dei token consumati da una richiesta."""
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return prompt_chars // 4 + (max_tokens or DEFAULT_COMPLETION_TOKENS_ESTIMATE)
+
+
+def classify_exception(e: Exception) -> tuple[bool, Optional[int], str]:
+    """Restituisce (ritentabile, status_code, motivo) per un'eccezione del client OpenAI."""
+    if isinstance(e, openai.APITimeoutError):
+        return True, None, "timeout"
+    if isinstance(e, openai.APIConnectionError):
+        return True, None, "connection"
+    if isinstance(e, openai.APIStatusError):
+        status_code = e.status_code
+        # Il 429 per credito esaurito non si risolve aspettando
+        if status_code == 429 and getattr(e, "code", None) == "insufficient_quota":
+            return False, status_code, "insufficient_quota"
+        if status_code == 429:
+            return True, status_code, "rate_limited"
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500, status_code, "api_status"
+    return False, None, "error"
+
+
+def failure_from_exception(e: Exception) -> LLMFailure:
+    retryable, status_code, reason = classify_exception(e)
+    return LLMFailure(str(e), reason=reason, status_code=status_code, retryable=retryable)
+
+
+def _retry_after_seconds(e: Exception) -> Optional[float]:
+    """Legge l'header Retry-After (se presente) dalla risposta di errore."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for header in ("retry-after-ms", "retry-after"):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+            return seconds / 1000 if header == "retry-after-ms" else seconds
+        except ValueError:
+            continue
+    return None
+
+
+def backoff_delay(attempt: int, e: Optional[Exception] = None) -> float:
+    """Backoff esponenziale con full jitter, rispettando Retry-After se indicato dal provider."""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    retry_after = _retry_after_seconds(e) if e is not None else None
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class _TokenBucket:
+    """Bucket che si ricarica linearmente fino a 'capacity' unità al minuto."""
+    def __init__(self, capacity: int):
+        self.capacity = float(capacity)
+        self.available = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.available = min(self.capacity, self.available + elapsed * self.capacity / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) * 60.0 / self.capacity
+
+    def consume(self, amount: float):
+        self.available -= min(amount, self.capacity)
+
+
+class RateLimitScheduler:
+    """
+    Tiene traccia dei budget RPM/TPM per modello e fa attendere le chiamate quanto basta per
+    restare entro i limiti del provider, invece di usare pause fisse.
+    """
+    def __init__(self, limits: Optional[dict] = None):
+        self._limits = dict(limits or MODEL_RATE_LIMITS)
+        self._buckets = {}
+        self._paused_until = {}
+        self._lock = threading.Lock()
+
+    def configure(self, model: str, rpm: int, tpm: int):
+        """Imposta (o aggiorna) i budget di un modello."""
+        with self._lock:
+            self._limits[model] = {"rpm": rpm, "tpm": tpm}
+            self._buckets.pop(model, None)
+
+    def _get_buckets(self, model: str) -> tuple[_TokenBucket, _TokenBucket]:
+        if model not in self._buckets:
+            limits = self._limits.get(model, {"rpm": DEFAULT_RPM, "tpm": DEFAULT_TPM})
+            self._buckets[model] = (_TokenBucket(limits["rpm"]), _TokenBucket(limits["tpm"]))
+        return self._buckets[model]
+
+    def _try_reserve(self, model: str, tokens: int) -> float:
+        """Prenota una richiesta; restituisce 0 se concessa, altrimenti i secondi da attendere."""
+        now = time.monotonic()
+        with self._lock:
+            pause = self._paused_until.get(model, 0.0) - now
+            if pause > 0:
+                return pause
+            requests_bucket, tokens_bucket = self._get_buckets(model)
+            wait = max(requests_bucket.wait_time(1, now), tokens_bucket.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+            requests_bucket.consume(1)
+            tokens_bucket.consume(tokens)
+            return 0.0
+
+    def acquire(self, model: str, tokens: int):
+        """Blocca il thread finché la richiesta non rientra nel budget del modello."""
+        while True:
+            wait = self._try_reserve(model, tokens)
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 1.0))
+
+    async def aacquire(self, model: str, tokens: int):
+        """Come acquire, ma senza bloccare l'event loop."""
+        while True:
+            wait = self._try_reserve(model, tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def record_usage(self, model: str, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Corregge il budget TPM con i token effettivi riportati da response.usage."""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            _, tokens_bucket = self._get_buckets(model)
+            tokens_bucket.consume(actual_tokens - estimated_tokens)
+
+    def pause(self, model: str, seconds: float):
+        """Sospende tutte le chiamate verso un modello (es. dopo un 429 con Retry-After)."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), until)
+
+    def call(self, model: str, estimated_tokens: int, request_fn: Callable):
+        """
+        Esegue request_fn() rispettando i budget e ritentando 429/5xx con backoff.
+        Rilancia l'ultima eccezione se i tentativi si esauriscono o l'errore non è ritentabile.
+        """
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            self.acquire(model, estimated_tokens)
+            try:
+                response = request_fn()
+            except Exception as e:
+                retryable, status_code, _ = classify_exception(e)
+                if not retryable or attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, e)
+                if status_code == 429:
+                    self.pause(model, delay)
+                print(f"Avviso: chiamata LLM fallita ({e.__class__.__name__}), nuovo tentativo tra {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+            self.record_usage(model, estimated_tokens, _total_tokens(response))
+            return response
+
+    async def acall(self, model: str, estimated_tokens: int, request_coro_fn: Callable):
+        """Controparte asincrona di call: request_coro_fn() deve restituire una coroutine."""
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self.aacquire(model, estimated_tokens)
+            try:
+                response = await request_coro_fn()
+            except Exception as e:
+                retryable, status_code, _ = classify_exception(e)
+                if not retryable or attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, e)
+                if status_code == 429:
+                    self.pause(model, delay)
+                print(f"Avviso: chiamata LLM fallita ({e.__class__.__name__}), nuovo tentativo tra {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                continue
+            self.record_usage(model, estimated_tokens, _total_tokens(response))
+            return response
+
+
+def _total_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
@@ -1,8 +1,20 @@
 import os
+import time
+import asyncio
+import threading
+import contextvars
+import weakref
+import collections
+from contextlib import asynccontextmanager
 import streamlit as st
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Callable, Iterator, Optional
+from .llm_cache import LLMResponseCache, make_request_key
+from .llm_scheduler import RateLimitScheduler, LLMFailure, is_llm_failure, estimate_tokens, failure_from_exception
+from .llm_telemetry import telemetry, llm_call_context, track_llm_session
+from .llm_backends import LLMBackend, fixture_key as request_fingerprint
+from .llm_singleflight import SingleFlight
 
 # Carica le variabili dal file .env se presente (per lo sviluppo locale)
 load_dotenv()
@@ -22,67 +34,178 @@ if not API_KEY:
 # --- FINE LOGICA ROBUSTA ---
 
 
+# Backend delle chiamate: live (default), record, replay o fake (vedi llm_backends.py)
+backend = LLMBackend()
+if backend.mode != "live":
+    print(f"Backend LLM attivo: '{backend.mode}' (fixture in '{backend.fixtures_dir}').")
+
 # Inizializza il client OpenAI solo se la chiave API è stata trovata
 client = None
-if not API_KEY:
+if not API_KEY and backend.requires_client:
     print("❌ ERRORE CRITICO: OPENAI_API_KEY non trovata. Controlla i secrets in cloud o il file .env in locale.")
     try:
         # Mostra un errore nella UI solo se l'app sta girando
         st.error("Configurazione Mancante: La chiave API di OpenAI non è stata trovata.")
     except Exception:
         pass 
-else:
-    client = OpenAI(api_key=API_KEY)
+elif API_KEY:
+    # I retry sono gestiti dallo scheduler (backoff con jitter e budget per modello)
+    client = OpenAI(api_key=API_KEY, max_retries=0)
+
+# Scheduler condiviso da tutte le chiamate del processo (sincrone e asincrone)
+scheduler = RateLimitScheduler()
+
+# --- CONFIGURAZIONE DEL CLIENT ASINCRONO ---
+# Numero massimo di chiamate LLM asincrone in volo contemporaneamente nel processo.
+# Il limite è condiviso da tutti gli event loop (es. più sessioni Streamlit in parallelo).
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
 
-def get_llm_response(prompt: str, model: str, system_prompt: str, **kwargs) -> str:
+class _AsyncSlots:
     """
-    Invia un prompt per una risposta testuale semplice.
+    Semaforo condiviso da tutti gli event loop del processo. Chi attende non fa polling:
+    registra un future del proprio loop e viene risvegliato quando uno slot si libera.
     """
-    # Controlla se il client è stato inizializzato correttamente
-    if client is None:
-        return "Errore: Il servizio LLM non è configurato a causa di una chiave API mancante."
+    def __init__(self, limit: int):
+        self._available = limit
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": prompt}
-    ]
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            **kwargs 
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Errore nella chiamata LLM testuale: {e}")
-        return f"Errore: {e}"
+    async def acquire(self):
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    waiter = None
+            # Slot già assegnato a un'attesa annullata: passa al prossimo (se il future è stato
+            # annullato prima della consegna, lo restituisce _hand_over)
+            if waiter is not None and waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
 
-def get_structured_llm_response(
-    prompt: str, 
-    model: str, 
-    system_prompt: str, 
-    tool_name: str, 
-    tool_schema: dict,
-    temperature: Optional[float] = None,  # <-- Parametro opzionale
-    max_tokens: Optional[int] = None      # <-- Nuovo parametro opzionale
-) -> Optional[str]:
-    """
-    Invia un prompt forzando un output strutturato tramite la definizione di un tool.
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    # Lo slot passa direttamente a chi attende, nel thread del suo loop
+                    waiter.get_loop().call_soon_threadsafe(self._hand_over, waiter)
+                    return
+                except RuntimeError:
+                    # Loop già chiuso: l'attesa non può più essere servita
+                    continue
+            self._available += 1
 
-    Accetta parametri opzionali come 'temperature' e 'max_tokens'. Se non vengono
-    forniti, non vengono inviati all'API, che utilizzerà i propri valori di default.
+    def _hand_over(self, waiter):
+        if waiter.cancelled():
+            self.release()
+        else:
+            waiter.set_result(None)
+
+
+_concurrency_slots = _AsyncSlots(LLM_MAX_CONCURRENCY)
+
+# Un AsyncOpenAI per event loop: il pool di connessioni httpx è legato al loop che lo ha creato.
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
 
-    Restituisce gli argomenti della funzione chiamata come stringa JSON.
+def configure_rate_limits(model: str, rpm: int, tpm: int):
+    """Imposta i budget di richieste e token al minuto per un modello."""
+    scheduler.configure(model, rpm, tpm)
+
+def configure_llm_backend(mode: str, **options):
     """
-    # Controlla se il client è stato inizializzato correttamente
-    if client is None:
-        print("Errore: Il servizio LLM non è configurato a causa di una chiave API mancante.")
+    Cambia il backend delle chiamate LLM a runtime (es. nei benchmark offline).
+    options: fixtures_dir, latency_s, latency_scale, on_missing.
+    """
+    global backend
+    backend = LLMBackend(mode, **options)
+    return backend
+
+def llm_backend_is_offline() -> bool:
+    """True con i backend replay e fake: le risposte non vengono dal modello reale."""
+    return not backend.requires_client
+
+def _llm_unavailable() -> bool:
+    """True se serve il client OpenAI ma la chiave API non è configurata."""
+    return backend.requires_client and not API_KEY
+
+def set_llm_max_concurrency(limit: int):
+    """Modifica il limite di chiamate LLM asincrone contemporanee per il processo."""
+    global LLM_MAX_CONCURRENCY, _concurrency_slots
+    if limit < 1:
+        raise ValueError("Il limite di concorrenza deve essere almeno 1.")
+    LLM_MAX_CONCURRENCY = limit
+    _concurrency_slots = _AsyncSlots(limit)
+
+def _get_async_client() -> AsyncOpenAI | None:
+    """Restituisce il client asincrono associato all'event loop corrente."""
+    if not API_KEY:
         return None
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        async_client = _async_clients.get(loop)
+        if async_client is None:
+            async_client = AsyncOpenAI(api_key=API_KEY, max_retries=0)
+            _async_clients[loop] = async_client
+    return async_client
+
+# Cache persistente delle risposte: opt-in per singolo call site tramite use_cache=True.
+response_cache = LLMResponseCache()
+
+def get_llm_cache_stats() -> dict:
+    """Restituisce i contatori hit/miss della cache delle risposte LLM."""
+    return response_cache.stats()
+
+# Richieste identiche contemporanee (stesso modello, prompt e parametri) condividono una sola chiamata.
+single_flight = SingleFlight()
+
+def get_llm_single_flight_stats() -> dict:
+    """Restituisce quante richieste sono state servite condividendo una chiamata già in volo."""
+    return single_flight.stats()
 
-    messages = [
+def get_session_llm_summary(session_id: str) -> dict:
+    """Riepilogo di latenze e token delle chiamate LLM di una sessione, per call site."""
+    return telemetry.summarize_session(session_id)
+
+def flush_llm_telemetry():
+    """Forza la scrittura su MongoDB dei record di telemetria ancora in memoria."""
+    telemetry.flush()
+
+@asynccontextmanager
+async def _concurrency_slot():
+    """Attende uno slot libero senza bloccare l'event loop."""
+    slots = _concurrency_slots
+    await slots.acquire()
+    try:
+        yield
+    finally:
+        slots.release()
+
+def _build_messages(prompt: str, system_prompt: str) -> list[dict]:
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": prompt}
     ]
+
+def _build_structured_kwargs(
+    prompt: str,
+    model: str,
+    system_prompt: str,
+    tool_name: str,
+    tool_schema: dict,
+    temperature: Optional[float],
+    max_tokens: Optional[int]
+) -> dict:
+    """Prepara gli argomenti della chiamata API per l'output strutturato tramite tool."""
     tools = [
         {
             "type": "function",
@@ -98,7 +221,7 @@ def get_structured_llm_response(
     # Iniziamo con quelli obbligatori
     api_kwargs = {
         "model": model,
-        "messages": messages,
+        "messages": _build_messages(prompt, system_prompt),
         "tools": tools,
         "tool_choice": {"type": "function", "function": {"name": tool_name}}
     }
@@ -108,18 +231,306 @@ def get_structured_llm_response(
         api_kwargs['temperature'] = temperature
     if max_tokens is not None:
         api_kwargs['max_tokens'] = max_tokens
-        
-    try:
-        # Usiamo l'unpacking del dizionario (**) per passare tutti gli argomenti
-        response = client.chat.completions.create(**api_kwargs)
-        
-        if response.choices and response.choices[0].message.tool_calls:
-            arguments = response.choices[0].message.tool_calls[0].function.arguments
-            return arguments
-        else:
-            print("Errore: La risposta dell'LLM non ha chiamato la funzione richiesta o è vuota.")
-            return None
+    return api_kwargs
 
+def _extract_tool_arguments(response) -> str:
+    if response.choices and response.choices[0].message.tool_calls:
+        return response.choices[0].message.tool_calls[0].function.arguments
+    print("Errore: La risposta dell'LLM non ha chiamato la funzione richiesta o è vuota.")
+    return LLMFailure("La risposta dell'LLM non ha chiamato la funzione richiesta o è vuota.", reason="missing_tool_call")
+
+MISSING_API_KEY_FAILURE = "Il servizio LLM non è configurato a causa di una chiave API mancante."
+
+def _extract_text(response) -> str:
+    return response.choices[0].message.content.strip()
+
+def _usage_tokens(usage) -> tuple[Optional[int], Optional[int]]:
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+def _record_call(model: str, started_at: float, call_site: Optional[str], usage=None, result=None, **flags):
+    """Registra latenza, token ed esito di una chiamata nella telemetria."""
+    prompt_tokens, completion_tokens = _usage_tokens(usage)
+    telemetry.record(
+        model=model,
+        latency_s=time.perf_counter() - started_at,
+        call_site=call_site,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        status="error" if is_llm_failure(result) else "ok",
+        **flags
+    )
+
+def _complete(api_kwargs: dict, parse: Callable, cache_key: Optional[str], call_site: Optional[str], error_label: str) -> str:
+    """
+    Percorso comune delle chiamate sincrone: cache (se richiesta), coalescenza delle richieste
+    identiche in volo, scheduler con retry, parsing della risposta e telemetria.
+    Gli errori diventano LLMFailure.
+    """
+    model = api_kwargs["model"]
+    started_at = time.perf_counter()
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            _record_call(model, started_at, call_site, cached=True)
+            return cached
+
+    def _fetch() -> tuple[str, object]:
+        estimated_tokens = estimate_tokens(api_kwargs["messages"], api_kwargs.get("max_tokens"))
+        response = None
+        try:
+            response = scheduler.call(
+                model, estimated_tokens,
+                lambda: backend.create(api_kwargs, lambda: client.chat.completions.create(**api_kwargs), call_site)
+            )
+            result = parse(response)
+        except Exception as e:
+            print(f"Errore nella chiamata LLM {error_label}: {e}")
+            result = failure_from_exception(e)
+        if cache_key and result:
+            response_cache.set(cache_key, result)
+        return result, getattr(response, "usage", None)
+
+    (result, usage), coalesced = single_flight.do(request_fingerprint(api_kwargs), _fetch)
+    # Solo la chiamata che ha interrogato il provider riporta i token consumati
+    _record_call(model, started_at, call_site, None if coalesced else usage, result, coalesced=coalesced)
+    return result
+
+async def _acomplete(api_kwargs: dict, parse: Callable, cache_key: Optional[str], call_site: Optional[str], error_label: str) -> str:
+    """Controparte asincrona di _complete, soggetta al limite di concorrenza del processo."""
+    model = api_kwargs["model"]
+    started_at = time.perf_counter()
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            _record_call(model, started_at, call_site, cached=True)
+            return cached
+
+    async_client = _get_async_client()
+    estimated_tokens = estimate_tokens(api_kwargs["messages"], api_kwargs.get("max_tokens"))
+
+    async def _request():
+        # Lo slot di concorrenza è occupato solo durante la richiesta, non durante il backoff
+        async with _concurrency_slot():
+            return await backend.acreate(api_kwargs, lambda: async_client.chat.completions.create(**api_kwargs), call_site)
+
+    async def _fetch() -> tuple[str, object]:
+        response = None
+        try:
+            response = await scheduler.acall(model, estimated_tokens, _request)
+            result = parse(response)
+        except Exception as e:
+            print(f"Errore nella chiamata LLM {error_label} (async): {e}")
+            result = failure_from_exception(e)
+        if cache_key and result:
+            response_cache.set(cache_key, result)
+        return result, getattr(response, "usage", None)
+
+    (result, usage), coalesced = await single_flight.ado(request_fingerprint(api_kwargs), _fetch)
+    _record_call(model, started_at, call_site, None if coalesced else usage, result, coalesced=coalesced)
+    return result
+
+def get_llm_response(prompt: str, model: str, system_prompt: str, use_cache: bool = False, call_site: Optional[str] = None, **kwargs) -> str:
+    """
+    Invia un prompt per una risposta testuale semplice.
+    Con use_cache=True la risposta viene letta/salvata nella cache persistente.
+    call_site etichetta la chiamata nella telemetria (es. "chatbot.evaluate_step").
+    In caso di errore restituisce un LLMFailure (vedi is_llm_failure).
+    """
+    # Controlla se il client è stato inizializzato correttamente
+    if _llm_unavailable():
+        return LLMFailure(MISSING_API_KEY_FAILURE, reason="missing_api_key")
+
+    cache_key = make_request_key(model, system_prompt, prompt, **kwargs) if use_cache else None
+    api_kwargs = {"model": model, "messages": _build_messages(prompt, system_prompt), **kwargs}
+    return _complete(api_kwargs, _extract_text, cache_key, call_site, "testuale")
+
+def stream_llm_response(prompt: str, model: str, system_prompt: str, call_site: Optional[str] = None, **kwargs) -> Iterator[str]:
+    """
+    Variante in streaming di get_llm_response: restituisce un generatore che produce i
+    frammenti di testo man mano che arrivano dal modello (es. per st.write_stream).
+    In caso di errore il generatore produce un unico LLMFailure.
+    """
+    if _llm_unavailable():
+        yield LLMFailure(MISSING_API_KEY_FAILURE, reason="missing_api_key")
+        return
+
+    api_kwargs = {
+        "model": model, "messages": _build_messages(prompt, system_prompt),
+        "stream": True, "stream_options": {"include_usage": True}, **kwargs
+    }
+    estimated_tokens = estimate_tokens(api_kwargs["messages"], kwargs.get("max_tokens"))
+    started_at = time.perf_counter()
+    usage = None
+    failure = None
+    try:
+        # I retry dello scheduler coprono l'apertura dello stream, non un'interruzione a metà
+        stream = scheduler.call(
+            model, estimated_tokens,
+            lambda: backend.stream(api_kwargs, lambda: client.chat.completions.create(**api_kwargs), call_site)
+        )
+        is_first_chunk = True
+        for chunk in stream:
+            # Con include_usage l'ultimo chunk non ha choices ma riporta i token consumati
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            if is_first_chunk:
+                # Come nella variante non in streaming, eliminiamo gli spazi iniziali
+                text = text.lstrip()
+                if not text:
+                    continue
+                is_first_chunk = False
+            yield text
     except Exception as e:
-        print(f"Errore nella chiamata LLM strutturata: {e}")
-        return None
\ No newline at end of file
+        print(f"Errore nella chiamata LLM in streaming: {e}")
+        failure = failure_from_exception(e)
+        yield failure
+    finally:
+        _record_call(model, started_at, call_site, usage, failure, streamed=True)
+
+def get_structured_llm_response(
+    prompt: str, 
+    model: str, 
+    system_prompt: str, 
+    tool_name: str, 
+    tool_schema: dict,
+    temperature: Optional[float] = None,  # <-- Parametro opzionale
+    max_tokens: Optional[int] = None,     # <-- Nuovo parametro opzionale
+    use_cache: bool = False,
+    call_site: Optional[str] = None
+) -> Optional[str]:
+    """
+    Invia un prompt forzando un output strutturato tramite la definizione di un tool.
+
+    Accetta parametri opzionali come 'temperature' e 'max_tokens'. Se non vengono
+    forniti, non vengono inviati all'API, che utilizzerà i propri valori di default.
+
+    Restituisce gli argomenti della funzione chiamata come stringa JSON. In caso di errore
+    restituisce un LLMFailure, che è valutato come False come il precedente None.
+    """
+    # Controlla se il client è stato inizializzato correttamente
+    if _llm_unavailable():
+        print("Errore: Il servizio LLM non è configurato a causa di una chiave API mancante.")
+        return LLMFailure(MISSING_API_KEY_FAILURE, reason="missing_api_key")
+
+    cache_key = make_request_key(model, system_prompt, prompt, tool_schema, temperature, max_tokens, tool_name=tool_name) if use_cache else None
+    api_kwargs = _build_structured_kwargs(prompt, model, system_prompt, tool_name, tool_schema, temperature, max_tokens)
+    return _complete(api_kwargs, _extract_tool_arguments, cache_key, call_site, "strutturata")
+
+# --- VARIANTI ASINCRONE (AsyncOpenAI) ---
+
+async def aget_llm_response(prompt: str, model: str, system_prompt: str, use_cache: bool = False, call_site: Optional[str] = None, **kwargs) -> str:
+    """
+    Controparte asincrona di get_llm_response: stessa firma e stessa semantica degli errori.
+    """
+    if _llm_unavailable():
+        return LLMFailure(MISSING_API_KEY_FAILURE, reason="missing_api_key")
+
+    cache_key = make_request_key(model, system_prompt, prompt, **kwargs) if use_cache else None
+    api_kwargs = {"model": model, "messages": _build_messages(prompt, system_prompt), **kwargs}
+    return await _acomplete(api_kwargs, _extract_text, cache_key, call_site, "testuale")
+
+async def aget_structured_llm_response(
+    prompt: str,
+    model: str,
+    system_prompt: str,
+    tool_name: str,
+    tool_schema: dict,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    use_cache: bool = False,
+    call_site: Optional[str] = None
+) -> Optional[str]:
+    """
+    Controparte asincrona di get_structured_llm_response.
+    """
+    if _llm_unavailable():
+        print("Errore: Il servizio LLM non è configurato a causa di una chiave API mancante.")
+        return LLMFailure(MISSING_API_KEY_FAILURE, reason="missing_api_key")
+
+    cache_key = make_request_key(model, system_prompt, prompt, tool_schema, temperature, max_tokens, tool_name=tool_name) if use_cache else None
+    api_kwargs = _build_structured_kwargs(prompt, model, system_prompt, tool_name, tool_schema, temperature, max_tokens)
+    return await _acomplete(api_kwargs, _extract_tool_arguments, cache_key, call_site, "strutturata")
+
+async def _gather_limited(coroutine_fn, requests: list[dict], max_concurrency: Optional[int]) -> list:
+    """Esegue coroutine_fn(**req) per ogni richiesta, restituendo i risultati nello stesso ordine."""
+    local_limit = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def _run_one(request: dict):
+        if local_limit is None:
+            return await coroutine_fn(**request)
+        async with local_limit:
+            return await coroutine_fn(**request)
+
+    return list(await asyncio.gather(*(_run_one(req) for req in requests)))
+
+async def gather_llm_responses(requests: list[dict], max_concurrency: Optional[int] = None) -> list[str]:
+    """
+    Lancia in parallelo N richieste testuali (ognuna è il dizionario di argomenti di
+    get_llm_response) e restituisce le N risposte nello stesso ordine.
+    """
+    return await _gather_limited(aget_llm_response, requests, max_concurrency)
+
+async def gather_structured_llm_responses(requests: list[dict], max_concurrency: Optional[int] = None) -> list[Optional[str]]:
+    """
+    Come gather_llm_responses, ma per richieste a get_structured_llm_response.
+    """
+    return await _gather_limited(aget_structured_llm_response, requests, max_concurrency)
+
+def _run_coroutine_sync(coroutine):
+    """
+    Esegue una coroutine dal codice sincrono. Se il thread corrente ha già un event loop
+    attivo, la coroutine viene eseguita in un thread dedicato con un loop proprio.
+    """
+    async def _run_and_close():
+        try:
+            return await coroutine
+        finally:
+            # Chiude il client legato a questo loop prima che asyncio.run lo distrugga
+            with _async_clients_lock:
+                async_client = _async_clients.pop(asyncio.get_running_loop(), None)
+            if async_client is not None:
+                await async_client.close()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_run_and_close())
+
+    result = {}
+    # Il thread di appoggio eredita sessione e call site correnti (vedi llm_call_context)
+    context = contextvars.copy_context()
+    def _worker():
+        try:
+            result["value"] = context.run(asyncio.run, _run_and_close())
+        except BaseException as e:
+            result["error"] = e
+    worker = threading.Thread(target=_worker, daemon=True)
+    worker.start()
+    worker.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+def get_llm_responses_batch(requests: list[dict], max_concurrency: Optional[int] = None) -> list[str]:
+    """
+    Versione sincrona di gather_llm_responses, utilizzabile dai call site esistenti.
+    Restituisce una risposta per ogni richiesta, nello stesso ordine.
+    """
+    if not requests:
+        return []
+    return _run_coroutine_sync(gather_llm_responses(requests, max_concurrency))
+
+def get_structured_llm_responses_batch(requests: list[dict], max_concurrency: Optional[int] = None) -> list[Optional[str]]:
+    """
+    Versione sincrona di gather_structured_llm_responses.
+    """
+    if not requests:
+        return []
+    return _run_coroutine_sync(gather_structured_llm_responses(requests, max_concurrency))
@@ -0,0 +1,156 @@
+# interviewer/llm_singleflight.py
+# Scopo: Coalescenza delle richieste LLM identiche in volo nello stesso processo ("single flight"):
+#        la prima esegue la chiamata, le altre ne attendono il risultato invece di ripeterla.
+
+import os
+import asyncio
+import threading
+from typing import Awaitable, Callable
+
+# --- CONFIGURAZIONE ---
+LLM_SINGLE_FLIGHT_ENABLED = os.getenv("LLM_SINGLE_FLIGHT", "1") != "0"
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # True se il leader non ha concluso la richiesta (es. annullato): chi attende riprova
+        self.abandoned = False
+        self.waiters = 0
+        # Future degli event loop in attesa, completati all'atterraggio del volo
+        self._async_waiters = []
+        self._lock = threading.Lock()
+
+    def async_waiter(self) -> asyncio.Future:
+        """Future del loop corrente, completato quando il volo atterra (il leader può girare altrove)."""
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            if not self.done.is_set():
+                self._async_waiters.append(future)
+                return future
+        future.set_result(None)
+        return future
+
+    def land(self):
+        with self._lock:
+            self.done.set()
+            async_waiters, self._async_waiters = self._async_waiters, []
+        for future in async_waiters:
+            try:
+                future.get_loop().call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # Loop già chiuso: nessuno attende più su quel future
+                pass
+
+
+class SingleFlight:
+    """
+    Tabella delle richieste in corso, condivisa da thread ed event loop diversi.
+    Complementare alla cache persistente: copre le richieste identiche contemporanee,
+    prima che la risposta sia disponibile in cache.
+    Si condividono il risultato o un'eccezione della richiesta; se il leader viene annullato
+    (CancelledError, KeyboardInterrupt...) chi attende non eredita l'annullamento: uno di loro
+    diventa il nuovo leader e ripete la richiesta.
+    """
+    def __init__(self, enabled: bool = LLM_SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self.leaders = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _join_or_lead(self, key: str) -> tuple[_Flight, bool]:
+        """Restituisce (volo, True se il chiamante deve eseguire la richiesta)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def _land(self, key: str, flight: _Flight, result=None, error: Exception = None, abandoned: bool = False):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if abandoned:
+                # Chi attendeva ripete la richiesta: non conta come chiamata coalescente
+                self.coalesced -= flight.waiters
+        flight.result = result
+        flight.error = error
+        flight.abandoned = abandoned
+        flight.land()
+
+    @staticmethod
+    def _outcome(flight: _Flight):
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do(self, key: str, fn: Callable) -> tuple[object, bool]:
+        """
+        Esegue fn() una sola volta per chiave tra i chiamanti contemporanei.
+        Restituisce (risultato, True se il risultato è stato condiviso da un'altra chiamata).
+        """
+        if not self.enabled:
+            return fn(), False
+        while True:
+            flight, is_leader = self._join_or_lead(key)
+            if is_leader:
+                break
+            flight.done.wait()
+            if not flight.abandoned:
+                return self._outcome(flight), True
+        try:
+            result = fn()
+        except Exception as e:
+            self._land(key, flight, error=e)
+            raise
+        except BaseException:
+            self._land(key, flight, abandoned=True)
+            raise
+        self._land(key, flight, result=result)
+        return result, False
+
+    async def ado(self, key: str, coro_fn: Callable[[], Awaitable]) -> tuple[object, bool]:
+        """Controparte asincrona di do: l'attesa non blocca l'event loop."""
+        if not self.enabled:
+            return await coro_fn(), False
+        while True:
+            flight, is_leader = self._join_or_lead(key)
+            if is_leader:
+                break
+            await flight.async_waiter()
+            if not flight.abandoned:
+                return self._outcome(flight), True
+        try:
+            result = await coro_fn()
+        except Exception as e:
+            self._land(key, flight, error=e)
+            raise
+        except BaseException:
+            self._land(key, flight, abandoned=True)
+            raise
+        self._land(key, flight, result=result)
+        return result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._flights)
+        total = self.leaders + self.coalesced
+        return {
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+            "in_flight": in_flight,
+        }
@@ -0,0 +1,190 @@
+# interviewer/llm_telemetry.py
+# Scopo: Telemetria per singola chiamata LLM (latenza, token, modello, call site, sessione),
+#        aggregata in memoria e scritta a lotti su una collection MongoDB.
+
+import time
+import atexit
+import functools
+import inspect
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+# --- CONFIGURAZIONE ---
+TELEMETRY_COLLECTION_NAME = "llm_telemetry"
+TELEMETRY_FLUSH_BATCH_SIZE = 50
+TELEMETRY_FLUSH_INTERVAL_SECONDS = 30
+# Oltre questa soglia, se Mongo non è raggiungibile, i record più vecchi vengono scartati
+TELEMETRY_MAX_BUFFERED_RECORDS = 5000
+
+_current_session_id = contextvars.ContextVar("llm_session_id", default=None)
+_current_call_site = contextvars.ContextVar("llm_call_site", default=None)
+
+
+@contextmanager
+def llm_call_context(session_id: Optional[str] = None, call_site: Optional[str] = None):
+    """
+    Associa sessione e/o call site a tutte le chiamate LLM eseguite nel blocco
+    (anche quelle fatte in profondità, senza doverli passare come argomenti).
+    """
+    tokens = []
+    if session_id is not None:
+        tokens.append((_current_session_id, _current_session_id.set(session_id)))
+    if call_site is not None:
+        tokens.append((_current_call_site, _current_call_site.set(call_site)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def track_llm_session(func):
+    """Decoratore: le chiamate LLM eseguite dalla funzione vengono attribuite al suo argomento 'session_id'."""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        session_id = signature.bind_partial(*args, **kwargs).arguments.get("session_id")
+        with llm_call_context(session_id=session_id):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class LLMTelemetry:
+    """Raccoglie i record delle chiamate e li scrive su MongoDB in background, a lotti."""
+    def __init__(self, collection_name: str = TELEMETRY_COLLECTION_NAME):
+        self.collection_name = collection_name
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        # Un solo flush in background alla volta; dopo un flush fallito si riprova solo a intervallo scaduto
+        self._flush_in_progress = False
+        self._retry_not_before = 0.0
+
+    def record(
+        self,
+        model: str,
+        latency_s: float,
+        call_site: Optional[str] = None,
+        session_id: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        status: str = "ok",
+        cached: bool = False,
+        streamed: bool = False,
+        coalesced: bool = False
+    ):
+        record = {
+            "timestamp": datetime.now(timezone.utc),
+            "session_id": session_id or _current_session_id.get(),
+            "call_site": call_site or _current_call_site.get() or "non_etichettato",
+            "model": model,
+            "latency_s": round(latency_s, 4),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "status": status,
+            "cached": cached,
+            "streamed": streamed,
+            "coalesced": coalesced,
+        }
+        now = time.monotonic()
+        with self._lock:
+            self._buffer.append(record)
+            should_flush = (
+                not self._flush_in_progress
+                and now >= self._retry_not_before
+                and (
+                    len(self._buffer) >= TELEMETRY_FLUSH_BATCH_SIZE
+                    or now - self._last_flush >= TELEMETRY_FLUSH_INTERVAL_SECONDS
+                )
+            )
+            if should_flush:
+                self._flush_in_progress = True
+        if should_flush:
+            # La scrittura avviene fuori dal percorso critico della chiamata LLM
+            threading.Thread(target=self._background_flush, daemon=True).start()
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._flush_in_progress = False
+
+    def flush(self):
+        """Scrive su MongoDB i record accumulati. In caso di errore li rimette nel buffer."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                self._last_flush = time.monotonic()
+            if not batch:
+                return
+            try:
+                from services.data_manager import db
+                if db is None:
+                    raise ConnectionError("Connessione a MongoDB non disponibile.")
+                db[self.collection_name].insert_many(batch)
+                with self._lock:
+                    self._retry_not_before = 0.0
+            except Exception as e:
+                print(f"Avviso: impossibile salvare la telemetria LLM ({len(batch)} record): {e}")
+                with self._lock:
+                    self._buffer = (batch + self._buffer)[-TELEMETRY_MAX_BUFFERED_RECORDS:]
+                    # Backoff: con Mongo irraggiungibile non si tenta un flush a ogni chiamata LLM
+                    self._retry_not_before = time.monotonic() + TELEMETRY_FLUSH_INTERVAL_SECONDS
+
+    def _pending_records(self, session_id: str) -> list[dict]:
+        with self._lock:
+            return [r for r in self._buffer if r["session_id"] == session_id]
+
+    def summarize_session(self, session_id: str) -> dict:
+        """
+        Riepiloga le chiamate LLM di una sessione raggruppate per call site:
+        numero di chiamate, latenza totale/media e token, ordinati per latenza totale.
+        """
+        records = []
+        try:
+            from services.data_manager import db
+            if db is not None:
+                records = list(db[self.collection_name].find({"session_id": session_id}, {"_id": 0}))
+        except Exception as e:
+            print(f"Avviso: impossibile leggere la telemetria LLM da MongoDB: {e}")
+        records.extend(self._pending_records(session_id))
+
+        by_call_site = {}
+        for r in records:
+            stats = by_call_site.setdefault(r["call_site"], {
+                "calls": 0, "errors": 0, "cache_hits": 0, "coalesced": 0, "total_latency_s": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "models": set()
+            })
+            stats["calls"] += 1
+            stats["errors"] += r["status"] != "ok"
+            stats["cache_hits"] += bool(r.get("cached"))
+            stats["coalesced"] += bool(r.get("coalesced"))
+            stats["total_latency_s"] += r["latency_s"]
+            stats["prompt_tokens"] += r.get("prompt_tokens") or 0
+            stats["completion_tokens"] += r.get("completion_tokens") or 0
+            stats["models"].add(r["model"])
+
+        for stats in by_call_site.values():
+            stats["avg_latency_s"] = round(stats["total_latency_s"] / stats["calls"], 4)
+            stats["total_latency_s"] = round(stats["total_latency_s"], 4)
+            stats["models"] = sorted(stats["models"])
+
+        ordered = dict(sorted(by_call_site.items(), key=lambda item: item[1]["total_latency_s"], reverse=True))
+        return {
+            "session_id": session_id,
+            "calls": sum(s["calls"] for s in ordered.values()),
+            "total_latency_s": round(sum(s["total_latency_s"] for s in ordered.values()), 4),
+            "prompt_tokens": sum(s["prompt_tokens"] for s in ordered.values()),
+            "completion_tokens": sum(s["completion_tokens"] for s in ordered.values()),
+            "by_call_site": ordered,
+        }
+
+
+telemetry = LLMTelemetry()
+atexit.register(telemetry.flush)
@@ -100,5 +100,78 @@ def create_answer_to_candidate_question_prompt(case_text: str, current_step_desc
         "Formula la tua risposta."
     )
 
+def create_single_pass_turn_prompt(
+    case_title: str,
+    case_text: str,
+    current_step_info: dict,
+    skills_to_test: str,
+    history_text: str,
+    options_text: str,
+    user_input: str,
+    questions_left: int,
+    is_last_attempt: bool,
+    transition_precomputed: bool = False
+) -> str:
+    """
+    Crea il prompt per gestire un intero turno del colloquio in una sola chiamata:
+    classificazione dell'input, verifica del criterio, scelta del prossimo step e risposta.
+    Con transition_precomputed il testo di transizione (criterio soddisfatto) è già pronto
+    e il modello non deve scriverlo.
+    """
+    if is_last_attempt:
+        attempt_rule = (
+            "Questo era l'ultimo tentativo del candidato per lo step attuale: se il criterio NON è soddisfatto, lo step si chiude comunque. "
+            "In quel caso la risposta deve riassumere brevemente e in modo costruttivo cosa mancava (basandoti sul criterio e sulle skill da testare, senza essere accondiscendente) "
+            "e subito dopo introdurre con una domanda il prossimo argomento scelto."
+        )
+    else:
+        attempt_rule = (
+            "Se il criterio NON è soddisfatto, lo step resta aperto: la risposta deve guidare il candidato con una domanda mirata verso gli elementi mancanti, "
+            "senza lasciar trapelare la soluzione, i criteri o i nomi delle skill."
+        )
+    options_text = options_text or "Nessuno: lo step attuale è l'ultimo, se si chiude il colloquio termina."
+    if transition_precomputed:
+        success_rule = "Se il criterio è soddisfatto, lascia reply vuoto: la transizione al prossimo argomento è già pronta."
+    else:
+        success_rule = "Se il criterio è soddisfatto, crea una transizione fluida al prossimo argomento ponendo una domanda ispirata alla sua descrizione, senza copiarla e senza eccedere nei complimenti."
+    return (
+        "Gestisci il turno corrente del colloquio. Devi prendere TUTTE le decisioni seguenti e scrivere la risposta da inviare al candidato.\n\n"
+        f"--- Case ---\nTitolo: {case_title}\n{case_text}\n\n"
+        f"--- Step Attuale ---\nTitolo: {current_step_info.get('title', 'N/D')}\n"
+        f"Descrizione: {current_step_info.get('description', 'N/D')}\n"
+        f"Criterio da soddisfare (Accomplishment Criteria): '{current_step_info.get('criteria', 'Nessun criterio specifico fornito.')}'\n"
+        f"Skill da testare (obiettivo nascosto): {skills_to_test}\n\n"
+        f"--- Argomenti Disponibili per il Prossimo Step ---\n{options_text}\n\n"
+        f"--- Conversazione Finora ---\n{history_text}\n\n"
+        f"--- Ultimo Messaggio del Candidato ---\n\"{user_input}\"\n\n"
+        "DECISIONI:\n"
+        "1. input_type: 'DOMANDA_SUL_CASO' se il messaggio chiede informazioni, dati o chiarimenti sul case; altrimenti 'ALTRO' "
+        "(risposta, commento o domanda non pertinente). Non farti ingannare da verbi come 'chiederei' usati in modo discorsivo.\n"
+        f"   Se è 'DOMANDA_SUL_CASO' (domande ancora disponibili: {questions_left}), la risposta fornisce un chiarimento plausibile e realistico "
+        "(puoi inventare dati specifici), senza dare la soluzione dello step, e riporta il candidato sulla traccia principale. "
+        "In questo caso step_accomplished è false e next_step_id è null.\n"
+        "2. step_accomplished: solo per 'ALTRO', true se il criterio dello step attuale è soddisfatto dalla conversazione recente. Non essere eccessivamente severo.\n"
+        "3. next_step_id: se lo step si chiude, l'ID dell'argomento più naturale da affrontare ora tra quelli disponibili "
+        "(considera se il candidato ha già accennato a uno di questi temi); altrimenti null.\n"
+        f"4. reply: il messaggio per il candidato. {success_rule} {attempt_rule}\n\n"
+        "Sii realistico, educato e diretto. Se la risposta del candidato è completamente fuori tema, faglielo notare in modo educato."
+    )
+
+def create_step_summary_prompt(step_title: str, transcript_text: str) -> str:
+    """Crea il prompt per riassumere la parte di conversazione relativa a uno step concluso."""
+    return (
+        f"Riassumi in massimo 5 frasi la parte di colloquio relativa allo step '{step_title}'.\n"
+        "Riporta i punti chiave argomentati dal candidato, le informazioni o i dati forniti dall'intervistatore "
+        "e gli eventuali aspetti rimasti scoperti. Non aggiungere valutazioni o informazioni non presenti.\n\n"
+        f"--- Conversazione dello Step ---\n{transcript_text}"
+    )
+
+QUESTIONS_EXHAUSTED_MESSAGE = "Hai esaurito le domande a tua disposizione. Per favore, procedi ora con la tua analisi."
+
 SUCCESSFUL_FINISH_MESSAGE = "Ottimo, direi che abbiamo toccato tutti i punti chiave. La tua analisi è stata molto completa. Grazie mille per il tuo tempo, il colloquio è terminato. Adesso procederemo a valutare il tuo esercizio, per poi ritornare da te con un responso."
-FORCED_FINISH_MESSAGE = "Ok, direi che per questo punto possiamo fermarci qui. Grazie comunque per le tue riflessioni. Il colloquio è concluso."
\ No newline at end of file
+FORCED_FINISH_MESSAGE = "Ok, direi che per questo punto possiamo fermarci qui. Grazie comunque per le tue riflessioni. Il colloquio è concluso."
+# Mostrati al candidato al posto del testo di errore quando la chiamata LLM fallisce.
+# Il primo quando il turno viene annullato (la risposta del candidato non resta in cronologia),
+# il secondo quando lo step era già stato chiuso: il colloquio prosegue dal nuovo step.
+LLM_FAILURE_MESSAGE = "Scusa, si è verificato un problema tecnico momentaneo. Puoi ripetere la tua ultima risposta?"
+LLM_FAILURE_STEP_INTRO_MESSAGE = "Scusa, si è verificato un problema tecnico momentaneo. Proseguiamo con il prossimo punto del caso: **{step_title}**.\n\n{step_description}"
@@ -0,0 +1,221 @@
+# interviewer/question_classifier.py
+# Scopo: Classificatore locale (embedding + regressione logistica) che decide se un messaggio del
+#        candidato è una domanda sul caso, evitando la chiamata LLM per ogni turno.
+#        L'LLM resta il riferimento: fornisce le etichette di training e risolve i casi ambigui.
+#
+# Addestramento e report di accuratezza:  python -m interviewer.question_classifier
+
+import os
+import json
+import glob
+import time
+import threading
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+from .llm_service import get_llm_responses_batch
+from . import prompts
+
+# --- CONFIGURAZIONE ---
+QUESTION_CLASSIFIER_PATH = os.getenv("QUESTION_CLASSIFIER_PATH", os.path.join("data", "models", "question_classifier.joblib"))
+# Modello multilingua leggero: i messaggi dei candidati sono in italiano
+CLASSIFIER_EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+# Sotto/sopra queste probabilità il verdetto locale è considerato affidabile; in mezzo decide l'LLM
+QUESTION_THRESHOLD = 0.85
+ANSWER_THRESHOLD = 0.15
+CONVERSATIONS_DIR = "output"
+LLM_LABEL_MODEL = "gpt-4o-mini"
+CLASSIFIER_SYSTEM_PROMPT = "Sei un classificatore di testo estremamente preciso e letterale. Il tuo unico scopo è restituire una delle due opzioni fornite."
+MIN_TRAINING_EXAMPLES = 20
+
+
+def build_llm_classification_request(user_input: str, model: str = LLM_LABEL_MODEL) -> dict:
+    """Richiesta LLM di riferimento per la classificazione (condivisa da chatbot e training, stessa cache)."""
+    return {
+        "prompt": prompts.create_input_classification_prompt(user_input),
+        "model": model,
+        "system_prompt": CLASSIFIER_SYSTEM_PROMPT,
+        "temperature": 0.0,
+        "max_tokens": 10,
+        "use_cache": True,
+        "call_site": "chatbot.classify_input",
+    }
+
+
+def parse_llm_classification(response: str) -> bool:
+    return "DOMANDA_SUL_CASO" in response.upper()
+
+
+class LocalQuestionClassifier:
+    """Carica pigramente il modello addestrato; se non esiste, classify() restituisce sempre None."""
+    def __init__(self, path: str = QUESTION_CLASSIFIER_PATH):
+        self.path = path
+        self._bundle = None
+        self._embedder = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> bool:
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                if not os.path.exists(self.path):
+                    print(f"[INFO] Classificatore locale delle domande non trovato in '{self.path}': uso solo l'LLM.")
+                    return False
+                try:
+                    # Import differito: torch/sentence-transformers servono solo se il modello esiste
+                    from services.model_registry import get_sentence_transformer
+                    bundle = joblib.load(self.path)
+                    self._embedder = get_sentence_transformer(bundle["embedding_model"])
+                    self._bundle = bundle
+                    print(f"✅ Classificatore locale delle domande caricato (accuratezza vs LLM: {bundle['report'].get('accuracy')}).")
+                except Exception as e:
+                    print(f"[ERRORE] Impossibile caricare il classificatore locale: {e}")
+            return self._bundle is not None
+
+    def warm_up(self):
+        """Carica modello ed embedder in un thread, per non pesare sul primo turno del colloquio."""
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def predict_proba(self, text: str) -> float | None:
+        """Probabilità che il testo sia una domanda sul caso, o None se il modello non è disponibile."""
+        if not self._load():
+            return None
+        embedding = self._embedder.encode([text], normalize_embeddings=True)
+        return float(self._bundle["classifier"].predict_proba(embedding)[0][1])
+
+    def classify(self, text: str) -> bool | None:
+        """True/False se il verdetto locale è affidabile, None nei casi ambigui (decide l'LLM)."""
+        started_at = time.perf_counter()
+        probability = self.predict_proba(text)
+        if probability is None:
+            return None
+        thresholds = self._bundle["thresholds"]
+        verdict = None
+        if probability >= thresholds["question"]:
+            verdict = True
+        elif probability <= thresholds["answer"]:
+            verdict = False
+        outcome = "ambiguo, decide l'LLM" if verdict is None else ("domanda" if verdict else "altro")
+        print(f"[INFO] Classificazione locale: p={probability:.2f} ({outcome}) in {(time.perf_counter() - started_at) * 1000:.0f}ms")
+        return verdict
+
+
+question_classifier = LocalQuestionClassifier()
+
+
+# --- DATI DI TRAINING ---
+
+def collect_candidate_messages(conversations_dir: str = CONVERSATIONS_DIR, include_sessions: bool = True) -> list[str]:
+    """Raccoglie i messaggi dei candidati dalle conversazioni salvate in output/ e nelle sessioni su MongoDB."""
+    conversations = []
+    for path in glob.glob(os.path.join(conversations_dir, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                conversations.append(data)
+        except (OSError, ValueError) as e:
+            print(f"Avviso: conversazione '{path}' non leggibile: {e}")
+
+    if include_sessions:
+        try:
+            from services.data_manager import sessions_collection
+            if sessions_collection is not None:
+                for session in sessions_collection.find({"stages.conversation": {"$exists": True}}, {"stages.conversation": 1}):
+                    conversations.append(session["stages"]["conversation"])
+        except Exception as e:
+            print(f"Avviso: impossibile leggere le conversazioni delle sessioni: {e}")
+
+    messages = []
+    seen = set()
+    for conversation in conversations:
+        for msg in conversation:
+            content = (msg.get("content") or "").strip()
+            if msg.get("role") == "user" and content and content not in seen:
+                seen.add(content)
+                messages.append(content)
+    return messages
+
+
+def label_with_llm(messages: list[str]) -> list[bool | None]:
+    """Etichetta i messaggi con lo stesso classificatore LLM usato dal chatbot (risposte in cache)."""
+    responses = get_llm_responses_batch([build_llm_classification_request(m) for m in messages])
+    return [None if not response else parse_llm_classification(response) for response in responses]
+
+
+# --- ADDESTRAMENTO ---
+
+def _evaluate(probabilities: np.ndarray, labels: np.ndarray, question_threshold: float, answer_threshold: float) -> dict:
+    predictions = probabilities >= 0.5
+    confident = (probabilities >= question_threshold) | (probabilities <= answer_threshold)
+    report = {
+        "examples": int(len(labels)),
+        "accuracy": round(float((predictions == labels).mean()), 4),
+        "coverage": round(float(confident.mean()), 4),
+        "confident_accuracy": None,
+    }
+    if confident.any():
+        report["confident_accuracy"] = round(float((predictions[confident] == labels[confident]).mean()), 4)
+    return report
+
+
+def train_question_classifier(path: str = QUESTION_CLASSIFIER_PATH, test_size: float = 0.25) -> dict | None:
+    """
+    Addestra il classificatore sulle etichette dell'LLM e salva modello e report.
+    Il report misura, su un campione tenuto da parte, l'accordo con l'LLM: accuratezza
+    complessiva, quota di messaggi decisi localmente (coverage) e accuratezza su quella quota.
+    """
+    from services.model_registry import get_sentence_transformer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+
+    print("1. Raccolta dei messaggi dei candidati...")
+    messages = collect_candidate_messages()
+    print(f"2. Etichettatura di {len(messages)} messaggi con l'LLM...")
+    labels = label_with_llm(messages)
+    examples = [(m, l) for m, l in zip(messages, labels) if l is not None]
+    positives = sum(1 for _, l in examples if l)
+    if len(examples) < MIN_TRAINING_EXAMPLES or positives == 0 or positives == len(examples):
+        print(f"ERRORE: dati insufficienti per l'addestramento ({len(examples)} esempi, {positives} domande).")
+        return None
+
+    texts = [m for m, _ in examples]
+    y = np.array([l for _, l in examples])
+    print(f"3. Calcolo degli embedding con '{CLASSIFIER_EMBEDDING_MODEL}'...")
+    embedder = get_sentence_transformer(CLASSIFIER_EMBEDDING_MODEL)
+    X = embedder.encode(texts, normalize_embeddings=True, batch_size=64, show_progress_bar=False)
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, stratify=y, random_state=42)
+    classifier = LogisticRegression(class_weight="balanced", max_iter=1000)
+    classifier.fit(X_train, y_train)
+    report = _evaluate(classifier.predict_proba(X_test)[:, 1], y_test, QUESTION_THRESHOLD, ANSWER_THRESHOLD)
+
+    # Il modello finale usa tutti gli esempi; il report resta quello sul campione di test
+    classifier.fit(X, y)
+    report.update({
+        "trained_at": datetime.now().isoformat(timespec="seconds"),
+        "training_examples": int(len(y)),
+        "questions": int(positives),
+    })
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    joblib.dump({
+        "classifier": classifier,
+        "embedding_model": CLASSIFIER_EMBEDDING_MODEL,
+        "thresholds": {"question": QUESTION_THRESHOLD, "answer": ANSWER_THRESHOLD},
+        "report": report,
+    }, path)
+    with open(os.path.splitext(path)[0] + "_report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print("4. Report (confronto con le etichette LLM sul campione di test):")
+    print(f"   - Accuratezza complessiva: {report['accuracy']:.1%} su {report['examples']} messaggi")
+    print(f"   - Messaggi decisi localmente: {report['coverage']:.1%} (accuratezza {report['confident_accuracy']})")
+    print(f"✅ Classificatore salvato in '{path}'.")
+    return report
+
+
+if __name__ == "__main__":
+    train_question_classifier()
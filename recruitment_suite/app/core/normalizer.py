@@ -11,18 +11,32 @@ import openai
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from dateutil.parser import parse as universal_date_parser
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import util
 from tqdm import tqdm
-from interviewer.llm_service import get_llm_response
+from interviewer.llm_service import get_llm_response, get_llm_responses_batch
 
 from recruitment_suite.config import settings
+from services.model_registry import get_sentence_transformer
+
+def _decode_embedding_chunk(chunk: dict) -> np.ndarray:
+    """
+    Vettori di un chunk della collection degli embedding. I chunk binari (bytes float32 con
+    dtype e shape) vengono letti con np.frombuffer senza copie; i chunk salvati come liste
+    (import precedenti) sono ancora supportati.
+    """
+    data = chunk["embeddings"]
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return np.frombuffer(data, dtype=np.dtype(chunk.get("dtype", "<f4"))).reshape(chunk["shape"])
+    return np.asarray(data, dtype=np.float32)
+
 
 class CVNormalizer:
     def __init__(self):
         print("Inizializzazione del Normalizzatore CV...")
         # Non si valida più la chiave localmente: viene gestita da llm_service
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME, device=self.device)
+        # Stesso modello (e stessa istanza) di RecruitmentPipeline, grazie al registro condiviso
+        self.embedding_model = get_sentence_transformer(settings.EMBEDDING_MODEL_NAME, device=self.device)
         print(f"Normalizzazione CV: Modello '{settings.EMBEDDING_MODEL_NAME}' caricato su {self.device.upper()}.")
 
         self._prepare_esco_data()
@@ -50,16 +64,21 @@ class CVNormalizer:
             # Carica e riassembla gli Embeddings
             collection_name_embeddings = settings.MONGO_COLLECTION_EMBEDDINGS
             embedding_id = 'embeddings'
-            chunks = list(db[collection_name_embeddings].find({"embedding_id": embedding_id}).sort("chunk_index", 1))
-            if not chunks:
+            collection = db[collection_name_embeddings]
+            query = {"embedding_id": embedding_id}
+            # Prima solo i metadati (senza i dati) per conoscere il numero totale di vettori
+            layout = list(collection.find(query, {"end_index": 1}))
+            if not layout:
                 raise ValueError(f"Nessun embedding trovato per id '{embedding_id}'")
-            
-            full_list = []
-            for chunk in chunks:
-                full_list.extend(chunk['embeddings'])
-                
-            # Assegna l'array all'attributo corretto!
-            self.esco_embeddings_matrix = np.array(full_list)
+            num_vectors = max(c["end_index"] for c in layout) + 1
+
+            # Matrice finale preallocata: ogni chunk viene copiato al suo posto, senza liste intermedie
+            self.esco_embeddings_matrix = None
+            for chunk in collection.find(query).sort("chunk_index", 1):
+                chunk_array = _decode_embedding_chunk(chunk)
+                if self.esco_embeddings_matrix is None:
+                    self.esco_embeddings_matrix = np.empty((num_vectors, chunk_array.shape[1]), dtype=np.float32)
+                self.esco_embeddings_matrix[chunk["start_index"]:chunk["end_index"] + 1] = chunk_array
             print(f"Embeddings riassemblati. Shape finale: {self.esco_embeddings_matrix.shape}")
     
         except Exception as e:
@@ -116,7 +135,9 @@ class CVNormalizer:
                 model=settings.LLM_MODEL,
                 system_prompt=settings.LLM_PROMPT_CV_EXTRACTION_NORM,
                 temperature=0.0,
-                max_tokens=2000
+                max_tokens=2000,
+                use_cache=True,
+                call_site="market.cv_extraction"
             )
             structured_data = json.loads(raw)
             if not structured_data.get("experience"):
@@ -136,7 +157,9 @@ class CVNormalizer:
                 model=settings.LLM_MODEL,
                 system_prompt=settings.LLM_PROMPT_CV_EXTRACTION_NORM,
                 temperature=0.0,
-                max_tokens=2000
+                max_tokens=2000,
+                use_cache=True,
+                call_site="market.cv_extraction"
             )
             structured_data = json.loads(raw)
             if not structured_data.get("experience"):
@@ -195,24 +218,30 @@ class CVNormalizer:
 
     def _normalize_experiences(self, valid_experiences: list) -> list:
         print("3. Normalizzazione di ogni esperienza valida...")
+        # Le chiamate di arricchimento sono indipendenti tra loro: le inviamo in parallelo
+        enrichment_requests = [
+            {
+                "prompt": settings.LLM_PROMPT_ENRICHMENT_IT_NORM.format(title=exp['title'], description=exp['description']),
+                "model": settings.LLM_MODEL,
+                "system_prompt": "Sei un esperto di semantica HR.",
+                "temperature": 0.15,
+                "max_tokens": 800,
+                "use_cache": True,
+                "call_site": "market.experience_enrichment"
+            }
+            for exp in valid_experiences
+        ]
+        raw_responses = get_llm_responses_batch(enrichment_requests)
+
+        # Tensore degli embedding ESCO creato una sola volta (su CPU condivide la memoria della matrice float32)
+        embeddings_tensor = torch.from_numpy(self.esco_embeddings_matrix).to(self.device)
         normalized_list = []
-        for exp in valid_experiences:
+        for exp, raw in zip(valid_experiences, raw_responses):
             print(f"  > Normalizzando '{exp['title']}'...")
-            prompt = settings.LLM_PROMPT_ENRICHMENT_IT_NORM.format(
-                title=exp['title'], description=exp['description']
-            )
             try:
-                raw = get_llm_response(
-                    prompt=prompt,
-                    model=settings.LLM_MODEL,
-                    system_prompt="Sei un esperto di semantica HR.",
-                    temperature=0.15,
-                    max_tokens=800
-                )
                 enriched_text = json.loads(raw).get("enriched_text")
                 if enriched_text:
                     query_embedding = self.embedding_model.encode(enriched_text, convert_to_tensor=True, device=self.device)
-                    embeddings_tensor = torch.tensor(self.esco_embeddings_matrix, device=self.device)
                     cos_scores = util.cos_sim(query_embedding.to(dtype=torch.float32), embeddings_tensor.to(dtype=torch.float32))[0]
                     top_results = torch.topk(cos_scores, k=settings.TOP_N_MATCHES_NORM)
                     matches = [
@@ -2,28 +2,29 @@
 # Scopo: Contiene la logica principale per lo screening dei candidati contro un'offerta di lavoro.
 
 import json
-import time
 import math
 import openai
 from pydantic import ValidationError
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import util
 from tqdm import tqdm
-from interviewer.llm_service import get_structured_llm_response
+from interviewer.llm_service import get_structured_llm_responses_batch
 from recruitment_suite.app.models.schemas import EvaluationResponse
 from recruitment_suite.config import settings
+from services.model_registry import get_sentence_transformer
 
 class RecruitmentPipeline:
     def __init__(self):
         print("Inizializzazione della Recruitment Pipeline...")
         self.offer_embedding = None
-        self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
+        # Modello condiviso nel processo: non viene ricaricato a ogni benchmark
+        self.embedding_model = get_sentence_transformer(settings.EMBEDDING_MODEL_NAME)
         
     def _calculate_affinity_score(self, candidate_exp_text: str) -> float:
         if self.offer_embedding is None or not candidate_exp_text: return 0.0
         candidate_embedding = self.embedding_model.encode(candidate_exp_text, convert_to_tensor=True)
         return util.cos_sim(self.offer_embedding, candidate_embedding).item()
 
-    def _get_llm_evaluation_for_batch(self, offer_title: str, offer_desc: str, batch_dossiers: list[dict]) -> list[dict]:
+    def _build_llm_request_for_batch(self, offer_title: str, offer_desc: str, batch_dossiers: list[dict]) -> dict:
         profiles_text = "".join([
             f"\n--- CANDIDATO {c['original_index']+1} ---\nID: {c['id']}\nSCORE: {c['score']:.4f}\n"
             f"POSIZIONE: {c['current_position']}\nDESCRIZIONE: {c['enriched_description']}\n-----------------------\n"
@@ -38,22 +39,25 @@ class RecruitmentPipeline:
             f"Ogni oggetto deve avere i campi 'ID' (intero), 'scartato' (boolean) e 'motivazione' (stringa max 20 parole)."
         )
 
+        return {
+            "prompt": user_prompt,
+            "model": settings.LLM_MODEL,
+            "system_prompt": system_prompt,
+            "tool_name": "save_evaluations",
+            "tool_schema": EvaluationResponse.model_json_schema(),
+            "temperature": 0.2,
+            "max_tokens": 30000,
+            "call_site": "market.screening"
+        }
+
+    def _parse_llm_evaluation_for_batch(self, structured: str | None) -> list[dict]:
         try:
-            structured = get_structured_llm_response(
-                prompt=user_prompt,
-                model=settings.LLM_MODEL,
-                system_prompt=system_prompt,
-                tool_name="save_evaluations",
-                tool_schema=EvaluationResponse.model_json_schema(),
-                temperature=0.2, 
-                max_tokens=30000
-            )
             if not structured:
                 return []
             parsed = json.loads(structured)
             return parsed.get("results", [])
         except Exception as e:
-            print(f"ERRORE durante la chiamata LLM per un batch: {e}. Il batch sarà saltato.")
+            print(f"ERRORE durante il parsing della risposta LLM per un batch: {e}. Il batch sarà saltato.")
             return []
 
     def run_full_pipeline(self, offer_title: str, offer_desc: str, candidates_data: list[dict]):
@@ -84,14 +88,15 @@ class RecruitmentPipeline:
         
         all_llm_results = []
         num_batches = math.ceil(len(dossiers_for_llm) / settings.BATCH_SIZE)
-        for i in range(num_batches):
-            start_index, end_index = i * settings.BATCH_SIZE, (i + 1) * settings.BATCH_SIZE
-            batch = dossiers_for_llm[start_index:end_index]
-            print(f"--> Processando batch {i+1} di {num_batches} (candidati da {start_index + 1} a {min(end_index, len(dossiers_for_llm))})...")
-            batch_results = self._get_llm_evaluation_for_batch(offer_title, offer_desc, batch)
+        batches = [dossiers_for_llm[i * settings.BATCH_SIZE:(i + 1) * settings.BATCH_SIZE] for i in range(num_batches)]
+        # I batch partono in parallelo: il ritmo delle chiamate è governato dallo scheduler di llm_service
+        # (budget RPM/TPM e retry sui 429), non più da una pausa fissa tra un batch e l'altro.
+        print(f"--> Invio di {num_batches} batch in parallelo ({len(dossiers_for_llm)} candidati)...")
+        batch_requests = [self._build_llm_request_for_batch(offer_title, offer_desc, batch) for batch in batches]
+        for i, structured in enumerate(get_structured_llm_responses_batch(batch_requests)):
+            batch_results = self._parse_llm_evaluation_for_batch(structured)
             if batch_results: all_llm_results.extend(batch_results)
             print(f"<-- Batch {i+1} completato. Valutazioni totali finora: {len(all_llm_results)}")
-            if i < num_batches - 1: time.sleep(1)
             
         print(f"\nElaborazione LLM completata. Totale valutazioni ricevute: {len(all_llm_results)} su {len(candidates_for_llm)} inviati.")
         if all_llm_results:
@@ -67,5 +67,6 @@ def generate_qualitative_llm_report(candidate_json: dict, market_json: dict, job
         model=settings.LLM_MODEL,
         system_prompt=system_prompt,
         temperature=0.4,
-        max_tokens=1000
+        max_tokens=1000,
+        call_site="market.qualitative_report"
     )
\ No newline at end of file
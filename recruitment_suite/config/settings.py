@@ -29,6 +29,9 @@ MONGO_COLLECTION_OCCUPATIONS_RAW = "suite_occupations_unfiltered"
 MONGO_COLLECTION_OCCUPATIONS_FILTERED = "suite_occupations_filtered"
 MONGO_COLLECTION_ESCO_HIERARCHY = "suite_esco_hierarchy"
 MONGO_COLLECTION_EMBEDDINGS = "suite_embeddings"
+# Versione del pool di benchmark: va incrementata quando i candidati vengono aggiornati senza
+# cambiarne il numero (il conteggio dei documenti fa già parte della chiave degli snapshot di mercato)
+MARKET_BENCHMARK_VERSION = os.getenv("MARKET_BENCHMARK_VERSION", "1")
 # ==============================================================================
 
 # --- FILE DI INPUT DINAMICI (Questi rimangono percorsi locali) ---
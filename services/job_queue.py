@@ -0,0 +1,230 @@
+# services/job_queue.py
+# Scopo: Coda di job su MongoDB per i lavori lunghi (valutazione e report di feedback).
+#        La webapp accoda e interroga lo stato; i worker (services.job_worker) prelevano i job
+#        in modo atomico, quindi il throughput cresce col numero di worker, non di tab aperti.
+#        Stato e avanzamento per fase sono scritti anche nella sessione (stages.jobs.<tipo>).
+
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .data_manager import db, sessions_collection
+
+# --- CONFIGURAZIONE ---
+JOBS_COLLECTION_NAME = "jobs"
+# Un job "running" il cui worker non rinnova il lease entro questo tempo torna prelevabile
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+jobs_collection = db[JOBS_COLLECTION_NAME] if db is not None else None
+
+# Un solo job attivo (in coda, in esecuzione o completato) per tipo e sessione: i job attivi hanno
+# "dedup_key" = "<tipo>:<sessione>", rimossa quando falliscono (così si può riaccodare)
+if jobs_collection is not None:
+    try:
+        jobs_collection.create_index(
+            "dedup_key", unique=True, name="unique_active_job",
+            partialFilterExpression={"dedup_key": {"$exists": True}}
+        )
+    except Exception as e:
+        print(f"Avviso: impossibile creare l'indice univoco dei job: {e}")
+
+
+def _dedup_key(job_type: str, session_id: str) -> str:
+    return f"{job_type}:{session_id}"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _update_session_job(session_id: str, job_type: str, fields: dict):
+    """Aggiorna lo stato del job nella sessione (stages.jobs.<tipo>.<campo>) con un'unica scrittura."""
+    if sessions_collection is None:
+        return
+    try:
+        update = {f"stages.jobs.{job_type}.{key}": value for key, value in fields.items()}
+        sessions_collection.update_one({"_id": session_id}, {"$set": update})
+    except Exception as e:
+        print(f"Errore durante l'aggiornamento dello stato del job '{job_type}' per la sessione {session_id}: {e}")
+
+
+def enqueue_job(job_type: str, session_id: str, payload: dict | None = None) -> str | None:
+    """
+    Accoda un job e restituisce il suo ID. Idempotente: se per la sessione esiste già un job
+    dello stesso tipo in coda, in esecuzione o completato, restituisce quello (es. dopo un refresh).
+    L'indice univoco su dedup_key garantisce un solo inserimento anche con richieste concorrenti.
+    """
+    if jobs_collection is None:
+        print("ERRORE: coda dei job non disponibile (MongoDB non connesso).")
+        return None
+    try:
+        existing = jobs_collection.find_one(
+            {"type": job_type, "session_id": session_id, "status": {"$in": [JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED]}},
+            {"_id": 1}
+        )
+        if existing:
+            return existing["_id"]
+
+        job_id = str(uuid.uuid4())
+        try:
+            jobs_collection.insert_one({
+                "_id": job_id,
+                "type": job_type,
+                "session_id": session_id,
+                "dedup_key": _dedup_key(job_type, session_id),
+                "payload": payload or {},
+                "status": JOB_QUEUED,
+                "attempts": 0,
+                "created_at": _now(),
+            })
+        except DuplicateKeyError:
+            # Un'altra richiesta (tab o rerun concorrente) ha accodato lo stesso job per prima
+            existing = jobs_collection.find_one({"dedup_key": _dedup_key(job_type, session_id)}, {"_id": 1})
+            if existing:
+                return existing["_id"]
+            raise
+        # Lo stato nella sessione riparte da zero (anche per un nuovo tentativo dopo un errore)
+        if sessions_collection is not None:
+            sessions_collection.update_one({"_id": session_id}, {"$set": {f"stages.jobs.{job_type}": {
+                "job_id": job_id, "status": JOB_QUEUED, "current_stage": None, "stages": {}, "error": None, "result": None
+            }}})
+        print(f"📥 Job '{job_type}' accodato per la sessione {session_id} (ID: {job_id}).")
+        return job_id
+    except Exception as e:
+        print(f"Errore durante l'accodamento del job '{job_type}' per la sessione {session_id}: {e}")
+        return None
+
+
+def _fail_abandoned_jobs(now: datetime):
+    """I job con lease scaduto e tentativi esauriti (worker morto più volte) vengono marcati come falliti."""
+    abandoned = jobs_collection.find(
+        {"status": JOB_RUNNING, "lease_expires_at": {"$lt": now}, "attempts": {"$gte": JOB_MAX_ATTEMPTS}}
+    )
+    for job in abandoned:
+        print(f"Avviso: job {job['_id']} abbandonato dopo {job['attempts']} tentativi.")
+        finish_job(job, {}, error="Il job è stato interrotto più volte senza completarsi.")
+
+
+def claim_next_job(worker_id: str, job_types: list[str] | None = None, job_id: str | None = None) -> dict | None:
+    """
+    Preleva in modo atomico il job più vecchio in coda (o con lease scaduto) e lo assegna al worker.
+    Con job_id preleva solo quel job, se è ancora disponibile.
+    """
+    if jobs_collection is None:
+        return None
+    now = _now()
+    try:
+        _fail_abandoned_jobs(now)
+    except Exception as e:
+        print(f"Avviso: impossibile controllare i job abbandonati: {e}")
+    query = {
+        "$or": [
+            {"status": JOB_QUEUED},
+            {"status": JOB_RUNNING, "lease_expires_at": {"$lt": now}},
+        ],
+        "attempts": {"$lt": JOB_MAX_ATTEMPTS},
+    }
+    if job_types:
+        query["type"] = {"$in": job_types}
+    if job_id:
+        query["_id"] = job_id
+    try:
+        job = jobs_collection.find_one_and_update(
+            query,
+            {
+                "$set": {"status": JOB_RUNNING, "worker_id": worker_id, "started_at": now,
+                         "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception as e:
+        print(f"Errore durante il prelievo di un job dalla coda: {e}")
+        return None
+    if job:
+        _update_session_job(job["session_id"], job["type"], {"status": JOB_RUNNING, "worker_id": worker_id})
+    return job
+
+
+def renew_job_lease(job_id: str, worker_id: str):
+    """Heartbeat del worker: estende il lease del job che sta eseguendo."""
+    if jobs_collection is None:
+        return
+    try:
+        jobs_collection.update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": JOB_RUNNING},
+            {"$set": {"lease_expires_at": _now() + timedelta(seconds=JOB_LEASE_SECONDS)}}
+        )
+    except Exception as e:
+        print(f"Avviso: impossibile rinnovare il lease del job {job_id}: {e}")
+
+
+def report_job_stage(job: dict, stage: str, stage_timings: dict):
+    """
+    Registra l'inizio di una fase del job: chiude la fase precedente con la sua durata
+    e scrive l'avanzamento nella sessione. stage_timings è lo stato locale del worker.
+    """
+    now = _now()
+    fields = {"current_stage": stage, f"stages.{stage}": {"status": JOB_RUNNING, "started_at": now}}
+    previous = stage_timings.get("current")
+    if previous:
+        fields[f"stages.{previous}"] = {
+            "status": JOB_COMPLETED,
+            "started_at": stage_timings["started_at"],
+            "duration_s": round((now - stage_timings["started_at"]).total_seconds(), 2),
+        }
+    stage_timings.update({"current": stage, "started_at": now})
+    _update_session_job(job["session_id"], job["type"], fields)
+
+
+def finish_job(job: dict, stage_timings: dict, result: dict | None = None, error: str | None = None):
+    """Chiude il job (completato o fallito) sia nella coda sia nella sessione."""
+    now = _now()
+    status = JOB_FAILED if error else JOB_COMPLETED
+    fields = {"status": status, "current_stage": None, "error": error, "result": result, "finished_at": now}
+    previous = stage_timings.get("current")
+    if previous:
+        fields[f"stages.{previous}"] = {
+            "status": status,
+            "started_at": stage_timings["started_at"],
+            "duration_s": round((now - stage_timings["started_at"]).total_seconds(), 2),
+        }
+    _update_session_job(job["session_id"], job["type"], fields)
+    if jobs_collection is None:
+        return
+    try:
+        unset = {"lease_expires_at": ""}
+        if error:
+            # Un job fallito non blocca più un nuovo accodamento per la stessa sessione
+            unset["dedup_key"] = ""
+        jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": status, "finished_at": now, "result": result, "error": error},
+             "$unset": unset}
+        )
+    except Exception as e:
+        print(f"Errore durante la chiusura del job {job['_id']}: {e}")
+
+
+def get_job_status(session_id: str, job_type: str) -> dict | None:
+    """Stato del job come scritto nella sessione: status, current_stage, stages, error, result."""
+    if sessions_collection is None:
+        return None
+    try:
+        session = sessions_collection.find_one({"_id": session_id}, {f"stages.jobs.{job_type}": 1})
+    except Exception as e:
+        print(f"Errore nel recupero dello stato del job '{job_type}' per la sessione {session_id}: {e}")
+        return None
+    if not session:
+        return None
+    return session.get("stages", {}).get("jobs", {}).get(job_type)
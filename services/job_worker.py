@@ -0,0 +1,190 @@
+# services/job_worker.py
+# Scopo: Pool locale di processi worker che eseguono i job della coda (services.job_queue).
+#        La webapp avvia il pool all'avvio (JOB_WORKERS_IN_APP=1), oppure lo si lancia a parte:
+#
+#        python -m services.job_worker --workers 4
+
+import os
+import time
+import uuid
+import argparse
+import threading
+import multiprocessing
+
+from .model_registry import get_model_memory_report
+
+# --- CONFIGURAZIONE ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+
+FEEDBACK_JOB = "feedback"
+CV_ANALYSIS_JOB = "cv_analysis"
+MARKET_BENCHMARK_JOB = "market_benchmark"
+# Attesa massima, nel job di feedback, di un job preliminare in esecuzione su un altro worker
+BACKGROUND_JOB_JOIN_TIMEOUT_SECONDS = int(os.getenv("BACKGROUND_JOB_JOIN_TIMEOUT_SECONDS", "300"))
+# Fasi del job di feedback, nell'ordine, con l'etichetta mostrata al candidato
+FEEDBACK_JOB_STAGES = {
+    "valutazione": "Valutazione della performance",
+    "analisi_cv": "Analisi del CV",
+    "consolidamento": "Consolidamento dei report",
+    "gap": "Identificazione dei gap",
+    "corsi": "Ricerca dei corsi",
+    "benchmark": "Benchmark di mercato",
+    "contenuto": "Scrittura del report",
+    "pdf": "Generazione del PDF",
+}
+
+
+class JobError(Exception):
+    """Errore atteso durante l'esecuzione di un job (il messaggio finisce nello stato del job)."""
+
+
+def _run_cv_analysis_job(job: dict, report_stage) -> dict:
+    from analyzer.run_analyzer import run_cv_analysis_pipeline
+
+    report_stage("analisi_cv")
+    if not run_cv_analysis_pipeline(job["session_id"]):
+        raise JobError("Errore durante l'analisi del CV.")
+    return {}
+
+
+def _run_market_benchmark_job(job: dict, report_stage) -> dict:
+    from feedback_generator.market_integration import run_market_benchmark_for_session
+
+    report_stage("benchmark")
+    qualitative_text, _, _ = run_market_benchmark_for_session(job["session_id"])
+    return {"has_benchmark": bool(qualitative_text)}
+
+
+def _join_background_job(session_id: str, job_type: str, worker_id: str, is_ready) -> bool:
+    """
+    Attende un job preliminare della sessione (accodato durante la preparazione).
+    Se è ancora in coda lo esegue questo worker (evita di restare bloccati con un solo worker).
+    Restituisce True se il risultato è disponibile negli stages (is_ready), False altrimenti.
+    """
+    from . import job_queue
+    from services.data_manager import get_session_data
+
+    deadline = time.monotonic() + BACKGROUND_JOB_JOIN_TIMEOUT_SECONDS
+    while True:
+        session_data = get_session_data(session_id) or {}
+        if is_ready(session_data.get("stages", {})):
+            return True
+        status = job_queue.get_job_status(session_id, job_type)
+        if not status or status.get("status") in (job_queue.JOB_COMPLETED, job_queue.JOB_FAILED):
+            return False
+        if time.monotonic() >= deadline:
+            print(f"Avviso: job '{job_type}' della sessione {session_id} non concluso entro {BACKGROUND_JOB_JOIN_TIMEOUT_SECONDS}s.")
+            return False
+        if status.get("status") == job_queue.JOB_QUEUED:
+            background_job = job_queue.claim_next_job(worker_id, job_id=status.get("job_id"))
+            if background_job:
+                run_job(background_job, worker_id)
+                continue
+        time.sleep(JOB_POLL_INTERVAL_SECONDS)
+
+
+def _run_feedback_job(job: dict, report_stage) -> dict:
+    # Import differiti: i moduli della pipeline servono solo nei processi worker
+    from corrector.run_final_evaluation import execute_case_evaluation
+    from feedback_generator.run_feedback_generator import run_feedback_pipeline
+    from analyzer.run_analyzer import run_cv_analysis_pipeline
+    from services.data_manager import get_session_data
+
+    session_id = job["session_id"]
+    report_stage("valutazione")
+    if not execute_case_evaluation(session_id=session_id):
+        raise JobError("Errore durante la valutazione della performance.")
+    # Il report di feedback ha bisogno dell'analisi del CV: è il punto di join
+    report_stage("analisi_cv")
+    if not _join_background_job(session_id, CV_ANALYSIS_JOB, job["worker_id"], lambda stages: stages.get("cv_analysis_report")):
+        print(f"[INFO] Analisi del CV non disponibile per la sessione {session_id}: la eseguo nel job di feedback.")
+        if not run_cv_analysis_pipeline(session_id):
+            raise JobError("Errore durante l'analisi del CV.")
+    # Se il benchmark precalcolato manca o è fallito, la pipeline lo ricalcola al suo passo
+    _join_background_job(session_id, MARKET_BENCHMARK_JOB, job["worker_id"], lambda stages: stages.get("market_benchmark_status") == "Completed")
+    pdf_path = run_feedback_pipeline(session_id=session_id, progress_callback=report_stage)
+    if not pdf_path:
+        raise JobError("Errore durante la creazione del report PDF.")
+    # Hit rate della cache semantica dei corsi, salvato accanto ai tempi delle fasi del job
+    stages = (get_session_data(session_id) or {}).get("stages", {})
+    return {"pdf_path": pdf_path, "course_cache": stages.get("course_cache_stats")}
+
+
+JOB_HANDLERS = {
+    FEEDBACK_JOB: _run_feedback_job,
+    CV_ANALYSIS_JOB: _run_cv_analysis_job,
+    MARKET_BENCHMARK_JOB: _run_market_benchmark_job,
+}
+
+
+def run_job(job: dict, worker_id: str):
+    """Esegue un job, rinnovando il lease in background e registrando fasi e tempi nella sessione."""
+    from . import job_queue
+
+    stage_timings = {}
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        while not stop_heartbeat.wait(job_queue.JOB_LEASE_SECONDS / 3):
+            job_queue.renew_job_lease(job["_id"], worker_id)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    started_at = time.perf_counter()
+    print(f"[INFO] Worker {worker_id}: avvio job '{job['type']}' per la sessione {job['session_id']}.")
+    try:
+        handler = JOB_HANDLERS.get(job["type"])
+        if handler is None:
+            raise JobError(f"Tipo di job sconosciuto: '{job['type']}'.")
+        result = handler(job, lambda stage: job_queue.report_job_stage(job, stage, stage_timings))
+        job_queue.finish_job(job, stage_timings, result=result)
+        print(f"✅ Worker {worker_id}: job {job['_id']} completato in {time.perf_counter() - started_at:.1f}s.")
+        models_report = get_model_memory_report()
+        if models_report["models"]:
+            loaded = ", ".join(f"{m['model']} ({m['weights_mb']} MB)" for m in models_report["models"])
+            print(f"[INFO] Modelli condivisi nel worker {worker_id}: {loaded}; RSS processo: {models_report['process_rss_mb']} MB.")
+    except Exception as e:
+        print(f"[ERRORE] Worker {worker_id}: job {job['_id']} fallito: {e}")
+        job_queue.finish_job(job, stage_timings, error=str(e))
+    finally:
+        stop_heartbeat.set()
+
+
+def worker_loop(worker_id: str | None = None, poll_interval: float = JOB_POLL_INTERVAL_SECONDS):
+    """Ciclo di un processo worker: preleva un job alla volta dalla coda e lo esegue."""
+    from . import job_queue
+
+    worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    if job_queue.jobs_collection is None:
+        print(f"[ERRORE] Worker {worker_id}: MongoDB non disponibile, il worker si arresta.")
+        return
+    print(f"[INFO] Worker {worker_id} in ascolto sulla coda dei job.")
+    while True:
+        job = job_queue.claim_next_job(worker_id, list(JOB_HANDLERS))
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(job, worker_id)
+
+
+def start_worker_pool(num_workers: int = JOB_WORKERS) -> list:
+    """
+    Avvia num_workers processi worker. Si usa 'spawn': ogni processo apre la propria
+    connessione a MongoDB (il client pymongo non è sicuro dopo un fork).
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(num_workers):
+        process = context.Process(target=worker_loop, name=f"job-worker-{index}", daemon=True)
+        process.start()
+        processes.append(process)
+    print(f"✅ Avviati {num_workers} worker per la coda dei job.")
+    return processes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pool di worker per la coda dei job.")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="Numero di processi worker.")
+    args = parser.parse_args()
+    for process in start_worker_pool(args.workers):
+        process.join()
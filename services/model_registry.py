@@ -0,0 +1,79 @@
+# services/model_registry.py
+# Scopo: Registro dei modelli SentenceTransformer condiviso nel processo. Ogni modello viene
+#        caricato una sola volta (in modo pigro e thread-safe) e riusato da tutti i servizi
+#        (RecruitmentPipeline, CVNormalizer, RAGService, classificatore delle domande).
+
+import os
+import time
+import threading
+
+_models = {}
+_model_stats = {}
+_registry_lock = threading.Lock()
+# Un lock per modello: il caricamento di un modello non blocca chi usa gli altri
+_model_locks = {}
+
+
+def _process_rss_bytes() -> int | None:
+    """Memoria residente del processo (solo Linux, dove esiste /proc); None altrove."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _resolve_device(device: str | None) -> str:
+    if device:
+        return device
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def get_sentence_transformer(model_name: str, device: str | None = None):
+    """Restituisce il modello condiviso, caricandolo al primo utilizzo."""
+    key = (model_name, _resolve_device(device))
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        model_lock = _model_locks.setdefault(key, threading.Lock())
+    with model_lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        # Import differito: torch e sentence-transformers servono solo a chi usa un modello
+        from sentence_transformers import SentenceTransformer
+
+        rss_before = _process_rss_bytes()
+        started_at = time.perf_counter()
+        model = SentenceTransformer(model_name, device=key[1])
+        load_seconds = time.perf_counter() - started_at
+        rss_after = _process_rss_bytes()
+
+        weights_bytes = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+        stats = {
+            "model": model_name,
+            "device": key[1],
+            "load_seconds": round(load_seconds, 2),
+            "weights_mb": round(weights_bytes / 1024 ** 2, 1),
+            "rss_delta_mb": round((rss_after - rss_before) / 1024 ** 2, 1) if rss_before is not None and rss_after is not None else None,
+        }
+        _models[key] = model
+        _model_stats[key] = stats
+        rss_text = f", RSS +{stats['rss_delta_mb']} MB" if stats["rss_delta_mb"] is not None else ""
+        print(f"✅ Modello '{model_name}' caricato su {key[1]} in {stats['load_seconds']}s (pesi: {stats['weights_mb']} MB{rss_text}).")
+        return model
+
+
+def get_model_memory_report() -> dict:
+    """Modelli caricati nel processo, con tempi di caricamento e memoria occupata."""
+    models = [dict(stats) for stats in _model_stats.values()]
+    rss_bytes = _process_rss_bytes()
+    return {
+        "models": models,
+        "total_weights_mb": round(sum(m["weights_mb"] for m in models), 1),
+        "process_rss_mb": round(rss_bytes / 1024 ** 2, 1) if rss_bytes is not None else None,
+    }
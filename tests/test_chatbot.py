@@ -0,0 +1,111 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("joblib")
+
+from interviewer import chatbot as chatbot_module
+from interviewer import conversation_context, prompts
+from interviewer.llm_scheduler import LLMFailure
+
+STEPS = {
+    0: {"id": 0, "title": "Analisi", "description": "Analizza il problema.", "criteria": "c0"},
+    1: {"id": 1, "title": "Soluzione", "description": "Proponi una soluzione.", "criteria": "c1"},
+    2: {"id": 2, "title": "Metriche", "description": "Definisci le metriche.", "criteria": "c2"},
+}
+
+
+class FakeLLM:
+    """Risposte per call_site; un valore LLMFailure simula una chiamata fallita."""
+    def __init__(self, replies):
+        self.replies = replies
+
+    def __call__(self, prompt, model, system_prompt, call_site=None, **kwargs):
+        return self.replies.get(call_site, "")
+
+    def stream(self, prompt, model, system_prompt, call_site=None, **kwargs):
+        reply = self.replies.get(call_site, "")
+        if isinstance(reply, LLMFailure):
+            yield "Inizio "
+            yield reply
+            return
+        yield reply
+
+
+@pytest.fixture
+def make_bot(monkeypatch):
+    monkeypatch.setattr(chatbot_module.question_classifier, "warm_up", lambda: None)
+    monkeypatch.setattr(chatbot_module.question_classifier, "classify", lambda text: False)
+    monkeypatch.setattr(conversation_context, "get_llm_response", lambda **kwargs: "riassunto")
+    monkeypatch.setattr(chatbot_module.SmartCaseStudyChatbot, "_save_conversation_history", lambda self: None)
+
+    def factory(replies, steps=STEPS, **kwargs):
+        llm = FakeLLM(replies)
+        monkeypatch.setattr(chatbot_module, "get_llm_response", llm)
+        monkeypatch.setattr(chatbot_module, "stream_llm_response", llm.stream)
+        bot = chatbot_module.SmartCaseStudyChatbot(steps, "Caso", "Testo del caso", "case-test", **kwargs)
+        bot.SINGLE_PASS_TURN = False
+        bot.SPECULATIVE_TURN = False
+        bot.precomputed_messages = {"opening": ["Benvenuto"]}
+        bot.start_interview()
+        return bot
+    return factory
+
+
+def test_failed_guidance_restores_the_turn(make_bot):
+    bot = make_bot({"chatbot.evaluate_step": "False", "chatbot.guidance": LLMFailure("Errore: timeout")}, step_order_policy="sequential")
+    bot.MAX_ATTEMPTS = 2
+    history_before = list(bot.conversation_history)
+
+    reply = bot.process_user_response("La mia analisi")
+
+    assert reply == prompts.LLM_FAILURE_MESSAGE
+    assert bot.conversation_history == history_before
+    assert bot.current_step_id == 0
+    assert bot.attempts_on_current_step == 0
+
+
+def test_failed_transition_keeps_the_new_step(make_bot):
+    bot = make_bot({"chatbot.evaluate_step": "True", "chatbot.transition": LLMFailure("Errore: timeout")}, step_order_policy="sequential")
+
+    reply = bot.process_user_response("La mia analisi")
+
+    assert bot.current_step_id == 1
+    assert "Errore" not in reply and "Soluzione" in reply
+    assert [m["role"] for m in bot.conversation_history] == ["assistant", "user", "assistant"]
+    assert bot.conversation_history[-1]["content"] == reply
+
+
+def test_failed_stream_restores_the_turn(make_bot):
+    bot = make_bot({"chatbot.evaluate_step": "False", "chatbot.guidance": LLMFailure("Errore: timeout")}, step_order_policy="sequential")
+    bot.MAX_ATTEMPTS = 2
+    history_before = list(bot.conversation_history)
+
+    chunks = list(bot.process_user_response_stream("La mia analisi"))
+
+    assert chunks == ["Inizio ", "\n\n" + prompts.LLM_FAILURE_MESSAGE]
+    assert bot.conversation_history == history_before
+
+
+def test_sequential_policy_follows_step_ids(make_bot):
+    bot = make_bot({"chatbot.evaluate_step": "True", "chatbot.transition": "Passiamo oltre"}, step_order_policy="sequential")
+    bot.process_user_response("Risposta")
+    assert bot.current_step_id == 1
+
+
+def test_graph_policy_respects_dependencies(make_bot):
+    steps = {
+        0: STEPS[0],
+        1: {**STEPS[1], "depends_on": [2]},
+        2: {**STEPS[2], "depends_on": [0]},
+    }
+    bot = make_bot({"chatbot.evaluate_step": "True", "chatbot.transition": "Passiamo oltre"}, steps=steps, step_order_policy="graph")
+    assert bot.step_order_policy == "graph"
+    bot.process_user_response("Risposta")
+    assert bot.current_step_id == 2
+
+
+def test_graph_policy_without_dependencies_uses_llm(make_bot):
+    bot = make_bot({"chatbot.evaluate_step": "True", "chatbot.select_next_step": "2", "chatbot.transition": "Passiamo oltre"}, step_order_policy="graph")
+    assert bot.step_order_policy == "llm"
+    bot.process_user_response("Risposta")
+    assert bot.current_step_id == 2
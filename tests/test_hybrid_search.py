@@ -0,0 +1,53 @@
+import pytest
+
+from feedback_generator.course_retriever.lexical_index import BM25Index, tokenize
+
+DOCUMENTS = {
+    10: "Python per l'analisi dei dati con pandas",
+    11: "Project management agile con Scrum",
+    12: "Machine learning con Python e scikit-learn",
+    13: "Comunicazione efficace e public speaking",
+}
+
+
+def test_tokenize_drops_stopwords_and_single_characters():
+    assert tokenize("L'analisi dei dati e il Machine Learning") == ["analisi", "dati", "machine", "learning"]
+
+
+def test_bm25_ranks_documents_by_term_overlap():
+    index = BM25Index(DOCUMENTS)
+    assert index.search("machine learning python", k=3) == [12, 10]
+    assert index.search("scrum", k=3) == [11]
+    assert index.search("cucina", k=3) == []
+
+
+def test_bm25_respects_k_and_allowed_ids():
+    index = BM25Index(DOCUMENTS)
+    assert index.search("python", k=1) in ([10], [12])
+    assert index.search("python", k=5, allowed_ids={10, 11}) == [10]
+
+
+@pytest.fixture
+def rag_service():
+    pytest.importorskip("streamlit")
+    pytest.importorskip("pymongo")
+    from feedback_generator.course_retriever import rag_service
+    return rag_service
+
+
+def test_reciprocal_rank_fusion_rewards_agreement(rag_service):
+    # I documenti presenti in entrambe le classifiche precedono quelli presenti in una sola
+    assert rag_service._reciprocal_rank_fusion([[1, 2, 3], [3, 2, 4]], k=3) == [3, 2, 1]
+    assert rag_service._reciprocal_rank_fusion([[1, 2], []], k=5) == [1, 2]
+
+
+def test_catalogue_filters(rag_service):
+    level, hours = rag_service.COURSE_LEVEL_FIELD, rag_service.COURSE_HOURS_FIELD
+    filters = {"levels": ["Beginner"], "max_hours": 10}
+    assert rag_service._matches_filters({level: "beginner", hours: "8 ore"}, filters)
+    assert not rag_service._matches_filters({level: "Advanced", hours: 8}, filters)
+    assert not rag_service._matches_filters({level: "Beginner", hours: "12,5"}, filters)
+    # I campi mancanti non escludono il corso
+    assert rag_service._matches_filters({}, filters)
+    assert rag_service._parse_hours("10-12 hours") == 10.0
+    assert rag_service._parse_hours("n/d") is None
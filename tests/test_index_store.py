@@ -0,0 +1,145 @@
+import hashlib
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from feedback_generator.course_retriever.index_store import (
+    CURRENT_POINTER_FILE,
+    INDEX_FILE,
+    PersistentCourseIndex,
+    course_text,
+)
+
+DIM = 16
+
+
+class FakeModel:
+    """Embedding deterministico: lo stesso testo produce sempre lo stesso vettore."""
+    def encode(self, texts, convert_to_tensor=False):
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+            vectors.append(np.random.default_rng(seed).standard_normal(DIM).astype(np.float32))
+        return np.array(vectors)
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+def make_courses(n, start=0):
+    return [{"_id": f"course-{i}", "Course Name": f"Corso {i}", "Description": f"Descrizione del corso {i}"}
+            for i in range(start, start + n)]
+
+
+def assert_each_course_finds_itself(store, course_map, courses):
+    model = FakeModel()
+    for course in courses:
+        query = model.encode([course_text(course)])
+        _, ids = store.index.search(query, 1)
+        assert course_map[int(ids[0][0])]["_id"] == course["_id"]
+
+
+def current_version(index_dir):
+    with open(os.path.join(index_dir, CURRENT_POINTER_FILE), encoding="utf-8") as f:
+        return f.read().strip()
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_sync_add_change_remove(tmp_path, index_type):
+    index_dir = str(tmp_path)
+    courses = make_courses(60)
+    store = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type=index_type)
+    course_map = store.sync(courses)
+    assert store.index_type == index_type
+    assert_each_course_finds_itself(store, course_map, courses)
+
+    # Due corsi rimossi, uno modificato, due aggiunti
+    updated = [c for c in courses if c["_id"] not in ("course-3", "course-5")]
+    updated[10] = {**updated[10], "Description": "Descrizione riscritta"}
+    updated += make_courses(2, start=100)
+
+    store = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type=index_type)
+    course_map = store.sync(updated)
+    assert store.index.ntotal == len(updated)
+    assert {c["_id"] for c in course_map.values()} == {c["_id"] for c in updated}
+    assert_each_course_finds_itself(store, course_map, updated)
+
+    # Il catalogo aggiornato si ricarica da disco identico
+    reloaded = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type=index_type)
+    assert reloaded.sync(updated) == course_map
+    assert_each_course_finds_itself(reloaded, course_map, updated)
+
+
+def test_ivf_removal_keeps_ids_aligned(tmp_path):
+    index_dir = str(tmp_path)
+    courses = make_courses(60)
+    PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="ivf").sync(courses)
+
+    remaining = [c for c in courses if c["_id"] not in ("course-3", "course-5")]
+    store = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="ivf")
+    course_map = store.sync(remaining)
+    assert_each_course_finds_itself(store, course_map, remaining)
+
+
+def test_small_ivf_catalogue_is_loaded_without_rebuild(tmp_path):
+    index_dir = str(tmp_path)
+    courses = make_courses(10)
+    store = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="ivf")
+    store.sync(courses)
+    assert store.index_type == "flat"
+    version = current_version(index_dir)
+
+    store = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="ivf")
+    store.sync(courses)
+    assert current_version(index_dir) == version
+
+
+def test_unchanged_catalogue_is_not_saved_again(tmp_path):
+    index_dir = str(tmp_path)
+    courses = make_courses(20)
+    PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="flat").sync(courses)
+    version = current_version(index_dir)
+
+    store = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="flat")
+    course_map = store.sync(courses)
+    assert current_version(index_dir) == version
+    assert sorted(os.listdir(index_dir)) == sorted([CURRENT_POINTER_FILE, version])
+    assert_each_course_finds_itself(store, course_map, courses)
+
+
+def test_save_publishes_a_new_version_and_removes_the_old_one(tmp_path):
+    index_dir = str(tmp_path)
+    courses = make_courses(20)
+    PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="flat").sync(courses)
+    first_version = current_version(index_dir)
+
+    PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="flat").sync(courses + make_courses(1, start=50))
+    second_version = current_version(index_dir)
+    assert second_version != first_version
+    assert sorted(os.listdir(index_dir)) == sorted([CURRENT_POINTER_FILE, second_version])
+
+
+def test_index_inconsistent_with_manifest_is_rebuilt(tmp_path):
+    index_dir = str(tmp_path)
+    courses = make_courses(20)
+    store = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="flat")
+    store.sync(courses)
+    # Indice di una versione scritto a metà: meno vettori dei corsi nel manifest
+    store.index.remove_ids(np.array([0, 1], dtype=np.int64))
+    faiss.write_index(store.index, os.path.join(index_dir, current_version(index_dir), INDEX_FILE))
+
+    reloaded = PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir, index_type="flat")
+    assert reloaded._load() is None
+    course_map = reloaded.sync(courses)
+    assert reloaded.index.ntotal == len(courses)
+    assert_each_course_finds_itself(reloaded, course_map, courses)
+
+
+def test_other_embedding_model_forces_a_rebuild(tmp_path):
+    index_dir = str(tmp_path)
+    courses = make_courses(20)
+    PersistentCourseIndex(FakeModel(), "fake-model", index_dir=index_dir).sync(courses)
+    store = PersistentCourseIndex(FakeModel(), "other-model", index_dir=index_dir)
+    assert store._load() is None
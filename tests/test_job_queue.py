@@ -0,0 +1,88 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("pymongo")
+
+from pymongo.errors import DuplicateKeyError
+
+from services import job_queue
+
+
+def _matches(document: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        value = document.get(field)
+        if isinstance(condition, dict) and "$in" in condition:
+            if value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeJobsCollection:
+    """Collection in memoria con l'indice univoco parziale su dedup_key."""
+    def __init__(self):
+        self.documents = {}
+        # Numero di find_one iniziali che "non vedono" i job esistenti (richiesta concorrente)
+        self.stale_reads = 0
+
+    def find_one(self, query, projection=None):
+        if self.stale_reads and "status" in query:
+            self.stale_reads -= 1
+            return None
+        return next((dict(d) for d in self.documents.values() if _matches(d, query)), None)
+
+    def insert_one(self, document):
+        key = document.get("dedup_key")
+        if key is not None and any(d.get("dedup_key") == key for d in self.documents.values()):
+            raise DuplicateKeyError(f"E11000 duplicate key: {key}")
+        self.documents[document["_id"]] = dict(document)
+
+    def update_one(self, query, update):
+        for document in self.documents.values():
+            if _matches(document, query):
+                document.update(update.get("$set", {}))
+                for field in update.get("$unset", {}):
+                    document.pop(field, None)
+                return
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    collection = FakeJobsCollection()
+    monkeypatch.setattr(job_queue, "jobs_collection", collection)
+    monkeypatch.setattr(job_queue, "sessions_collection", None)
+    return collection
+
+
+def test_enqueue_is_idempotent(jobs):
+    first = job_queue.enqueue_job("evaluation", "s1")
+    assert job_queue.enqueue_job("evaluation", "s1") == first
+    assert job_queue.enqueue_job("feedback", "s1") != first
+    assert len(jobs.documents) == 2
+    assert jobs.documents[first]["dedup_key"] == "evaluation:s1"
+
+
+def test_concurrent_enqueue_returns_the_winning_job(jobs):
+    first = job_queue.enqueue_job("evaluation", "s1")
+    # La seconda richiesta non vede il job appena inserito: l'indice univoco la respinge
+    jobs.stale_reads = 1
+    assert job_queue.enqueue_job("evaluation", "s1") == first
+    assert len(jobs.documents) == 1
+
+
+def test_failed_job_can_be_enqueued_again(jobs):
+    first = job_queue.enqueue_job("evaluation", "s1")
+    job_queue.finish_job(jobs.documents[first], {}, error="errore")
+    assert "dedup_key" not in jobs.documents[first]
+
+    second = job_queue.enqueue_job("evaluation", "s1")
+    assert second != first
+    assert jobs.documents[second]["status"] == job_queue.JOB_QUEUED
+
+
+def test_completed_job_is_not_enqueued_again(jobs):
+    first = job_queue.enqueue_job("evaluation", "s1")
+    job_queue.finish_job(jobs.documents[first], {}, result={"ok": True})
+    assert jobs.documents[first]["dedup_key"] == "evaluation:s1"
+    assert job_queue.enqueue_job("evaluation", "s1") == first
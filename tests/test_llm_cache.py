@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pytest
+
+from interviewer.llm_cache import LLMResponseCache, make_request_key
+from interviewer.llm_scheduler import LLMFailure
+
+
+def test_request_key_is_stable_and_content_addressed():
+    key = make_request_key("gpt-4o-mini", "sistema", "prompt", temperature=0.2, tool_name="a", top_p=1)
+    assert key == make_request_key("gpt-4o-mini", "sistema", "prompt", temperature=0.2, top_p=1, tool_name="a")
+    assert key != make_request_key("gpt-4o-mini", "sistema", "prompt diverso", temperature=0.2, tool_name="a", top_p=1)
+    assert key != make_request_key("gpt-4.1-2025-04-14", "sistema", "prompt", temperature=0.2, tool_name="a", top_p=1)
+    assert key != make_request_key("gpt-4o-mini", "sistema", "prompt", temperature=0.7, tool_name="a", top_p=1)
+    assert key != make_request_key("gpt-4o-mini", "sistema", "prompt", temperature=0.2, tool_name="b", top_p=1)
+
+
+def test_cache_roundtrip_and_ttl(tmp_path, monkeypatch):
+    cache = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    assert cache.get("k") is None
+    cache.set("k", "risposta")
+    assert cache.get("k") == "risposta"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # Oltre il TTL la voce scade
+    import interviewer.llm_cache as llm_cache
+    real_time = llm_cache.time.time
+    monkeypatch.setattr(llm_cache.time, "time", lambda: real_time() + 120)
+    assert cache.get("k") is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+
+
+class _ScriptedBackend:
+    """Backend offline che restituisce (o solleva) gli esiti indicati, in ordine."""
+    requires_client = False
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def create(self, api_kwargs, live_fn, call_site=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=outcome))], usage=None)
+
+
+class _DirectScheduler:
+    def call(self, model, estimated_tokens, request_fn):
+        return request_fn()
+
+
+@pytest.fixture
+def llm_service(tmp_path, monkeypatch):
+    pytest.importorskip("streamlit")
+    from interviewer import llm_service
+    monkeypatch.setattr(llm_service, "response_cache", LLMResponseCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(llm_service, "scheduler", _DirectScheduler())
+    monkeypatch.setattr(llm_service.telemetry, "record", lambda **kwargs: None)
+    return llm_service
+
+
+def test_failures_are_not_cached(llm_service, monkeypatch):
+    backend = _ScriptedBackend([RuntimeError("provider non disponibile"), "risposta"])
+    monkeypatch.setattr(llm_service, "backend", backend)
+    request = dict(prompt="p", model="gpt-4o-mini", system_prompt="s", use_cache=True)
+
+    failure = llm_service.get_llm_response(**request)
+    assert llm_service.is_llm_failure(failure)
+    assert llm_service.get_llm_response(**request) == "risposta"
+    # La risposta valida ora è in cache: nessuna nuova chiamata al backend
+    assert llm_service.get_llm_response(**request) == "risposta"
+    assert backend.calls == 2
+
+
+def test_failed_extraction_is_not_cached(llm_service, monkeypatch):
+    backend = _ScriptedBackend(["ok", "ok"])
+    monkeypatch.setattr(llm_service, "backend", backend)
+    monkeypatch.setattr(llm_service, "_extract_text", lambda response: LLMFailure("risposta vuota", reason="empty"))
+    request = dict(prompt="p", model="gpt-4o-mini", system_prompt="s", use_cache=True)
+
+    assert llm_service.is_llm_failure(llm_service.get_llm_response(**request))
+    assert llm_service.is_llm_failure(llm_service.get_llm_response(**request))
+    assert backend.calls == 2
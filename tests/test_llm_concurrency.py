@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from interviewer import llm_service
+
+
+def run_in_loops(coroutine_fn, n_loops):
+    threads = [threading.Thread(target=lambda: asyncio.run(coroutine_fn())) for _ in range(n_loops)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_slots_are_shared_across_event_loops():
+    slots = llm_service._AsyncSlots(2)
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    async def worker():
+        nonlocal active, peak
+        await slots.acquire()
+        try:
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            with lock:
+                active -= 1
+        finally:
+            slots.release()
+
+    async def many():
+        await asyncio.gather(*(worker() for _ in range(5)))
+
+    run_in_loops(many, 3)
+    assert peak == 2
+    assert slots._available == 2 and not slots._waiters
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    slots = llm_service._AsyncSlots(1)
+
+    async def scenario():
+        await slots.acquire()
+        waiting = asyncio.ensure_future(slots.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        slots.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        # Lo slot deve essere di nuovo disponibile
+        await asyncio.wait_for(slots.acquire(), timeout=1)
+        slots.release()
+
+    asyncio.run(scenario())
+    assert slots._available == 1 and not slots._waiters
+
+
+def test_waiter_cancelled_after_hand_over_returns_the_slot():
+    slots = llm_service._AsyncSlots(1)
+
+    async def scenario():
+        await slots.acquire()
+        waiting = asyncio.ensure_future(slots.acquire())
+        await asyncio.sleep(0)
+        slots.release()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await asyncio.wait_for(slots.acquire(), timeout=1)
+        slots.release()
+
+    asyncio.run(scenario())
+    assert slots._available == 1 and not slots._waiters
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from interviewer import llm_scheduler
+from interviewer.llm_scheduler import RateLimitScheduler, failure_from_exception, is_llm_failure
+
+
+class RateLimited(openai.RateLimitError):
+    """RateLimitError costruito senza risposta HTTP reale."""
+    def __init__(self, code=None, retry_after=None):
+        Exception.__init__(self, "rate limited")
+        self.status_code = 429
+        self.code = code
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)} if retry_after is not None else {})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff registrati al posto di essere attesi."""
+    recorded = []
+    real_backoff = llm_scheduler.backoff_delay
+
+    def backoff(attempt, e=None):
+        recorded.append(real_backoff(attempt, e))
+        return 0.0
+
+    monkeypatch.setattr(llm_scheduler, "backoff_delay", backoff)
+    return recorded
+
+
+def test_backoff_honours_retry_after():
+    assert llm_scheduler.backoff_delay(0, RateLimited(retry_after=7)) >= 7
+    assert llm_scheduler.backoff_delay(0) <= llm_scheduler.BACKOFF_BASE_SECONDS
+
+
+def test_request_budget_makes_calls_wait():
+    scheduler = RateLimitScheduler({"m": {"rpm": 2, "tpm": 1_000_000}})
+    assert scheduler._try_reserve("m", 10) == 0
+    assert scheduler._try_reserve("m", 10) == 0
+    assert scheduler._try_reserve("m", 10) > 0
+
+
+def test_token_budget_makes_calls_wait_and_usage_corrects_it():
+    scheduler = RateLimitScheduler({"m": {"rpm": 100, "tpm": 1000}})
+    assert scheduler._try_reserve("m", 600) == 0
+    assert scheduler._try_reserve("m", 600) > 0
+    # La richiesta ha consumato meno token di quelli stimati: il budget viene restituito
+    scheduler.record_usage("m", 600, 100)
+    assert scheduler._try_reserve("m", 600) == 0
+
+
+def test_rate_limited_call_is_retried_and_pauses_the_model(sleeps):
+    scheduler = RateLimitScheduler({"m": {"rpm": 100, "tpm": 1_000_000}})
+    outcomes = [RateLimited(retry_after=2), "risposta"]
+
+    def request():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert scheduler.call("m", 10, request) == "risposta"
+    assert len(sleeps) == 1 and sleeps[0] >= 2
+    assert "m" in scheduler._paused_until
+
+
+def test_insufficient_quota_is_not_retried(sleeps):
+    scheduler = RateLimitScheduler({"m": {"rpm": 100, "tpm": 1_000_000}})
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise RateLimited(code="insufficient_quota")
+
+    with pytest.raises(openai.RateLimitError) as raised:
+        scheduler.call("m", 10, request)
+    assert len(calls) == 1 and not sleeps
+    failure = failure_from_exception(raised.value)
+    assert is_llm_failure(failure) and not failure
+    assert failure.reason == "insufficient_quota" and failure.status_code == 429 and not failure.retryable
+
+
+def test_retries_stop_after_the_limit(sleeps, monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "LLM_MAX_RETRIES", 2)
+    scheduler = RateLimitScheduler({"m": {"rpm": 100, "tpm": 1_000_000}})
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise RateLimited()
+
+    with pytest.raises(openai.RateLimitError):
+        scheduler.call("m", 10, request)
+    assert len(calls) == 3 and len(sleeps) == 2
+
+
+def test_unknown_errors_are_not_retried(sleeps):
+    scheduler = RateLimitScheduler({"m": {"rpm": 100, "tpm": 1_000_000}})
+
+    def request():
+        raise ValueError("risposta non valida")
+
+    with pytest.raises(ValueError):
+        scheduler.call("m", 10, request)
+    assert not sleeps
+    failure = failure_from_exception(ValueError("x"))
+    assert failure == "Errore: x" and failure.reason == "error" and not failure.retryable
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from interviewer.llm_singleflight import SingleFlight
+
+
+def run_concurrently(fn, n):
+    results = [None] * n
+    errors = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight(enabled=True)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return "risposta"
+
+    results, errors = run_concurrently(lambda: flight.do("chiave", fetch), 4)
+    assert len(calls) == 1
+    assert [r[0] for r in results] == ["risposta"] * 4
+    assert sorted(r[1] for r in results) == [False, True, True, True]
+    assert errors == [None] * 4
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_exception_is_shared_with_waiters():
+    flight = SingleFlight(enabled=True)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        raise ValueError("errore del provider")
+
+    _, errors = run_concurrently(lambda: flight.do("chiave", fetch), 3)
+    assert len(calls) == 1
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_async_waiters_share_the_result():
+    flight = SingleFlight(enabled=True)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "risposta"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.ado("chiave", fetch) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [r[0] for r in results] == ["risposta"] * 3
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    flight = SingleFlight(enabled=True)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "risposta"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.ado("chiave", fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.ado("chiave", fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.wait_for(waiter, timeout=1)
+
+    result, coalesced = asyncio.run(scenario())
+    assert result == "risposta" and not coalesced
+    assert len(calls) == 2
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_async_waiter_wakes_when_leader_runs_in_another_thread():
+    flight = SingleFlight(enabled=True)
+    leader_started = threading.Event()
+
+    def slow_fetch():
+        leader_started.set()
+        time.sleep(0.1)
+        return "risposta"
+
+    leader = threading.Thread(target=lambda: flight.do("chiave", slow_fetch))
+    leader.start()
+    leader_started.wait()
+
+    async def unused():
+        raise AssertionError("la richiesta non deve essere ripetuta")
+
+    result = asyncio.run(asyncio.wait_for(flight.ado("chiave", unused), timeout=1))
+    leader.join()
+    assert result == ("risposta", True)
@@ -0,0 +1,63 @@
+import numpy as np
+
+from feedback_generator.course_retriever.semantic_cache import CourseSemanticCache, gap_family_text, make_cache_scope
+
+
+class FixedModel:
+    """Embedding assegnati a mano, per controllare la similarità tra famiglie di gap."""
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    def encode(self, texts, convert_to_tensor=False):
+        return np.array([self.vectors[text] for text in texts], dtype=np.float32)
+
+
+MODEL = FixedModel({
+    "dati": [1.0, 0.0, 0.0],
+    "dati e statistica": [0.99, 0.1, 0.0],
+    "comunicazione": [0.0, 1.0, 0.0],
+    "leadership": [0.0, 0.0, 1.0],
+})
+
+
+def make_cache(tmp_path, **kwargs):
+    return CourseSemanticCache(MODEL, path=str(tmp_path / "cache.sqlite3"), threshold=0.95, **kwargs)
+
+
+def test_similar_family_hits_and_different_family_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store_many("scope", ["dati"], cache.embed(["dati"]), ["query dati"], [["c1", "c2"]])
+
+    hit, miss = cache.lookup_many("scope", cache.embed(["dati e statistica", "comunicazione"]))
+    assert hit["query"] == "query dati" and hit["course_keys"] == ["c1", "c2"]
+    assert miss is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_entries_of_another_scope_are_ignored_and_dropped(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store_many("vecchio", ["dati"], cache.embed(["dati"]), ["query dati"], [["c1"]])
+    assert cache.lookup_many("nuovo", cache.embed(["dati"])) == [None]
+
+    cache.store_many("nuovo", ["comunicazione"], cache.embed(["comunicazione"]), ["query"], [["c9"]])
+    assert cache.lookup_many("vecchio", cache.embed(["dati"])) == [None]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    for text in ("dati", "comunicazione"):
+        cache.store_many("scope", [text], cache.embed([text]), [f"query {text}"], [[text]])
+    cache.lookup_many("scope", cache.embed(["dati"]))
+    cache.store_many("scope", ["leadership"], cache.embed(["leadership"]), ["query leadership"], [["leadership"]])
+
+    dati, comunicazione, leadership = cache.lookup_many("scope", cache.embed(["dati", "comunicazione", "leadership"]))
+    assert dati is not None and leadership is not None
+    assert comunicazione is None
+
+
+def test_scope_depends_on_catalogue_and_search_parameters():
+    scope = make_cache_scope("impronta", k=5, levels=["Beginner"])
+    assert scope == make_cache_scope("impronta", levels=["Beginner"], k=5)
+    assert scope != make_cache_scope("altra impronta", k=5, levels=["Beginner"])
+    assert scope != make_cache_scope("impronta", k=8, levels=["Beginner"])
+    assert gap_family_text("Dati", ["SQL", "Python"]) == "Dati: SQL; Python"
@@ -5,6 +5,8 @@ import json
 import random
 import uuid
 import fitz
+import time
+import itertools
 from io import BytesIO
 
 # --- INIZIO BLOCCO STYLING (INVARIATO) ---
@@ -67,9 +69,11 @@ if project_root not in sys.path:
 
 from interviewer.chatbot import SmartCaseStudyChatbot
 from analyzer.run_analyzer import run_cv_analysis_pipeline
-from corrector.run_final_evaluation import execute_case_evaluation
+from corrector.step_evaluator.evaluator import IncrementalStepEvaluator
 # RIGA MODIFICATA
 from services.data_manager import db, create_new_session, save_stage_output, get_session_data, get_available_positions_from_db, get_single_position_data_from_db
+from services.job_queue import enqueue_job, get_job_status, JOB_COMPLETED, JOB_FAILED
+from services.job_worker import start_worker_pool, JOB_WORKERS, JOB_POLL_INTERVAL_SECONDS, FEEDBACK_JOB, FEEDBACK_JOB_STAGES, CV_ANALYSIS_JOB, MARKET_BENCHMARK_JOB
 
 # --- INIZIO MODIFICA FONDAMENTALE ---
 # Questa funzione è stata riscritta per assemblare correttamente i dati prima di creare il chatbot.
@@ -131,7 +135,8 @@ def initialize_chatbot_for_position(position_id: str):
         steps=steps_dict, 
         case_title=selected_case['question_title'], 
         case_text=selected_case['question_text'], 
-        case_id=selected_case_id
+        case_id=selected_case_id,
+        precomputed_messages=position_data.get("precomputed_case_messages", {}).get(selected_case_id)
     )
 
     seniority = position_data.get("seniority_level", "Mid-Level")
@@ -140,6 +145,25 @@ def initialize_chatbot_for_position(position_id: str):
     return chatbot_instance, selected_case_id, seniority
 # --- FINE MODIFICA FONDAMENTALE ---
 
+def write_stream_with_spinner(chunks, spinner_text: str) -> str:
+    """
+    Mostra lo spinner finché non arriva il primo frammento di testo, poi scrive la
+    risposta in streaming con st.write_stream. Restituisce il testo completo.
+    """
+    with st.spinner(spinner_text):
+        first_chunk = next(chunks, "")
+    return st.write_stream(itertools.chain([first_chunk], chunks))
+
+@st.cache_resource
+def ensure_job_workers():
+    """
+    Avvia una sola volta per processo il pool di worker della coda dei job.
+    Con JOB_WORKERS_IN_APP=0 i worker girano a parte (python -m services.job_worker).
+    """
+    if os.getenv("JOB_WORKERS_IN_APP", "1") == "0":
+        return []
+    return start_worker_pool(JOB_WORKERS)
+
 # --- Nuova pagina introduttiva (INSERITA) ---
 def render_intro_page():
     st.title("Vertigo AI – Demo di Valutazione")
@@ -180,6 +204,7 @@ st.set_page_config(
 )
 load_and_inject_css()
 add_review_badge()
+ensure_job_workers()
 
 if "page" not in st.session_state:
     st.session_state.clear()
@@ -238,18 +263,29 @@ elif st.session_state.page == "preparazione":
                 with fitz.open(stream=cv_file.read(), filetype="pdf") as doc: cv_text = "".join(page.get_text() for page in doc)
             else: cv_text = cv_file.read().decode("utf-8")
             save_stage_output(session_id, "uploaded_cv_text", cv_text)
-        with st.spinner("Analisi del tuo profilo in corso..."):
-            analysis_success = run_cv_analysis_pipeline(session_id)
-        if analysis_success:
-            with st.spinner("Configurazione del colloquio..."):
-                chatbot_instance, selected_case_id, seniority = initialize_chatbot_for_position(st.session_state.selected_position)
-            if chatbot_instance:
-                st.session_state.chatbot = chatbot_instance
-                save_stage_output(st.session_state.session_id, "case_id", selected_case_id)
-                save_stage_output(st.session_state.session_id, "seniority_level", seniority)
-                st.session_state.preparation_done = True
-            else: st.error("Impossibile inizializzare il colloquio.")
-        else: st.error("Qualcosa è andato storto nell'analisi del CV.")
+        # L'analisi del CV non serve al colloquio: gira in background su un worker della coda
+        # e viene attesa solo dal job di feedback, prima della creazione del report
+        if not enqueue_job(CV_ANALYSIS_JOB, session_id):
+            with st.spinner("Analisi del tuo profilo in corso..."):
+                run_cv_analysis_pipeline(session_id)
+        # Anche il benchmark di mercato dipende solo da JD e CV: lo si calcola mentre il candidato svolge il colloquio
+        enqueue_job(MARKET_BENCHMARK_JOB, session_id)
+        with st.spinner("Configurazione del colloquio..."):
+            chatbot_instance, selected_case_id, seniority = initialize_chatbot_for_position(st.session_state.selected_position)
+        if chatbot_instance:
+            chatbot_instance.session_id = st.session_state.session_id
+            # Ogni step concluso viene valutato in background durante il colloquio
+            chatbot_instance.step_evaluator = IncrementalStepEvaluator(
+                st.session_state.session_id, position_data.get("evaluation_criteria") if position_data else None, seniority
+            )
+            st.session_state.chatbot = chatbot_instance
+            save_stage_output(st.session_state.session_id, "case_id", selected_case_id)
+            save_stage_output(st.session_state.session_id, "seniority_level", seniority)
+            # La prima domanda viene mostrata nella pagina del colloquio: precalcolata se disponibile,
+            # altrimenti generata in streaming
+            st.session_state.messages = []
+            st.session_state.preparation_done = True
+        else: st.error("Impossibile inizializzare il colloquio.")
         st.rerun()
 
     if st.session_state.get("preparation_done"):
@@ -271,15 +307,16 @@ elif st.session_state.page == "interview":
     st.markdown(f"Metti alla prova le tue competenze con il nostro agente intervistatore. Ricorda, hai a disposizione **{questions_remaining} domande** da poter fare. Ti invitiamo a valutare il comportamento e, qualora tu volessi accelerare il processo, usare ChatGPT o Gemini per rispondere alle domande!")
     st.divider()
 
-    if not st.session_state.messages:
-        with st.spinner("Vertigo sta formulando la prima domanda..."):
-            initial_message = chatbot.start_interview()
-        st.session_state.messages = [{"role": "assistant", "content": initial_message}]
-
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
+    if not st.session_state.messages:
+        # La prima domanda viene mostrata in streaming, token per token
+        with st.chat_message("assistant"):
+            initial_message = write_stream_with_spinner(chatbot.start_interview_stream(), "Vertigo sta formulando la prima domanda...")
+        st.session_state.messages = [{"role": "assistant", "content": initial_message}]
+
     if not chatbot.is_finished:
         if prompt := st.chat_input("Scrivi la tua risposta qui..."):
             st.session_state.messages.append({"role": "user", "content": prompt})
@@ -287,9 +324,7 @@ elif st.session_state.page == "interview":
                 st.markdown(prompt)
 
             with st.chat_message("assistant"):
-                with st.spinner("Vertigo sta elaborando la tua risposta..."):
-                    response = chatbot.process_user_response(prompt)
-                    st.markdown(response)
+                response = write_stream_with_spinner(chatbot.process_user_response_stream(prompt), "Vertigo sta elaborando la tua risposta...")
 
             st.session_state.messages.append({"role": "assistant", "content": response})
             st.rerun()
@@ -299,6 +334,9 @@ elif st.session_state.page == "interview":
         st.info("La tua conversazione è stata salvata. Ora puoi procedere con la valutazione finale.")
         if st.button("Procedi alla Valutazione e al Feedback", use_container_width=True, type="primary"):
             with st.spinner("Salvataggio conversazione..."):
+                if chatbot.step_evaluator is not None:
+                    # Di norma solo l'ultimo step è ancora in valutazione
+                    chatbot.step_evaluator.wait(timeout=120)
                 save_stage_output(st.session_state.session_id, "conversation", chatbot.conversation_history)
             st.session_state.page = "feedback_processing"
             st.rerun()
@@ -307,32 +345,37 @@ elif st.session_state.page == "feedback_processing":
     st.header("Analisi della Performance e Generazione Report")
     st.markdown("I nostri agenti AI stanno analizzando la tua performance nel colloquio per preparare il tuo report di feedback personalizzato (essendo un processo complesso, ci possono volere fino a 5 minuti).")
 
-    # Aggiungiamo un flag più specifico per la pipeline
-    if "feedback_pipeline_complete" not in st.session_state: 
-        with st.spinner("Fase 1/2: Valutazione della performance..."):
-            eval_success = execute_case_evaluation(session_id=st.session_state.session_id)
-
-        if eval_success:
-            st.success("Valutazione della performance completata.")
-            with st.spinner("Fase 2/2: Creazione del report di feedback personalizzato..."):
-                from feedback_generator.run_feedback_generator import run_feedback_pipeline
-                pdf_path = run_feedback_pipeline(session_id=st.session_state.session_id)
-
-            if pdf_path:
-                st.session_state.feedback_pdf_path = pdf_path
-                st.session_state.feedback_pipeline_complete = True # <-- IMPOSTA IL FLAG QUI
-                st.session_state.page = "feedback_display"
-                st.rerun() 
-            else:
-                st.error("Errore durante la creazione del report PDF.")
-                st.session_state.feedback_pipeline_complete = True # Imposta il flag anche in caso di errore per non riprovare
+    # Valutazione e report girano nei worker della coda: la pagina accoda (in modo idempotente) e interroga lo stato
+    if "feedback_pipeline_complete" not in st.session_state:
+        job_id = enqueue_job(FEEDBACK_JOB, st.session_state.session_id)
+        job_status = get_job_status(st.session_state.session_id, FEEDBACK_JOB) if job_id else None
+
+        if not job_status:
+            st.error("Impossibile avviare la generazione del report. Riprova più tardi.")
+        elif job_status.get("status") == JOB_COMPLETED:
+            st.session_state.feedback_pdf_path = (job_status.get("result") or {}).get("pdf_path")
+            st.session_state.feedback_pipeline_complete = True
+            st.session_state.page = "feedback_display"
+            st.rerun()
+        elif job_status.get("status") == JOB_FAILED:
+            st.error(job_status.get("error") or "Errore durante la generazione del report.")
+            st.session_state.feedback_pipeline_complete = True # Imposta il flag anche in caso di errore per non riprovare
         else:
-            st.error("Errore durante la valutazione della performance.")
-            st.session_state.feedback_pipeline_complete = True # Imposta il flag anche in caso di errore
-            if st.button("Torna alla configurazione"):
-                st.session_state.clear()
-                st.session_state.page = "configurazione"
-                st.rerun()
+            stage_names = list(FEEDBACK_JOB_STAGES)
+            current_stage = job_status.get("current_stage")
+            if current_stage in FEEDBACK_JOB_STAGES:
+                position = stage_names.index(current_stage)
+                st.progress(position / len(stage_names), text=f"Fase {position + 1}/{len(stage_names)}: {FEEDBACK_JOB_STAGES[current_stage]}...")
+            else:
+                st.progress(0.0, text="In attesa di un agente disponibile...")
+            time.sleep(JOB_POLL_INTERVAL_SECONDS)
+            st.rerun()
+
+    if st.session_state.get("feedback_pipeline_complete") and st.session_state.page == "feedback_processing":
+        if st.button("Torna alla configurazione"):
+            st.session_state.clear()
+            st.session_state.page = "configurazione"
+            st.rerun()
 
 elif st.session_state.page == "feedback_display":
     st.header("Il Tuo Report di Feedback Personalizzato")